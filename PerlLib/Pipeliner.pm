@@ -4,6 +4,11 @@ use strict;
 use warnings;
 use Carp;
 use Cwd;
+use IO::Handle;
+use POSIX ();
+use Time::HiRes ();
+use JSON::PP;
+use Digest::SHA ();
 
 ################################
 ## Verbose levels:
@@ -11,6 +16,88 @@ use Cwd;
 ## 2: see stderr during process
 ################################
 
+#########################################################################
+## Parallel execution:
+##
+##  Pipeliner->new(-CPU => N) allows up to N thread slots worth of commands
+##  to run concurrently.  A command only participates in concurrent
+##  scheduling if it declares its input and/or output files via
+##  Command::add_inputs() / Command::add_outputs(), and it only starts
+##  once the commands producing its inputs have completed.  Commands that
+##  declare nothing act as barriers, retaining the original serial
+##  semantics relative to everything queued before and after them.
+##
+##  Each command occupies Command::get_num_threads() slots (default 1).
+#########################################################################
+
+#########################################################################
+## Resource profiling:
+##
+##  Each command run records its wall time, user/sys cpu time, the peak
+##  RSS of its process tree, and the bytes read/written by its process
+##  tree (rchar/wchar, so includes page cache hits).  Records are appended
+##  to pipeline_profile.tsv and pipeline_profile.jsonl (one json object
+##  per line) in the checkpoint directory.  See summarize_profiles().
+##
+##  Peak RSS and I/O are sampled from /proc while the command runs (so
+##  are NA on systems lacking /proc), with the sampling interval growing
+##  from $PROFILE_MIN_SAMPLE_INTERVAL to $PROFILE_MAX_SAMPLE_INTERVAL sec.
+##  Each sample walks just the running commands' process trees via
+##  /proc/<pid>/task/<tid>/children, falling back to a scan of all of
+##  /proc on kernels lacking it.
+##  CPU times are exact, as accumulated by the kernel for reaped children.
+#########################################################################
+
+#########################################################################
+## Checkpoints:
+##
+##  A completed command's checkpoint file records a digest of its command
+##  string and the fingerprints (size and mtime) of its declared input
+##  files.  A command is re-executed if its checkpoint is missing or its
+##  digest no longer matches (ie. a parameter in the command string or an
+##  input file changed), or if any command it depends on is re-executed:
+##  those producing its declared inputs, and for commands declaring no
+##  files, any preceding command, including those of earlier run() calls
+##  and other Pipeliner objects in the same process.
+##
+##  For commands declaring their thread count via Command::set_num_threads(),
+##  the thread count options (@DIGEST_IGNORE_PATTERNS) are left out of the
+##  digest, so re-running with a different --CPU keeps the checkpoints.
+##  In other commands, the same options may mean something else (ie. sort -t)
+##  and are digested as given.
+##  Empty checkpoint files (as written by earlier versions) are taken as
+##  current.
+##
+##  Commands declaring no files re-execute whenever any preceding command
+##  does, so only the dependents of a changed command re-execute when the
+##  commands following it declare their inputs and outputs.
+##
+##  With Pipeliner->new(-dry_run => 1), run() lists which commands would
+##  be executed or skipped, and why, without running anything, and returns
+##  the plan: a list ref of { checkpoint, cmd, reason } per command, with
+##  reason undef if up to date.  Since the calling script may go on to read
+##  the outputs of re-executed commands, it decides whether to stop there.
+##
+##  With Pipeliner->new(-keep_going => 1), a failed command no longer stops
+##  the commands not depending on it (as per their declared inputs and
+##  outputs), and run() dies reporting all of the failures at the end.
+#########################################################################
+
+our @DIGEST_IGNORE_PATTERNS = ( qr/(?<!\S)(?:--CPU|--threads|--bam_threads|-t|-@)\s+\d+(?!\S)/ );
+
+# set once any command is (or, in a dry run, would be) executed in this process
+my $ANY_CMD_EXECUTED = 0;
+
+our $PROFILE_TSV = "pipeline_profile.tsv";
+our $PROFILE_JSONL = "pipeline_profile.jsonl";
+our $PROFILE_MIN_SAMPLE_INTERVAL = 0.05;
+our $PROFILE_MAX_SAMPLE_INTERVAL = 1;
+
+my @PROFILE_FIELDS = qw(checkpoint start_time wall_sec user_sec sys_sec max_rss_mb read_bytes write_bytes num_threads exit_code cmd);
+
+my $CLOCK_TICKS = POSIX::sysconf(&POSIX::_SC_CLK_TCK) || 100;
+my $PAGE_SIZE = POSIX::sysconf(&POSIX::_SC_PAGESIZE) || 4096;
+
 
 ####################
 ## Static methods:
@@ -59,12 +146,19 @@ sub new {
     }
     my $cmds_log = $params{-cmds_log};
     
+    my $num_slots = 1;
+    if ($params{-CPU} && $params{-CPU} > 1) {
+        $num_slots = $params{-CPU};
+    }
     
     my $self = { 
         cmd_objs => [],
         checkpoint_dir => undef,
         cmds_log_ofh => undef,
         VERBOSE => $VERBOSE,
+        num_slots => $num_slots,
+        dry_run => ($params{-dry_run}) ? 1 : 0,
+        keep_going => ($params{-keep_going}) ? 1 : 0,
     };
     
     bless ($self, $packagename);
@@ -142,38 +236,47 @@ sub has_commands {
 
 sub run {
     my $self = shift;
+
+    if ($self->{dry_run}) {
+        return($self->_dry_run());
+    }
+    
+    if ( ($self->{num_slots} > 1 || $self->{keep_going}) && grep { $_->has_declared_files() } $self->_get_commands()) {
+        return($self->_run_parallel());
+    }
+    
     my $VERBOSE = $self->{VERBOSE};
     
     my $cmds_log_ofh = $self->{cmds_log_ofh};
 
-    foreach my $cmd_obj ($self->_get_commands()) {
+    my @cmd_objs = $self->_get_commands();
+    my @rerun_reasons = $self->_get_rerun_reasons(@cmd_objs);
+    
+    for (my $i = 0; $i <= $#cmd_objs; $i++) {
+        my $cmd_obj = $cmd_objs[$i];
         
         my $cmdstr = $cmd_obj->get_cmdstr();
         print $cmds_log_ofh "$cmdstr\n";
 
-        my $msg = $cmd_obj->{msg};
-
         my $checkpoint_file = $cmd_obj->get_checkpoint_file();
         
-        if (-e $checkpoint_file) {
-            print STDERR "-- Skipping CMD: $cmdstr, checkpoint [$checkpoint_file] exists.\n" if $VERBOSE;
+        if (! defined $rerun_reasons[$i]) {
+            print STDERR "-- Skipping CMD: $cmdstr, checkpoint [$checkpoint_file] is current.\n" if $VERBOSE;
         }
         else {
-            my $datestamp = localtime();
-            print STDERR "* [$datestamp] Running CMD: $cmdstr\n" if $VERBOSE;
-            
-            my $tmp_stderr = "tmp.$$." . time() . ".stderr";
-            if (-e $tmp_stderr) {
-                unlink($tmp_stderr);
-            }
+            print STDERR "-- Re-executing CMD: $cmdstr, checkpoint [$checkpoint_file] out of date: $rerun_reasons[$i]\n" if ($VERBOSE && -e $checkpoint_file);
 
-            if ($VERBOSE < 2 && $cmdstr !~ / 2>/ ) {
-                $cmdstr .= " 2>$tmp_stderr";
-            }
+            my $proc_info = $self->_launch_cmd($cmd_obj, 0);
+            my %running = ( $proc_info->{pid} => $proc_info );
             
-            print STDERR $msg if $msg;
+            my ($pid, $ret);
+            do {
+                ($pid, $ret) = $self->_wait_for_cmd(\%running);
+            } until ($pid == $proc_info->{pid});
+            
+            $cmdstr = $proc_info->{cmdstr};
+            my $tmp_stderr = $proc_info->{tmp_stderr};
             
-            my $ret = system($cmdstr);
             if ($ret) {
                                 
                 if (-e $tmp_stderr) {
@@ -187,11 +290,8 @@ sub run {
                 confess "Error, cmd: $cmdstr died with ret $ret $!";
             }
             else {
-                `touch $checkpoint_file`;
-                if ($?) {
-                    
-                    confess "Error creating checkpoint file: $checkpoint_file";
-                }
+                $self->_write_checkpoint($cmd_obj);
+                $self->_reset_child_cpu_times();
             }
 
             if (-e $tmp_stderr) {
@@ -199,7 +299,6 @@ sub run {
             }
         }
     }
-
     
     # reset in case reusing the pipeline obj
     $self->{cmd_objs} = []; # reinit
@@ -215,6 +314,639 @@ sub _get_commands {
 }
 
 
+####
+sub _run_parallel {
+    my $self = shift;
+    my $VERBOSE = $self->{VERBOSE};
+    my $num_slots = $self->{num_slots};
+    my $keep_going = $self->{keep_going};
+    
+    my $cmds_log_ofh = $self->{cmds_log_ofh};
+
+    my @cmd_objs = $self->_get_commands();
+    my @dependencies = &_build_dependency_graph(@cmd_objs);
+    my @rerun_reasons = $self->_get_rerun_reasons(@cmd_objs);
+    
+    my %done;
+    my @pending;
+    
+    for (my $i = 0; $i <= $#cmd_objs; $i++) {
+        my $cmd_obj = $cmd_objs[$i];
+        my $cmdstr = $cmd_obj->get_cmdstr();
+        print $cmds_log_ofh "$cmdstr\n";
+        
+        my $checkpoint_file = $cmd_obj->get_checkpoint_file();
+        if (! defined $rerun_reasons[$i]) {
+            print STDERR "-- Skipping CMD: $cmdstr, checkpoint [$checkpoint_file] is current.\n" if $VERBOSE;
+            $done{$i} = 1;
+        }
+        else {
+            print STDERR "-- Re-executing CMD: $cmdstr, checkpoint [$checkpoint_file] out of date: $rerun_reasons[$i]\n" if ($VERBOSE && -e $checkpoint_file);
+            push (@pending, $i);
+        }
+    }
+    $cmds_log_ofh->flush();
+    
+    my %running; # pid => { idx, slots, cmdstr, tmp_stderr }
+    my $slots_in_use = 0;
+    my @failures;
+    
+    while (%running || (@pending && (! @failures || $keep_going))) {
+        
+        if (! @failures || $keep_going) {
+            ## launch whatever is ready and fits within the available slots.
+            my @still_pending;
+            foreach my $i (@pending) {
+                my $cmd_obj = $cmd_objs[$i];
+                my $ready = ! grep { ! $done{$_} } @{$dependencies[$i]};
+                
+                my $slots = $cmd_obj->get_num_threads();
+                if ($slots > $num_slots) {
+                    $slots = $num_slots;
+                }
+                
+                if ($ready && ($slots_in_use + $slots <= $num_slots || ! %running)) {
+                    my $proc_info = $self->_launch_cmd($cmd_obj, $i);
+                    $proc_info->{slots} = $slots;
+                    $running{ $proc_info->{pid} } = $proc_info;
+                    $slots_in_use += $slots;
+                }
+                else {
+                    push (@still_pending, $i);
+                }
+            }
+            @pending = @still_pending;
+        }
+
+        last unless %running;
+        
+        my ($pid, $ret) = $self->_wait_for_cmd(\%running);
+        my $proc_info = delete $running{$pid} or next;
+        $slots_in_use -= $proc_info->{slots};
+        
+        my $cmd_obj = $cmd_objs[ $proc_info->{idx} ];
+        my $cmdstr = $proc_info->{cmdstr};
+        my $tmp_stderr = $proc_info->{tmp_stderr};
+        
+        if ($ret) {
+            if (-e $tmp_stderr) {
+                my $errmsg = `cat $tmp_stderr`;
+                if ($errmsg =~ /\w/) {
+                    print STDERR "\n\nError encountered::  <!----\nCMD: $cmdstr\n\nErrmsg:\n$errmsg\n--->\n\n";
+                }
+            }
+            push (@failures, "Error, cmd: $cmdstr died with ret $ret");
+            if (%running && ! $keep_going) {
+                print STDERR "-- waiting on " . scalar(keys %running) . " running command(s) to finish before stopping.\n";
+            }
+        }
+        else {
+            if (eval { $self->_write_checkpoint($cmd_obj); 1; }) {
+                $done{ $proc_info->{idx} } = 1;
+            }
+            else {
+                push (@failures, $@);
+            }
+            $self->_reset_child_cpu_times();
+        }
+        if (-e $tmp_stderr) {
+            unlink($tmp_stderr);
+        }
+    }
+    
+    # reset in case reusing the pipeline obj
+    $self->{cmd_objs} = []; # reinit
+
+    if (@failures && @pending) {
+        # those depending on the failed commands
+        push (@failures, "-- not run: " . join(" ", map { $cmd_objs[$_]->get_checkpoint_file() } @pending));
+    }
+    
+    if (@failures) {
+        confess join("\n", @failures);
+    }
+    
+    return;
+}
+
+
+####
+sub _launch_cmd {
+    my $self = shift;
+    my ($cmd_obj, $idx) = @_;
+
+    my $VERBOSE = $self->{VERBOSE};
+    
+    my $cmdstr = $cmd_obj->get_cmdstr();
+    my $msg = $cmd_obj->{msg};
+
+    # record what's being run, and drop any stale checkpoint in case the command fails
+    $cmd_obj->{checkpoint_record} = &_get_checkpoint_record($cmd_obj);
+    unlink($cmd_obj->get_checkpoint_file());
+    $ANY_CMD_EXECUTED = 1;
+    
+    my $datestamp = localtime();
+    print STDERR "* [$datestamp] Running CMD: $cmdstr\n" if $VERBOSE;
+    print STDERR $msg if $msg;
+    
+    my $tmp_stderr = "tmp.$$.$idx." . time() . ".stderr";
+    if (-e $tmp_stderr) {
+        unlink($tmp_stderr);
+    }
+    
+    if ($VERBOSE < 2 && $cmdstr !~ / 2>/ ) {
+        $cmdstr .= " 2>$tmp_stderr";
+    }
+
+    STDOUT->flush();
+    STDERR->flush();
+    
+    my $pid = fork();
+    unless (defined $pid) {
+        confess "Error, cannot fork to run cmd: $cmdstr";
+    }
+    if ($pid == 0) {
+        # child
+        exec($cmdstr) or POSIX::_exit(127);
+    }
+
+    return( { pid => $pid,
+              idx => $idx,
+              cmd_obj => $cmd_obj,
+              cmdstr => $cmdstr,
+              tmp_stderr => $tmp_stderr,
+              start_time => Time::HiRes::time(),
+              max_rss => undef,
+              io => {}, # pid => [rchar, wchar]
+            } );
+}
+
+
+####
+sub _wait_for_cmd {
+    my $self = shift;
+    my ($running_href) = @_;
+
+    ## waits for any of the running commands to complete, sampling their resource use meanwhile.
+    ## records the profile of the completed command, and returns (pid, exit status)
+
+    unless (defined $self->{child_cpu_times}) {
+        $self->_reset_child_cpu_times();
+    }
+    
+    my $sample_interval = $PROFILE_MIN_SAMPLE_INTERVAL;
+    my $pid = 0;
+    my $ret;
+    while (1) {
+        &_sample_process_trees($running_href);
+        
+        # only the commands run here are reaped, leaving any other children of the calling script be
+        foreach my $running_pid (keys %$running_href) {
+            $pid = waitpid($running_pid, &POSIX::WNOHANG);
+            if ($pid != 0) {
+                $ret = $?;
+                last;
+            }
+        }
+        last if $pid != 0;
+        
+        Time::HiRes::sleep($sample_interval);
+        $sample_interval = $sample_interval * 2;
+        if ($sample_interval > $PROFILE_MAX_SAMPLE_INTERVAL) {
+            $sample_interval = $PROFILE_MAX_SAMPLE_INTERVAL;
+        }
+    }
+    if ($pid < 0) {
+        confess "Error, lost track of running commands: " . join(", ", map { $_->{cmdstr} } values %$running_href);
+    }
+
+    if (my $proc_info = $running_href->{$pid}) {
+        ## cpu times of the reaped child tree are those accumulated since the last reap.
+        my ($user_sec, $sys_sec) = $self->_reset_child_cpu_times();
+        
+        $self->_record_profile($proc_info, $ret, $user_sec, $sys_sec);
+    }
+    
+    return($pid, $ret);
+}
+
+
+####
+sub _reset_child_cpu_times {
+    my $self = shift;
+
+    ## returns the (user, sys) cpu seconds accumulated by reaped children since the last reset
+    
+    my (undef, undef, undef, $cuser, $csys) = POSIX::times();
+
+    my ($prev_cuser, $prev_csys) = (defined $self->{child_cpu_times}) ? @{$self->{child_cpu_times}} : ($cuser, $csys);
+    $self->{child_cpu_times} = [$cuser, $csys];
+
+    return( ($cuser - $prev_cuser) / $CLOCK_TICKS, ($csys - $prev_csys) / $CLOCK_TICKS);
+}
+
+
+####
+sub _sample_process_trees {
+    my ($running_href) = @_;
+
+    ## updates the peak RSS and the I/O counters of the process tree of each running command.
+    
+    return unless (%$running_href && -e "/proc/$$/stat");
+    
+    # just the trees of the running commands are walked if the kernel lists the children of each task,
+    # otherwise the children of every process are mapped
+    my $children_href = (-e "/proc/$$/task/$$/children") ? undef : &_get_all_proc_children();
+    
+    foreach my $proc_info (values %$running_href) {
+        my @tree = ($proc_info->{pid});
+        for (my $i = 0; $i <= $#tree; $i++) {
+            push (@tree, &_get_proc_children($tree[$i], $children_href));
+        }
+
+        my $rss = 0;
+        foreach my $proc_pid (@tree) {
+            if (open(my $fh, "/proc/$proc_pid/statm")) {
+                my $statm = <$fh>;
+                close $fh;
+                if (defined($statm) && $statm =~ /^\d+\s+(\d+)/) {
+                    $rss += $1 * $PAGE_SIZE;
+                }
+            }
+            if (open(my $fh, "/proc/$proc_pid/io")) {
+                my %io = map { /^(\w+):\s+(\d+)/ ? ($1 => $2) : () } <$fh>;
+                close $fh;
+                if (defined $io{rchar}) {
+                    $proc_info->{io}->{$proc_pid} = [$io{rchar}, $io{wchar}];
+                }
+            }
+        }
+        if ( (! defined $proc_info->{max_rss}) || $rss > $proc_info->{max_rss}) {
+            $proc_info->{max_rss} = $rss;
+        }
+    }
+
+    return;
+}
+
+
+####
+sub _get_proc_children {
+    my ($proc_pid, $children_href) = @_;
+
+    if ($children_href) {
+        return( @{$children_href->{$proc_pid} || []} );
+    }
+    
+    my @children;
+    foreach my $children_file (glob("/proc/$proc_pid/task/*/children")) {
+        open(my $fh, $children_file) or next;
+        my $children = <$fh>;
+        close $fh;
+        push (@children, grep { /^\d+$/ } split(/\s+/, $children)) if defined $children;
+    }
+    
+    return(@children);
+}
+
+
+####
+sub _get_all_proc_children {
+
+    ## returns hashref of pid => [child pids] over all processes
+    
+    my %children;
+    opendir(my $dh, "/proc") or return(\%children);
+    while (my $proc_pid = readdir($dh)) {
+        next unless $proc_pid =~ /^\d+$/;
+        open(my $fh, "/proc/$proc_pid/stat") or next;
+        my $stat = <$fh>;
+        close $fh;
+        # ppid follows the parenthesized command name, which may contain spaces
+        if (defined($stat) && $stat =~ /\)\s+\S+\s+(\d+)/) {
+            push (@{$children{$1}}, $proc_pid);
+        }
+    }
+    closedir($dh);
+
+    return(\%children);
+}
+
+
+####
+sub _record_profile {
+    my $self = shift;
+    my ($proc_info, $ret, $user_sec, $sys_sec) = @_;
+
+    my $checkpoint_dir = $self->get_checkpoint_dir() or return;
+    
+    my $cmd_obj = $proc_info->{cmd_obj};
+    
+    my ($read_bytes, $write_bytes) = ("NA", "NA");
+    if (%{$proc_info->{io}}) {
+        ($read_bytes, $write_bytes) = (0, 0);
+        foreach my $io (values %{$proc_info->{io}}) {
+            $read_bytes += $io->[0];
+            $write_bytes += $io->[1];
+        }
+    }
+
+    my $checkpoint = $cmd_obj->get_checkpoint_file();
+    $checkpoint =~ s|^.*/||;
+    
+    my %profile = ( checkpoint => $checkpoint,
+                    start_time => POSIX::strftime("%Y-%m-%dT%H:%M:%S", localtime($proc_info->{start_time})),
+                    wall_sec => sprintf("%.2f", Time::HiRes::time() - $proc_info->{start_time}),
+                    user_sec => sprintf("%.2f", $user_sec),
+                    sys_sec => sprintf("%.2f", $sys_sec),
+                    max_rss_mb => (defined $proc_info->{max_rss}) ? sprintf("%.1f", $proc_info->{max_rss} / 1024**2) : "NA",
+                    read_bytes => $read_bytes,
+                    write_bytes => $write_bytes,
+                    num_threads => $cmd_obj->get_num_threads(),
+                    exit_code => ($ret & 127) ? "signal_" . ($ret & 127) : $ret >> 8,
+                    cmd => $cmd_obj->get_cmdstr(),
+        );
+
+    my $profile_tsv = "$checkpoint_dir/$PROFILE_TSV";
+    my $write_header = ! -s $profile_tsv;
+    open(my $ofh, ">>$profile_tsv") or confess "Error, cannot append to $profile_tsv";
+    if ($write_header) {
+        print $ofh join("\t", @PROFILE_FIELDS) . "\n";
+    }
+    print $ofh join("\t", map { my $val = $profile{$_}; $val =~ s/[\t\n]/ /g; $val } @PROFILE_FIELDS) . "\n";
+    close $ofh;
+
+    my $profile_jsonl = "$checkpoint_dir/$PROFILE_JSONL";
+    open($ofh, ">>$profile_jsonl") or confess "Error, cannot append to $profile_jsonl";
+    my %json_profile = map { $_ => ( ($_ ne "cmd" && $profile{$_} =~ /^\d+(\.\d+)?$/) ? $profile{$_} + 0 : $profile{$_}) } keys %profile;
+    print $ofh JSON::PP->new->canonical->encode(\%json_profile) . "\n";
+    close $ofh;
+
+    return;
+}
+
+
+####
+sub summarize_profiles {
+    my ($top_N, @profile_tsv_files) = @_;
+
+    ## returns a text table of the top_N commands by wall time across the given profiles, plus totals.
+
+    my @profiles;
+    foreach my $profile_tsv (@profile_tsv_files) {
+        open(my $fh, $profile_tsv) or confess "Error, cannot open $profile_tsv";
+        my $header = <$fh>;
+        chomp $header;
+        my @fields = split(/\t/, $header);
+        while (my $line = <$fh>) {
+            chomp $line;
+            my @vals = split(/\t/, $line, scalar(@fields));
+            my %profile;
+            @profile{@fields} = @vals;
+            push (@profiles, \%profile);
+        }
+        close $fh;
+    }
+
+    return("") unless @profiles;
+    
+    @profiles = sort { $b->{wall_sec} <=> $a->{wall_sec} } @profiles;
+
+    my ($total_wall, $total_cpu) = (0, 0);
+    foreach my $profile (@profiles) {
+        $total_wall += $profile->{wall_sec};
+        $total_cpu += $profile->{user_sec} + $profile->{sys_sec};
+    }
+
+    my $table = sprintf("%10s %6s %10s %8s %10s %10s %10s  %s\n",
+                        "wall(s)", "%wall", "cpu(s)", "cpu/wall", "maxRSS(MB)", "read(MB)", "write(MB)", "checkpoint");
+    
+    my $num_report = ($top_N && $top_N < scalar(@profiles)) ? $top_N : scalar(@profiles);
+    foreach my $profile (@profiles[0 .. $num_report - 1]) {
+        my $wall = $profile->{wall_sec};
+        my $cpu = $profile->{user_sec} + $profile->{sys_sec};
+        $table .= sprintf("%10.1f %6.1f %10.1f %8.2f %10s %10s %10s  %s\n",
+                          $wall,
+                          ($total_wall > 0) ? 100 * $wall / $total_wall : 0,
+                          $cpu,
+                          ($wall > 0) ? $cpu / $wall : 0,
+                          $profile->{max_rss_mb},
+                          &_bytes_to_MB($profile->{read_bytes}),
+                          &_bytes_to_MB($profile->{write_bytes}),
+                          $profile->{checkpoint});
+    }
+    $table .= sprintf("%10.1f %6s %10.1f %8s  (total of %d commands)\n", $total_wall, "", $total_cpu, "", scalar(@profiles));
+
+    return($table);
+}
+
+####
+sub _bytes_to_MB {
+    my ($bytes) = @_;
+    return( ($bytes =~ /^\d+$/) ? sprintf("%.1f", $bytes / 1024**2) : $bytes);
+}
+
+
+####
+sub _dry_run {
+    my $self = shift;
+
+    my @cmd_objs = $self->_get_commands();
+    my @rerun_reasons = $self->_get_rerun_reasons(@cmd_objs);
+
+    my @plan;
+    my $num_to_execute = 0;
+    for (my $i = 0; $i <= $#cmd_objs; $i++) {
+        my $checkpoint = $cmd_objs[$i]->get_checkpoint_file();
+        $checkpoint =~ s|^.*/||;
+        push (@plan, { checkpoint => $checkpoint,
+                       cmd => $cmd_objs[$i]->get_cmdstr(),
+                       reason => $rerun_reasons[$i],
+              } );
+        if (defined $rerun_reasons[$i]) {
+            print STDERR "-- [dry run] would execute: $checkpoint ($rerun_reasons[$i])\n\tCMD: " . $cmd_objs[$i]->get_cmdstr() . "\n";
+            $num_to_execute++;
+        }
+        else {
+            print STDERR "-- [dry run] up to date: $checkpoint\n";
+        }
+    }
+    
+    $self->{cmd_objs} = []; # reinit
+    
+    if ($num_to_execute) {
+        $ANY_CMD_EXECUTED = 1;
+    }
+    
+    return(\@plan);
+}
+
+
+####
+sub _get_rerun_reasons {
+    my $self = shift;
+    my (@cmd_objs) = @_;
+
+    ## returns list (indexed as per @cmd_objs) of the reason each command needs to be executed, or undef if its checkpoint is current.
+
+    my @dependencies = &_build_dependency_graph(@cmd_objs);
+
+    my @rerun_reasons;
+    my $any_rerun = $ANY_CMD_EXECUTED;
+    
+    for (my $i = 0; $i <= $#cmd_objs; $i++) {
+        my $cmd_obj = $cmd_objs[$i];
+        
+        my $reason = &_get_checkpoint_status($cmd_obj);
+        
+        unless (defined $reason) {
+            if (my ($dep) = grep { defined $rerun_reasons[$_] } @{$dependencies[$i]}) {
+                my $dep_checkpoint = $cmd_objs[$dep]->get_checkpoint_file();
+                $dep_checkpoint =~ s|^.*/||;
+                $reason = "depends on re-executed $dep_checkpoint";
+            }
+            elsif ($any_rerun && ! $cmd_obj->has_declared_files()) {
+                $reason = "follows re-executed commands";
+            }
+        }
+        
+        if (defined $reason) {
+            $any_rerun = 1;
+        }
+        push (@rerun_reasons, $reason);
+    }
+
+    return(@rerun_reasons);
+}
+
+
+####
+sub _get_checkpoint_status {
+    my ($cmd_obj) = @_;
+
+    ## returns undef if the checkpoint is current, otherwise the reason it isn't
+
+    my $checkpoint_file = $cmd_obj->get_checkpoint_file();
+    
+    unless (-e $checkpoint_file) {
+        return("no checkpoint");
+    }
+    unless (-s $checkpoint_file) {
+        # pre-digest checkpoint
+        return(undef);
+    }
+
+    my $checkpoint_record = eval {
+        open(my $fh, $checkpoint_file) or die "cannot open";
+        local $/;
+        my $json = <$fh>;
+        close $fh;
+        JSON::PP->new->decode($json);
+    };
+    unless ($checkpoint_record && $checkpoint_record->{digest}) {
+        return("unreadable checkpoint");
+    }
+    
+    my $current_record = &_get_checkpoint_record($cmd_obj);
+    if ($current_record->{digest} eq $checkpoint_record->{digest}) {
+        return(undef);
+    }
+    
+    if ($current_record->{cmd} ne ($checkpoint_record->{cmd} // "")) {
+        return("command changed");
+    }
+    
+    my $prev_inputs = $checkpoint_record->{inputs} || {};
+    my @changed_inputs = grep { ($prev_inputs->{$_} // "") ne $current_record->{inputs}->{$_} } sort keys %{$current_record->{inputs}};
+    if (@changed_inputs) {
+        return("input changed: " . join(", ", @changed_inputs));
+    }
+
+    return("checkpoint digest changed");
+}
+
+
+####
+sub _get_checkpoint_record {
+    my ($cmd_obj) = @_;
+
+    my $cmd = $cmd_obj->get_cmdstr();
+    if ($cmd_obj->has_declared_threads()) {
+        foreach my $ignore_pattern (@DIGEST_IGNORE_PATTERNS) {
+            $cmd =~ s/$ignore_pattern//g;
+        }
+    }
+    $cmd =~ s/\s+/ /g;
+    $cmd =~ s/^ | $//g;
+    
+    my %inputs;
+    foreach my $input ($cmd_obj->get_inputs()) {
+        my @stat = Time::HiRes::stat($input);
+        $inputs{$input} = (@stat) ? join(":", $stat[7], $stat[9]) : "missing";
+    }
+    
+    my $digest = Digest::SHA::sha1_hex(join("\n", $cmd, map { "$_\t$inputs{$_}" } sort keys %inputs));
+    
+    return( { digest => $digest,
+              cmd => $cmd,
+              inputs => \%inputs,
+            } );
+}
+
+
+####
+sub _write_checkpoint {
+    my $self = shift;
+    my ($cmd_obj) = @_;
+
+    my $checkpoint_file = $cmd_obj->get_checkpoint_file();
+    my $checkpoint_record = $cmd_obj->{checkpoint_record} || &_get_checkpoint_record($cmd_obj);
+    
+    open(my $ofh, ">$checkpoint_file") or confess "Error creating checkpoint file: $checkpoint_file";
+    print $ofh JSON::PP->new->canonical->pretty->encode($checkpoint_record);
+    close $ofh or confess "Error creating checkpoint file: $checkpoint_file";
+
+    return;
+}
+
+
+####
+sub _build_dependency_graph {
+    my (@cmd_objs) = @_;
+
+    ## returns list (indexed as per @cmd_objs) of array refs containing the indices of prerequisite commands.
+    
+    my @dependencies;
+    
+    for (my $j = 0; $j <= $#cmd_objs; $j++) {
+        my $cmd_j = $cmd_objs[$j];
+        my @deps;
+        
+        for (my $i = 0; $i < $j; $i++) {
+            my $cmd_i = $cmd_objs[$i];
+
+            if ( (! $cmd_i->has_declared_files()) || (! $cmd_j->has_declared_files()) ) {
+                # undeclared commands serve as barriers
+                push (@deps, $i);
+                next;
+            }
+            
+            my %outputs_i = map { $_ => 1 } $cmd_i->get_outputs();
+            my %inputs_i = map { $_ => 1 } $cmd_i->get_inputs();
+
+            if ( (grep { $outputs_i{$_} } $cmd_j->get_inputs())         # read after write
+                 || (grep { $outputs_i{$_} } $cmd_j->get_outputs())     # write after write
+                 || (grep { $inputs_i{$_} } $cmd_j->get_outputs()) ) {  # write after read
+                push (@deps, $i);
+            }
+        }
+        push (@dependencies, \@deps);
+    }
+    
+    return(@dependencies);
+}
+
+
 
 
 
@@ -235,6 +967,10 @@ sub new {
     my $self = { cmdstr => $cmdstr,
                  checkpoint_file => $checkpoint_file,
                  msg => $message,
+                 inputs => [],
+                 outputs => [],
+                 num_threads => 1,
+                 threads_declared => 0,
     };
 
     bless ($self, $packagename);
@@ -262,4 +998,73 @@ sub reset_checkpoint_file {
     $self->{checkpoint_file} = $checkpoint_file;
 }
 
+####
+sub add_inputs {
+    my $self = shift;
+    my @files = @_;
+
+    push (@{$self->{inputs}}, map { &Pipeliner::ensure_full_path($_) } @files);
+
+    return($self);
+}
+
+####
+sub get_inputs {
+    my $self = shift;
+    return(@{$self->{inputs}});
+}
+
+####
+sub add_outputs {
+    my $self = shift;
+    my @files = @_;
+
+    push (@{$self->{outputs}}, map { &Pipeliner::ensure_full_path($_) } @files);
+
+    return($self);
+}
+
+####
+sub get_outputs {
+    my $self = shift;
+    return(@{$self->{outputs}});
+}
+
+####
+sub has_declared_files {
+    my $self = shift;
+    if (@{$self->{inputs}} || @{$self->{outputs}}) {
+        return(1);
+    }
+    else {
+        return(0);
+    }
+}
+
+####
+sub set_num_threads {
+    my $self = shift;
+    my ($num_threads) = @_;
+
+    unless ($num_threads && $num_threads =~ /^\d+$/ && $num_threads > 0) {
+        confess "Error, num_threads must be a positive integer";
+    }
+    $self->{num_threads} = $num_threads;
+    $self->{threads_declared} = 1;
+
+    return($self);
+}
+
+####
+sub has_declared_threads {
+    my $self = shift;
+    return($self->{threads_declared});
+}
+
+####
+sub get_num_threads {
+    my $self = shift;
+    return($self->{num_threads});
+}
+
 1; #EOM
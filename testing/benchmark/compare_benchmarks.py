@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+import sys, os, re
+import logging
+import argparse
+import json
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s : %(levelname)s : %(message)s",
+    datefmt="%H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+## Compares a benchmark report (see run_benchmark.py) to a stored baseline report, printing
+## the per-stage ratios (current / baseline) and flagging regressions.
+## Exits non-zero if any regression is found, so it can gate a release.
+
+
+COMPARED_MEASURES = ["wall_sec", "cpu_sec", "max_rss_mb"]
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="compare benchmark report to a baseline and flag regressions",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument("--baseline", type=str, required=True, help="baseline benchmark json report")
+    parser.add_argument("--current", type=str, required=True, help="current benchmark json report")
+    parser.add_argument(
+        "--max_time_increase",
+        type=float,
+        default=0.15,
+        help="max fractional increase in wall or cpu time before flagging a regression",
+    )
+    parser.add_argument(
+        "--max_rss_increase",
+        type=float,
+        default=0.10,
+        help="max fractional increase in peak RSS before flagging a regression",
+    )
+    parser.add_argument(
+        "--min_time_sec",
+        type=float,
+        default=1.0,
+        help="ignore time changes for stages taking less than this in both reports (timer noise)",
+    )
+
+    args = parser.parse_args()
+
+    baseline = load_report(args.baseline)
+    current = load_report(args.current)
+
+    if baseline["benchmark_data_version"] != current["benchmark_data_version"]:
+        logger.warning(
+            "-benchmark data versions differ (baseline: {}, current: {}), comparisons may not be meaningful".format(
+                baseline["benchmark_data_version"], current["benchmark_data_version"]
+            )
+        )
+
+    if baseline.get("CPU") != current.get("CPU"):
+        logger.warning(
+            "-benchmarks were run with different --CPU settings (baseline: {}, current: {})".format(
+                baseline.get("CPU"), current.get("CPU")
+            )
+        )
+
+    regressions = compare_reports(
+        baseline,
+        current,
+        {
+            "wall_sec": args.max_time_increase,
+            "cpu_sec": args.max_time_increase,
+            "max_rss_mb": args.max_rss_increase,
+        },
+        args.min_time_sec,
+    )
+
+    if regressions:
+        logger.error("-{} regression(s) found:".format(len(regressions)))
+        for regression in regressions:
+            logger.error("   " + regression)
+        sys.exit(1)
+
+    logger.info("-no regressions found")
+
+    sys.exit(0)
+
+
+def load_report(report_filename):
+
+    with open(report_filename, "rt") as fh:
+        return json.load(fh)
+
+
+def compare_reports(baseline, current, max_increases, min_time_sec):
+    """
+    prints the comparison table, returns list of regression descriptions
+    """
+
+    regressions = list()
+
+    print(
+        "\t".join(
+            ["#num_reads", "stage"]
+            + [
+                "{}_{}".format(measure, x)
+                for measure in COMPARED_MEASURES
+                for x in ("baseline", "current", "ratio")
+            ]
+            + ["status"]
+        )
+    )
+
+    for scale in sorted(current["scales"], key=int):
+
+        if scale not in baseline["scales"]:
+            logger.warning("-no baseline for {} reads, skipping".format(scale))
+            continue
+
+        baseline_stages = baseline["scales"][scale]["stages"]
+        current_stages = current["scales"][scale]["stages"]
+
+        for stage_name, current_stats in current_stages.items():
+
+            baseline_stats = baseline_stages.get(stage_name)
+            if baseline_stats is None:
+                print("\t".join([scale, stage_name] + ["NA"] * (3 * len(COMPARED_MEASURES)) + ["NEW"]))
+                continue
+
+            fields = [scale, stage_name]
+            flagged = list()
+
+            for measure in COMPARED_MEASURES:
+                baseline_val = baseline_stats[measure]
+                current_val = current_stats[measure]
+                ratio = current_val / baseline_val if baseline_val > 0 else float("inf")
+                fields.extend(["{:.2f}".format(baseline_val), "{:.2f}".format(current_val), "{:.2f}".format(ratio)])
+
+                if measure.endswith("_sec") and max(baseline_val, current_val) < min_time_sec:
+                    continue
+
+                if ratio > 1 + max_increases[measure]:
+                    flagged.append(measure)
+                    regressions.append(
+                        "{} reads, {}: {} {:.2f} -> {:.2f} ({:+.0f}%)".format(
+                            scale, stage_name, measure, baseline_val, current_val, (ratio - 1) * 100
+                        )
+                    )
+
+            fields.append("REGRESSION:" + ",".join(flagged) if flagged else "ok")
+            print("\t".join(fields))
+
+    return regressions
+
+
+if __name__ == "__main__":
+    main()
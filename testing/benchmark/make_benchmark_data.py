@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+
+import sys, os, re
+import logging
+import argparse
+import numpy as np
+import pysam
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s : %(levelname)s : %(message)s",
+    datefmt="%H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+## Builds the inputs for the performance benchmark (see run_benchmark.py):
+##
+##   <data_dir>/mini_genome_lib/      : small synthetic genome lib (ref_genome.fa, ref_annot.gtf)
+##   <data_dir>/reads_<num_reads>/    : inputs scaled to the given number of reads:
+##       reads.fa          : the testing/ fusion read fixtures, upsampled (renamed copies),
+##                           plus synthetic fusion reads and background (non-fusion) transcript reads
+##       aligned.bam       : minimap2-style alignments (unsorted, grouped by read) of the synthetic reads
+##                           to the mini genome, chimeric reads having a supplementary alignment + SA tags
+##       LR-FI_targets.gtf, LR-FI.mm2.bam, LR-FI.mm2.gff3, LR-FI_targets.seqsimilar_regions.gff3
+##                         : phase-2 fusion contig annotations and the fusion read alignments to them (bam and gff3)
+##
+## The fixture reads are aligned to the full human genome, so the alignment-level inputs are
+## synthesized against the mini genome instead. Everything is generated from a fixed seed, so
+## inputs for a given scale are identical across runs and releases.
+
+
+BENCHMARK_DATA_VERSION = 2
+
+SEED = 1234
+
+NUM_CHROMS = 4
+CHROM_LENGTH = 2000000
+GENE_SPACING = 20000
+EXONS_PER_GENE = 6
+EXON_SPACING = 1500
+
+NUM_FUSION_PAIRS = 150
+FI_CONTIG_FLANK = 100
+FI_CONTIG_GENE_GAP = 1000
+
+DEFAULT_FIXTURES_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+DEFAULT_FIXTURE_READ_FRAC = 0.005
+DEFAULT_FUSION_READ_FRAC = 0.005
+
+FIXTURE_READ_FILES = [
+    "transcripts.fa.gz",
+    "SKBR3.fusion_reads.fasta.gz",
+    "oncofusionreads.fasta.gz",
+]
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="build mini genome lib and scaled read inputs for the benchmark",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument("--data_dir", type=str, required=True, help="benchmark data directory")
+    parser.add_argument(
+        "--num_reads",
+        type=str,
+        required=True,
+        help="comma-delimited numbers of reads to build inputs for (k/M suffixes allowed, ie. 100k,1M,10M)",
+    )
+    parser.add_argument(
+        "--fixtures_dir",
+        type=str,
+        default=DEFAULT_FIXTURES_DIR,
+        help="directory containing the read fixtures",
+    )
+    parser.add_argument("--fixture_read_frac", type=float, default=DEFAULT_FIXTURE_READ_FRAC, help="fraction of reads from the fixtures")
+    parser.add_argument("--fusion_read_frac", type=float, default=DEFAULT_FUSION_READ_FRAC, help="fraction of synthetic fusion reads")
+
+    args = parser.parse_args()
+
+    genome_lib_dir = build_mini_genome_lib(args.data_dir)
+
+    for num_reads in parse_num_reads(args.num_reads):
+        build_scaled_inputs(
+            args.data_dir,
+            genome_lib_dir,
+            num_reads,
+            args.fixtures_dir,
+            args.fixture_read_frac,
+            args.fusion_read_frac,
+        )
+
+    sys.exit(0)
+
+
+def parse_num_reads(num_reads_spec):
+
+    multipliers = {"": 1, "k": 1000, "K": 1000, "m": 1000000, "M": 1000000}
+
+    num_reads_list = list()
+    for token in num_reads_spec.split(","):
+        m = re.match(r"^\s*(\d+(?:\.\d+)?)([kKmM]?)\s*$", token)
+        if not m:
+            raise RuntimeError("Error, cannot parse number of reads from: {}".format(token))
+        num_reads_list.append(int(float(m.group(1)) * multipliers[m.group(2)]))
+
+    return num_reads_list
+
+
+def get_scaled_inputs_dir(data_dir, num_reads):
+    return os.path.join(data_dir, "reads_{}".format(num_reads))
+
+
+def get_genome_lib_dir(data_dir):
+    return os.path.join(data_dir, "mini_genome_lib")
+
+
+class MiniGenome:
+    """
+    synthetic genome with evenly spaced + strand genes, each having two isoforms
+    (all exons, and skipping the second exon)
+    """
+
+    def __init__(self):
+
+        rng = np.random.default_rng(SEED)
+        bases = np.frombuffer(b"ACGT", dtype=np.uint8)
+
+        self.chrom_seqs = dict()
+        self.genes = list()
+
+        for i in range(NUM_CHROMS):
+            chrom = "chr{}".format(i + 1)
+            self.chrom_seqs[chrom] = bases[
+                rng.integers(0, 4, size=CHROM_LENGTH)
+            ].tobytes().decode()
+
+            for gene_start in range(GENE_SPACING // 2, CHROM_LENGTH - GENE_SPACING, GENE_SPACING):
+                gene_name = "BMG{}".format(len(self.genes) + 1)
+                exons = list()
+                for j in range(EXONS_PER_GENE):
+                    exon_lend = gene_start + j * EXON_SPACING
+                    exon_len = int(rng.integers(150, 300))
+                    exons.append((exon_lend, exon_lend + exon_len - 1))
+
+                transcripts = [exons, exons[:1] + exons[2:]]
+                self.genes.append(
+                    {"chrom": chrom, "gene_name": gene_name, "transcripts": transcripts}
+                )
+
+    def get_seq(self, chrom, exons):
+        seq = self.chrom_seqs[chrom]
+        return "".join([seq[lend - 1 : rend] for (lend, rend) in exons])
+
+
+def build_mini_genome_lib(data_dir):
+
+    genome_lib_dir = get_genome_lib_dir(data_dir)
+    genome_fa = os.path.join(genome_lib_dir, "ref_genome.fa")
+    annot_gtf = os.path.join(genome_lib_dir, "ref_annot.gtf")
+
+    if os.path.exists(genome_fa + ".fai") and os.path.exists(annot_gtf):
+        logger.info("-mini genome lib exists: {}".format(genome_lib_dir))
+        return genome_lib_dir
+
+    logger.info("-building mini genome lib: {}".format(genome_lib_dir))
+    os.makedirs(genome_lib_dir, exist_ok=True)
+
+    genome = MiniGenome()
+
+    with open(genome_fa, "wt") as ofh:
+        for chrom, seq in genome.chrom_seqs.items():
+            ofh.write(">{}\n".format(chrom))
+            for i in range(0, len(seq), 60):
+                ofh.write(seq[i : i + 60] + "\n")
+    pysam.faidx(genome_fa)
+
+    tmp_annot_gtf = annot_gtf + ".tmp"
+    with open(tmp_annot_gtf, "wt") as ofh:
+        for gene in genome.genes:
+            for t, exons in enumerate(gene["transcripts"]):
+                info = 'gene_id "{0}"; transcript_id "{0}.t{1}"; gene_name "{0}";'.format(
+                    gene["gene_name"], t + 1
+                )
+                for (lend, rend) in exons:
+                    ofh.write(
+                        "\t".join(
+                            [gene["chrom"], "bench", "exon", str(lend), str(rend), ".", "+", ".", info]
+                        )
+                        + "\n"
+                    )
+    os.rename(tmp_annot_gtf, annot_gtf)
+
+    return genome_lib_dir
+
+
+def get_fusion_pairs(genome):
+    """
+    returns list of (geneA, geneB, read sampling weight), the same at each scale
+    """
+
+    rng = np.random.default_rng(SEED)
+    gene_idxs = rng.permutation(len(genome.genes))[: 2 * NUM_FUSION_PAIRS]
+    weights = 1.0 / np.arange(1, NUM_FUSION_PAIRS + 1)  # a few highly expressed fusions, and a long tail
+    weights = weights / weights.sum()
+
+    return [
+        (genome.genes[gene_idxs[2 * i]], genome.genes[gene_idxs[2 * i + 1]], weights[i])
+        for i in range(NUM_FUSION_PAIRS)
+    ]
+
+
+def build_scaled_inputs(
+    data_dir, genome_lib_dir, num_reads, fixtures_dir, fixture_read_frac, fusion_read_frac
+):
+
+    inputs_dir = get_scaled_inputs_dir(data_dir, num_reads)
+    done_file = os.path.join(inputs_dir, "inputs.v{}.ok".format(BENCHMARK_DATA_VERSION))
+    if os.path.exists(done_file):
+        logger.info("-benchmark inputs exist: {}".format(inputs_dir))
+        return inputs_dir
+
+    logger.info("-building benchmark inputs for {} reads: {}".format(num_reads, inputs_dir))
+    os.makedirs(inputs_dir, exist_ok=True)
+
+    genome = MiniGenome()
+    rng = np.random.default_rng(SEED + num_reads)
+
+    fixture_reads = list()
+    for fixture_file in FIXTURE_READ_FILES:
+        with pysam.FastxFile(os.path.join(fixtures_dir, fixture_file)) as fh:
+            for entry in fh:
+                fixture_reads.append((entry.name, entry.sequence))
+
+    num_fixture_reads = int(num_reads * fixture_read_frac)
+    num_fusion_reads = int(num_reads * fusion_read_frac)
+    num_background_reads = num_reads - num_fixture_reads - num_fusion_reads
+
+    # background reads are full length transcripts
+    transcripts = list()
+    for gene in genome.genes:
+        for exons in gene["transcripts"]:
+            transcripts.append((gene["chrom"], exons, genome.get_seq(gene["chrom"], exons)))
+
+    fusion_pairs = get_fusion_pairs(genome)
+
+    header = {
+        "HD": {"VN": "1.6", "SO": "unsorted", "GO": "query"},
+        "SQ": [{"SN": chrom, "LN": len(seq)} for chrom, seq in genome.chrom_seqs.items()],
+    }
+
+    reads_fa = os.path.join(inputs_dir, "reads.fa")
+    aligned_bam = os.path.join(inputs_dir, "aligned.bam")
+    LR_gff3 = os.path.join(inputs_dir, "LR-FI.mm2.gff3")
+    LR_bam = os.path.join(inputs_dir, "LR-FI.mm2.bam")
+
+    FI_contig_header = {
+        "HD": {"VN": "1.6", "SO": "unsorted", "GO": "query"},
+        "SQ": [
+            {"SN": get_FI_contig_name(geneA, geneB), "LN": get_FI_contig_length(geneA, geneB)}
+            for geneA, geneB, _ in fusion_pairs
+        ],
+    }
+
+    with open(reads_fa, "wt") as reads_ofh, pysam.AlignmentFile(
+        aligned_bam, "wb", header=header
+    ) as bam_ofh, open(LR_gff3, "wt") as gff3_ofh, pysam.AlignmentFile(
+        LR_bam, "wb", header=FI_contig_header
+    ) as FI_bam_ofh:
+
+        chrom_to_tid = {chrom: i for i, chrom in enumerate(genome.chrom_seqs.keys())}
+        FI_contig_to_tid = {sq["SN"]: i for i, sq in enumerate(FI_contig_header["SQ"])}
+
+        # interleave the read types, as in a real read set
+        read_types = np.concatenate(
+            [
+                np.zeros(num_background_reads, dtype=np.int8),
+                np.ones(num_fusion_reads, dtype=np.int8),
+                np.full(num_fixture_reads, 2, dtype=np.int8),
+            ]
+        )
+        rng.shuffle(read_types)
+
+        background_choices = rng.integers(0, len(transcripts), size=num_background_reads)
+        fusion_choices = rng.choice(
+            len(fusion_pairs), size=num_fusion_reads, p=[x[2] for x in fusion_pairs]
+        )
+
+        counts = [0, 0, 0]
+        for read_type in read_types:
+
+            read_num = counts[read_type]
+            counts[read_type] += 1
+
+            if read_type == 0:
+                read_name = "bg_read{}".format(read_num)
+                chrom, exons, seq = transcripts[background_choices[read_num]]
+                bam_ofh.write(
+                    make_alignment(bam_ofh, chrom_to_tid[chrom], read_name, seq, exons, 0, 0, 0)
+                )
+
+            elif read_type == 1:
+                read_name = "fusion_read{}".format(read_num)
+                geneA, geneB, _ = fusion_pairs[fusion_choices[read_num]]
+                seq = write_fusion_read(
+                    bam_ofh, gff3_ofh, chrom_to_tid, genome, read_name, geneA, geneB, read_num
+                )
+                write_FI_contig_alignment(
+                    FI_bam_ofh, FI_contig_to_tid, read_name, seq, geneA, geneB, read_num
+                )
+
+            else:
+                fixture_name, seq = fixture_reads[read_num % len(fixture_reads)]
+                read_name = "{}.bm{}".format(fixture_name, read_num // len(fixture_reads))
+
+            reads_ofh.write(">{}\n{}\n".format(read_name, seq))
+
+    write_FI_targets(genome, fusion_pairs, inputs_dir)
+
+    # no seq-similar regions among the synthetic genes
+    open(os.path.join(inputs_dir, "LR-FI_targets.seqsimilar_regions.gff3"), "wt").close()
+
+    open(done_file, "wt").close()
+
+    return inputs_dir
+
+
+def make_alignment(bam_ofh, tid, read_name, seq, exons, left_clip, right_clip, flag):
+
+    cigar = list()
+    if left_clip:
+        cigar.append((4, left_clip))  # S
+    for i, (lend, rend) in enumerate(exons):
+        if i > 0:
+            cigar.append((3, lend - exons[i - 1][1] - 1))  # N
+        cigar.append((0, rend - lend + 1))  # M
+    if right_clip:
+        cigar.append((4, right_clip))
+
+    align = pysam.AlignedSegment(bam_ofh.header)
+    align.query_name = read_name
+    align.flag = flag
+    align.reference_id = tid
+    align.reference_start = exons[0][0] - 1
+    align.mapping_quality = 60
+    align.cigar = cigar
+    align.query_sequence = seq
+    align.set_tag("NM", 0)
+
+    return align
+
+
+def get_fusion_read_exons(geneA, geneB, read_num):
+    """
+    fusion reads join the leading exons of a geneA isoform with the trailing exons of a geneB isoform,
+    at one of a few breakpoints per fusion pair.
+    """
+
+    transA = geneA["transcripts"][read_num % 2]
+    transB = geneB["transcripts"][(read_num // 2) % 2]
+
+    breakA = 2 + read_num % 2
+    breakB = 1 + (read_num // 3) % 2
+
+    return transA[:breakA], transB[breakB:]
+
+
+def write_fusion_read(bam_ofh, gff3_ofh, chrom_to_tid, genome, read_name, geneA, geneB, read_num):
+
+    exonsA, exonsB = get_fusion_read_exons(geneA, geneB, read_num)
+
+    seqA = genome.get_seq(geneA["chrom"], exonsA)
+    seqB = genome.get_seq(geneB["chrom"], exonsB)
+    seq = seqA + seqB
+
+    alignA = make_alignment(
+        bam_ofh, chrom_to_tid[geneA["chrom"]], read_name, seq, exonsA, 0, len(seqB), 0
+    )
+    alignB = make_alignment(
+        bam_ofh, chrom_to_tid[geneB["chrom"]], read_name, seq, exonsB, len(seqA), 0, 2048
+    )
+    alignA.set_tag("SA", "{},{},+,{},60,0;".format(geneB["chrom"], exonsB[0][0], alignB.cigarstring))
+    alignB.set_tag("SA", "{},{},+,{},60,0;".format(geneA["chrom"], exonsA[0][0], alignA.cigarstring))
+    bam_ofh.write(alignA)
+    bam_ofh.write(alignB)
+
+    # alignment to the fusion contig
+    scaffold = get_FI_contig_name(geneA, geneB)
+    contig_exons = [
+        to_FI_contig_coords(geneA, geneB, lend, rend, is_geneB)
+        for (is_geneB, exons) in ((False, exonsA), (True, exonsB))
+        for (lend, rend) in exons
+    ]
+    read_pos = 0
+    for (lend, rend) in contig_exons:
+        seg_len = rend - lend + 1
+        gff3_ofh.write(
+            "\t".join(
+                [
+                    scaffold,
+                    "Minimap2",
+                    "cDNA_match",
+                    str(lend),
+                    str(rend),
+                    "100",
+                    "+",
+                    ".",
+                    "ID={0}.p1;Target={0} {1} {2} +".format(read_name, read_pos + 1, read_pos + seg_len),
+                ]
+            )
+            + "\n"
+        )
+        read_pos += seg_len
+
+    return seq
+
+
+def write_FI_contig_alignment(FI_bam_ofh, FI_contig_to_tid, read_name, seq, geneA, geneB, read_num):
+
+    exonsA, exonsB = get_fusion_read_exons(geneA, geneB, read_num)
+    contig_exons = [to_FI_contig_coords(geneA, geneB, lend, rend, False) for (lend, rend) in exonsA] + [
+        to_FI_contig_coords(geneA, geneB, lend, rend, True) for (lend, rend) in exonsB
+    ]
+
+    FI_bam_ofh.write(
+        make_alignment(
+            FI_bam_ofh, FI_contig_to_tid[get_FI_contig_name(geneA, geneB)], read_name, seq, contig_exons, 0, 0, 0
+        )
+    )
+
+
+def get_FI_contig_name(geneA, geneB):
+    return "{}--{}".format(geneA["gene_name"], geneB["gene_name"])
+
+
+def get_FI_contig_length(geneA, geneB):
+
+    geneB_end = max(rend for exons in geneB["transcripts"] for (lend, rend) in exons)
+
+    return to_FI_contig_coords(geneA, geneB, geneB_end, geneB_end, True)[1] + FI_CONTIG_FLANK
+
+
+def to_FI_contig_coords(geneA, geneB, lend, rend, is_geneB):
+
+    geneA_start = geneA["transcripts"][0][0][0]
+    geneA_end = geneA["transcripts"][0][-1][1]
+
+    if is_geneB:
+        offset = (
+            geneB["transcripts"][0][0][0]
+            - (geneA_end - geneA_start + 1)
+            - FI_CONTIG_FLANK
+            - FI_CONTIG_GENE_GAP
+            - 1
+        )
+    else:
+        offset = geneA_start - FI_CONTIG_FLANK - 1
+
+    return (lend - offset, rend - offset)
+
+
+def write_FI_targets(genome, fusion_pairs, inputs_dir):
+
+    with open(os.path.join(inputs_dir, "LR-FI_targets.gtf"), "wt") as ofh:
+        for geneA, geneB, _ in fusion_pairs:
+            scaffold = get_FI_contig_name(geneA, geneB)
+            for is_geneB, gene in ((False, geneA), (True, geneB)):
+                for t, exons in enumerate(gene["transcripts"]):
+                    for (lend, rend) in exons:
+                        contig_lend, contig_rend = to_FI_contig_coords(geneA, geneB, lend, rend, is_geneB)
+                        info = 'gene_id "{0}"; transcript_id "{0}.t{1}"; gene_name "{0}"; orig_coord_info "{2},{3},{4},+";'.format(
+                            gene["gene_name"], t + 1, gene["chrom"], lend, rend
+                        )
+                        ofh.write(
+                            "\t".join(
+                                [scaffold, "bench", "exon", str(contig_lend), str(contig_rend), ".", "+", ".", info]
+                            )
+                            + "\n"
+                        )
+
+
+if __name__ == "__main__":
+    main()
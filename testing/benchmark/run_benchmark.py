@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+
+import sys, os, re
+import logging
+import argparse
+import json
+import platform
+import subprocess
+import time
+import statistics
+
+import make_benchmark_data
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s : %(levelname)s : %(message)s",
+    datefmt="%H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+## Runs the ctat-LR-fusion python/perl pipeline stages on the scaled benchmark inputs
+## (see make_benchmark_data.py) and records per-stage wall time, cpu time, peak RSS,
+## and bytes read/written to a json report.  Compare reports via compare_benchmarks.py
+##
+## ie.
+##    ./run_benchmark.py --num_reads 100k,1M --output bench.json
+##    ./compare_benchmarks.py --baseline baseline.json --current bench.json
+
+
+BENCHMARK_REPORT_VERSION = 1
+
+RSS_SAMPLE_INTERVAL = 0.02  # seconds
+
+BENCHDIR = os.path.dirname(os.path.abspath(__file__))
+UTILDIR = os.path.abspath(os.path.join(BENCHDIR, "../../util"))
+
+STAGE_NAMES = [
+    "annot_index",
+    "build_read_store",
+    "extract_chimeric_alignments",
+    "chims_described",
+    "identify_prelim_candidates",
+    "retrieve_candidate_reads",
+    "LR-FI_fusion_align_extractor",
+    "LR_FI_bam_fusion_extractor",
+    "filter_LR_fusions",
+]
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="run the ctat-LR-fusion stage benchmark",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument(
+        "--num_reads",
+        type=str,
+        default="100k",
+        help="comma-delimited numbers of reads to benchmark (k/M suffixes allowed, ie. 100k,1M,10M)",
+    )
+    parser.add_argument(
+        "--data_dir",
+        type=str,
+        default=os.path.join(BENCHDIR, "benchmark_data"),
+        help="benchmark input data directory (inputs are built once and reused)",
+    )
+    parser.add_argument(
+        "--work_dir",
+        type=str,
+        default=os.path.join(BENCHDIR, "benchmark_work"),
+        help="directory for stage outputs",
+    )
+    parser.add_argument("--output", type=str, required=True, help="benchmark json report filename")
+    parser.add_argument("--CPU", type=int, default=4, help="number of threads for multithreaded stages")
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        default=1,
+        help="number of times to run each scale, the median measurements are reported",
+    )
+    parser.add_argument(
+        "--stages",
+        type=str,
+        default=None,
+        help="comma-delimited subset of stages to run (default: all). Stages: " + ",".join(STAGE_NAMES),
+    )
+
+    args = parser.parse_args()
+
+    stages_want = set(args.stages.split(",")) if args.stages else set(STAGE_NAMES)
+    unknown_stages = stages_want - set(STAGE_NAMES)
+    if unknown_stages:
+        raise RuntimeError("Error, unrecognized stages: {}".format(", ".join(sorted(unknown_stages))))
+
+    genome_lib_dir = make_benchmark_data.build_mini_genome_lib(args.data_dir)
+
+    report = {
+        "benchmark_report_version": BENCHMARK_REPORT_VERSION,
+        "benchmark_data_version": make_benchmark_data.BENCHMARK_DATA_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": get_git_commit(),
+        "host": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+        },
+        "CPU": args.CPU,
+        "scales": dict(),
+    }
+
+    for num_reads in make_benchmark_data.parse_num_reads(args.num_reads):
+
+        inputs_dir = make_benchmark_data.build_scaled_inputs(
+            args.data_dir,
+            genome_lib_dir,
+            num_reads,
+            make_benchmark_data.DEFAULT_FIXTURES_DIR,
+            make_benchmark_data.DEFAULT_FIXTURE_READ_FRAC,
+            make_benchmark_data.DEFAULT_FUSION_READ_FRAC,
+        )
+
+        stage_runs = list()
+        for repeat in range(args.repeats):
+            work_dir = os.path.join(args.work_dir, "reads_{}".format(num_reads))
+            stage_runs.append(
+                run_stages(
+                    get_stage_cmds(genome_lib_dir, inputs_dir, work_dir, num_reads, args.CPU),
+                    stages_want,
+                    work_dir,
+                )
+            )
+
+        report["scales"][str(num_reads)] = {
+            "num_reads": num_reads,
+            "repeats": args.repeats,
+            "stages": summarize_stage_runs(stage_runs),
+        }
+
+    with open(args.output, "wt") as ofh:
+        json.dump(report, ofh, indent=2)
+        ofh.write("\n")
+
+    logger.info("-wrote benchmark report: {}".format(args.output))
+
+    sys.exit(0)
+
+
+def get_git_commit():
+
+    try:
+        return subprocess.check_output(
+            ["git", "-C", BENCHDIR, "rev-parse", "HEAD"], stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (subprocess.CalledProcessError, OSError):
+        return None
+
+
+def get_stage_cmds(genome_lib_dir, inputs_dir, work_dir, num_reads, CPU):
+    """
+    returns list of (stage name, command), in run order, mirroring the ctat-LR-fusion invocations.
+    """
+
+    annot_gtf = os.path.join(genome_lib_dir, "ref_annot.gtf")
+    annot_index = os.path.join(work_dir, "ref_annot.gtf.annot_idx")
+    reads_fa = os.path.join(inputs_dir, "reads.fa")
+    read_store = os.path.join(work_dir, "reads.store.fa.gz")
+    chim_bam = os.path.join(work_dir, "mm2.chim_align.bam")
+    chims_described = os.path.join(work_dir, "mm2.chims_described")
+    chims_columnar = chims_described + ".columnar"
+    candidates_prefix = os.path.join(work_dir, "chimeric_read_candidates")
+    FI_listing = candidates_prefix + ".preliminary_candidates_info_from_chims_described.read_support_filtered"
+    fusion_transcripts = os.path.join(work_dir, "LR-FI.mm2.fusion_transcripts")
+    bam_fusion_transcripts = os.path.join(work_dir, "LR-FI.mm2.bam.fusion_transcripts")
+
+    return [
+        ("annot_index", [os.path.join(UTILDIR, "annot_index.py"), "--annot_gtf", annot_gtf, "--index_dir", annot_index]),
+        (
+            "build_read_store",
+            [os.path.join(UTILDIR, "build_read_store.py"), "--reads", reads_fa, "--store", read_store, "--threads", str(CPU)],
+        ),
+        (
+            "extract_chimeric_alignments",
+            [
+                os.path.join(UTILDIR, "extract_chimeric_alignments_from_bam.py"),
+                "--input_bam", os.path.join(inputs_dir, "aligned.bam"),
+                "--output_bam", chim_bam,
+                "--threads", str(CPU),
+            ],
+        ),
+        (
+            "chims_described",
+            [
+                os.path.join(UTILDIR, "chim_bam_to_chims_described.py"),
+                "--chim_bam", chim_bam,
+                "--annot_gtf", annot_gtf,
+                "--annot_index", annot_index,
+                "--min_per_id", "70",
+                "--output", chims_described,
+                "--columnar_output", chims_columnar,
+            ],
+        ),
+        (
+            "identify_prelim_candidates",
+            [
+                os.path.join(UTILDIR, "identify_prelim_fusion_transcript_candidates.pl"),
+                "--chims_columnar", chims_columnar,
+                "--max_exon_delta", "50",
+                "--max_foldback_frac", "0.5",
+                "--num_total_reads", str(num_reads),
+                "--min_num_LR", "1",
+                "--min_FFPM", "0.06",
+                "--output_prefix", candidates_prefix,
+            ],
+        ),
+        (
+            "retrieve_candidate_reads",
+            [
+                os.path.join(UTILDIR, "retrieve_reads_for_fusion_transcript_candidates.pl"),
+                "--chims_columnar", chims_columnar,
+                "--reads", reads_fa,
+                "--fusions", FI_listing,
+                "--output_prefix", candidates_prefix,
+                "--read_store", read_store,
+                "--CPU", str(CPU),
+            ],
+        ),
+        (
+            "LR-FI_fusion_align_extractor",
+            [
+                os.path.join(UTILDIR, "LR-FI_fusion_align_extractor.pl"),
+                "--FI_gtf", os.path.join(inputs_dir, "LR-FI_targets.gtf"),
+                "--LR_gff3", os.path.join(inputs_dir, "LR-FI.mm2.gff3"),
+                "--seq_similar_gff3", os.path.join(inputs_dir, "LR-FI_targets.seqsimilar_regions.gff3"),
+                "--output_prefix", fusion_transcripts,
+                "--snap_dist", "3",
+                "--min_trans_overlap_length", "100",
+            ],
+        ),
+        (
+            "LR_FI_bam_fusion_extractor",
+            [
+                os.path.join(UTILDIR, "LR_FI_bam_fusion_extractor.py"),
+                "--FI_gtf", os.path.join(inputs_dir, "LR-FI_targets.gtf"),
+                "--LR_bam", os.path.join(inputs_dir, "LR-FI.mm2.bam"),
+                "--seq_similar_gff3", os.path.join(inputs_dir, "LR-FI_targets.seqsimilar_regions.gff3"),
+                "--output_prefix", bam_fusion_transcripts,
+                "--snap_dist", "3",
+                "--min_trans_overlap_length", "100",
+            ],
+        ),
+        (
+            "filter_LR_fusions",
+            [
+                os.path.join(UTILDIR, "filter_LR_fusions.py"),
+                "--fusions_input", fusion_transcripts + ".breakpoint_info.tsv",
+                "--num_LR_total", str(num_reads),
+                "--filtered_fusions_output", fusion_transcripts + ".breakpoint_info.tsv.filtered",
+            ],
+        ),
+    ]
+
+
+def run_stages(stage_cmds, stages_want, work_dir):
+    """
+    returns dict of stage name -> measurements
+    """
+
+    os.makedirs(work_dir, exist_ok=True)
+
+    stage_stats = dict()
+
+    for stage_name, cmd in stage_cmds:
+
+        if stage_name not in stages_want:
+            continue
+
+        log_filename = os.path.join(work_dir, "{}.log".format(stage_name))
+        stdout_filename = os.path.join(work_dir, "{}.stdout".format(stage_name))
+
+        logger.info("-running stage {}".format(stage_name))
+
+        stats = run_measured_cmd(cmd, stdout_filename, log_filename)
+
+        if stats["exit_code"] != 0:
+            raise RuntimeError(
+                "Error, benchmark stage {} failed (exit code {}), see: {}".format(
+                    stage_name, stats["exit_code"], log_filename
+                )
+            )
+
+        logger.info(
+            "   {}: wall {:.2f} s, cpu {:.2f} s, max RSS {:.1f} MB".format(
+                stage_name, stats["wall_sec"], stats["cpu_sec"], stats["max_rss_mb"]
+            )
+        )
+
+        stage_stats[stage_name] = stats
+
+    return stage_stats
+
+
+def run_measured_cmd(cmd, stdout_filename, log_filename):
+    """
+    runs the command, returning its wall time and the resource usage of it and its descendants
+
+    The peak RSS is sampled from /proc over the command's process tree rather than taken from
+    the rusage ru_maxrss, which on linux carries over the RSS of this (forking) process.
+    """
+
+    max_rss_kb = 0
+
+    with open(stdout_filename, "wb") as stdout_fh, open(log_filename, "wb") as log_fh:
+        start_time = time.time()
+        process = subprocess.Popen(cmd, stdout=stdout_fh, stderr=log_fh)
+        while True:
+            max_rss_kb = max(max_rss_kb, get_process_tree_peak_rss_kb(process.pid))
+            pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+            if pid != 0:
+                break
+            time.sleep(RSS_SAMPLE_INTERVAL)
+        wall_sec = time.time() - start_time
+        process.returncode = os.waitstatus_to_exitcode(status)
+
+    return {
+        "wall_sec": wall_sec,
+        "user_sec": rusage.ru_utime,
+        "sys_sec": rusage.ru_stime,
+        "cpu_sec": rusage.ru_utime + rusage.ru_stime,
+        "max_rss_mb": max_rss_kb / 1024,
+        "read_bytes": rusage.ru_inblock * 512,
+        "write_bytes": rusage.ru_oublock * 512,
+        "exit_code": process.returncode,
+    }
+
+
+def get_process_tree_peak_rss_kb(root_pid):
+    """
+    returns the peak RSS (kB) of the process tree rooted at root_pid, as the larger of the current
+    RSS summed over the tree and the high-water RSS (VmHWM, reset upon exec) of any one process in it.
+
+    Processes exiting between samples (see RSS_SAMPLE_INTERVAL) are not captured.
+    """
+
+    children = dict()
+    for proc_pid in os.listdir("/proc"):
+        if not proc_pid.isdigit():
+            continue
+        try:
+            with open("/proc/{}/stat".format(proc_pid), "rt") as fh:
+                stat = fh.read()
+        except OSError:
+            continue
+        # ppid follows the parenthesized command name, which may contain spaces
+        ppid = int(stat[stat.rindex(")") + 1 :].split()[1])
+        children.setdefault(ppid, list()).append(int(proc_pid))
+
+    tree = [root_pid]
+    for proc_pid in tree:
+        tree.extend(children.get(proc_pid, []))
+
+    sum_rss_kb = 0
+    max_hwm_kb = 0
+    for proc_pid in tree:
+        try:
+            with open("/proc/{}/status".format(proc_pid), "rt") as fh:
+                status = dict(line.split(":", 1) for line in fh if ":" in line)
+        except OSError:
+            continue
+        if "VmRSS" in status:
+            sum_rss_kb += int(status["VmRSS"].split()[0])
+            max_hwm_kb = max(max_hwm_kb, int(status["VmHWM"].split()[0]))
+
+    return max(sum_rss_kb, max_hwm_kb)
+
+
+def summarize_stage_runs(stage_runs):
+    """
+    median of each measurement across the repeated runs
+    """
+
+    summary = dict()
+    for stage_name in stage_runs[0]:
+        summary[stage_name] = {
+            measure: statistics.median([run[stage_name][measure] for run in stage_runs])
+            for measure in stage_runs[0][stage_name]
+        }
+
+    return summary
+
+
+if __name__ == "__main__":
+    main()
@@ -78,6 +78,8 @@ my $DONOR_TYPE = "DONOR";
 my $ACCEPTOR_TYPE = "ACCEPTOR";
 my $NA_TYPE = "NA";
 
+my %BREAKPOINT_INFERENCE_CACHE; # (scaffold, local breakpoint, splice site type) => inferred breakpoint info
+
 main: {
     
     my %orig_coord_info;
@@ -454,7 +456,7 @@ sub report_LR_fusions {
         my $scaffold_orig_coord_info_href = $orig_coord_info_href->{$scaffold};
         my $scaffold_coordinate_mappings_aref = $scaffold_to_orig_coords_href->{$scaffold};
 
-        my ($adj_break_lend, $left_genome_breakpoint, $left_ref_splice_mapping) = &infer_genome_breakpoint_from_local_coord($break_lend, 
+        my ($adj_break_lend, $left_genome_breakpoint, $left_ref_splice_mapping) = &infer_genome_breakpoint_from_local_coord($scaffold, $break_lend, 
                                                                                                                             $scaffold_orig_coord_info_href, 
                                                                                                                             $scaffold_coordinate_mappings_aref,
                                                                                                                             $DONOR_TYPE,
@@ -463,7 +465,7 @@ sub report_LR_fusions {
         # in case it snapped:
         $break_lend = $adj_break_lend;
 
-        my ($adj_break_rend, $right_genome_breakpoint, $right_ref_splice_mapping)  = &infer_genome_breakpoint_from_local_coord($break_rend, 
+        my ($adj_break_rend, $right_genome_breakpoint, $right_ref_splice_mapping)  = &infer_genome_breakpoint_from_local_coord($scaffold, $break_rend, 
                                                                                                                                $scaffold_orig_coord_info_href, 
                                                                                                                                $scaffold_coordinate_mappings_aref,
                                                                                                                                $ACCEPTOR_TYPE,
@@ -630,6 +632,24 @@ sub organize_original_coordinate_info {
 
 
 sub infer_genome_breakpoint_from_local_coord {
+    my ($scaffold, $break_coord, $scaffold_orig_coord_info_href, $scaffold_coordinate_mappings_aref, $SPLICE_SITE_TYPE, $SNAP_dist) = @_;
+
+    # many reads share breakpoints
+    my $cache_key = join("$;", $scaffold, $break_coord, $SPLICE_SITE_TYPE);
+    unless (exists $BREAKPOINT_INFERENCE_CACHE{$cache_key}) {
+        $BREAKPOINT_INFERENCE_CACHE{$cache_key} = [ &_infer_genome_breakpoint_from_local_coord($break_coord,
+                                                                                                 $scaffold_orig_coord_info_href,
+                                                                                                 $scaffold_coordinate_mappings_aref,
+                                                                                                 $SPLICE_SITE_TYPE,
+                                                                                                 $SNAP_dist) ];
+    }
+
+    return(@{$BREAKPOINT_INFERENCE_CACHE{$cache_key}});
+}
+
+
+####
+sub _infer_genome_breakpoint_from_local_coord {
     my ($break_coord, $scaffold_orig_coord_info_href, $scaffold_coordinate_mappings_aref, $SPLICE_SITE_TYPE, $SNAP_dist) = @_;
 
     my $struct = $scaffold_orig_coord_info_href->{$break_coord};
@@ -644,42 +664,50 @@ sub infer_genome_breakpoint_from_local_coord {
     else {
         
         # map to closest coordinate.
-        my @closest_structs;
-        
-        foreach my $struct (@$scaffold_coordinate_mappings_aref) {
-            my $contig_coord = $struct->{contig_coord};
-            my $delta = $break_coord - $contig_coord;
+        # The coordinate mappings are ordered by contig coordinate, so walk outwards from the breakpoint
+        # (located by binary search), visiting mappings in order of distance (ties to the lower coordinate).
+        my $right_idx = &lower_bound_contig_coord($scaffold_coordinate_mappings_aref, $break_coord);
+        my $left_idx = $right_idx - 1;
 
-            push (@closest_structs, { struct => $struct,
-                                      delta => $delta,
-                                      abs_delta => abs($delta) } );
+        my $next_closest_struct = sub {
+            my $left_dist = ($left_idx >= 0) ? $break_coord - $scaffold_coordinate_mappings_aref->[$left_idx]->{contig_coord} : undef;
+            my $right_dist = ($right_idx <= $#$scaffold_coordinate_mappings_aref) ? $scaffold_coordinate_mappings_aref->[$right_idx]->{contig_coord} - $break_coord : undef;
 
-        }
-        @closest_structs = sort {$a->{abs_delta}<=>$b->{abs_delta}} @closest_structs;
+            if (defined($left_dist) && ( (! defined($right_dist)) || $left_dist <= $right_dist) ) {
+                return($scaffold_coordinate_mappings_aref->[$left_idx--]);
+            }
+            elsif (defined($right_dist)) {
+                return($scaffold_coordinate_mappings_aref->[$right_idx++]);
+            }
+            else {
+                return(undef);
+            }
+        };
 
-        my $closest_struct = $closest_structs[0];
-        shift @closest_structs;
+        my $closest_struct = &$next_closest_struct();
         
         # keep searching if not a matched splice type
-        if ($closest_struct->{struct}->{splice_junc} ne $SPLICE_SITE_TYPE) {
-            foreach my $other_struct (@closest_structs) {
-                if ($other_struct->{abs_delta} > $SNAP_dist) {
+        if ($closest_struct->{splice_junc} ne $SPLICE_SITE_TYPE) {
+            while (my $other_struct = &$next_closest_struct()) {
+                if (abs($break_coord - $other_struct->{contig_coord}) > $SNAP_dist) {
                     last;
                 }
-                if ($other_struct->{struct}->{splice_junc} eq $SPLICE_SITE_TYPE) {
+                if ($other_struct->{splice_junc} eq $SPLICE_SITE_TYPE) {
                     # take it instead
                     $closest_struct = $other_struct;
                     last;
                 }
             }
         }
+
+        my $delta = $break_coord - $closest_struct->{contig_coord};
         
-        my $chrom = $closest_struct->{struct}->{chrom};
-        my $orient = $closest_struct->{struct}->{orient};
+        my $chrom = $closest_struct->{chrom};
+        my $orient = $closest_struct->{orient};
         my $coord;
-        if ($closest_struct->{abs_delta} <= $SNAP_dist && $closest_struct->{struct}->{splice_junc} eq $SPLICE_SITE_TYPE) {
-            $coord = $closest_struct->{struct}->{coord};
-            my $adj_break = $closest_struct->{struct}->{contig_coord};
+        if (abs($delta) <= $SNAP_dist && $closest_struct->{splice_junc} eq $SPLICE_SITE_TYPE) {
+            $coord = $closest_struct->{coord};
+            my $adj_break = $closest_struct->{contig_coord};
             
             if ($DEBUG) { print STDERR "Snapping $break_coord -> $adj_break\n"; }
 
@@ -687,32 +715,50 @@ sub infer_genome_breakpoint_from_local_coord {
         }
         else {
             if ($orient eq '+') {
-                $coord = $closest_struct->{struct}->{coord} + $closest_struct->{delta};
+                $coord = $closest_struct->{coord} + $delta;
             }
             else {
-                $coord = $closest_struct->{struct}->{coord} - $closest_struct->{delta};
+                $coord = $closest_struct->{coord} - $delta;
             }
 
             if ($DEBUG) { 
                 print STDERR "No snap, here\'s delta info: $chrom:$coord:$orient\tbreak_coord: $break_coord\tsmallest_delta: "
-                    . $closest_struct->{delta} . "\tcontig_info: " . Dumper($closest_struct);
+                    . $delta . "\tcontig_info: " . Dumper($closest_struct);
             }
 
             return($break_coord, "$chrom:$coord:$orient", 0);
         }
-        
-        
-        
     }
     
 }
 
 
+####
+sub lower_bound_contig_coord {
+    my ($coordinate_mappings_aref, $coord) = @_;
+
+    ## index of the first mapping at or beyond coord (contig coordinate ordered)
+    my ($lo, $hi) = (0, scalar(@$coordinate_mappings_aref));
+    while ($lo < $hi) {
+        my $mid = int( ($lo + $hi) / 2);
+        if ($coordinate_mappings_aref->[$mid]->{contig_coord} < $coord) {
+            $lo = $mid + 1;
+        }
+        else {
+            $hi = $mid;
+        }
+    }
+
+    return($lo);
+}
+
+
 ####
 sub merge_identical_breakpoints {
     my (@fusion_structs) = @_;
 
     my %fusion_token_to_consolidated_fusions;
+    my @consolidated_fusions; # retain input order, for deterministic ordering of ties in the report
 
     foreach my $fusion (@fusion_structs) {
         my $token = join("$;", 
@@ -733,10 +779,11 @@ sub merge_identical_breakpoints {
         }
         else {
             $fusion_token_to_consolidated_fusions{$token} = $fusion;
+            push (@consolidated_fusions, $fusion);
         }
     }
     
-    return (values %fusion_token_to_consolidated_fusions);
+    return (@consolidated_fusions);
 }
 
 
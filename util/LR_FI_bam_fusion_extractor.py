@@ -0,0 +1,807 @@
+#!/usr/bin/env python3
+
+import sys, os, re
+import logging
+import argparse
+import bisect
+import heapq
+import tempfile
+import time
+from collections import defaultdict
+import pysam
+
+from extract_chimeric_alignments_from_bam import group_reads_by_name
+from chim_bam_to_chims_described import reads_to_gxf_alignments
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s : %(levelname)s : %(message)s",
+    datefmt="%H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+## Streams the phase-2 long read alignments to the fusion contigs (LR-FI.mm2.bam, as output by minimap2,
+## grouped by read name) directly into the LR-FI_fusion_align_extractor.pl outputs, replacing the round trip:
+##
+##    [samtools view | awk '$3 ~ /--/' (genome decoy)] | SAM_to_gxf.pl --format gff3 --allow_non_primary | LR-FI_fusion_align_extractor.pl
+##
+## Reads are evaluated one at a time, retaining only the fusion breakpoint support in memory,
+## and the outputs are identical to those of the extractor:
+##
+##    stdout                                                : #LRFusionTranscript records, sorted by read, breakpoint
+##    <output_prefix>.breakpoint_info.tsv                   : fusion breakpoint summary
+##    <output_prefix>.gff3                                  : fusion read alignments (as per SAM_to_gxf.pl)
+##    <output_prefix>.LR-FI_fusion_align_extractor-filtered-log
+##
+## With --encode_read_ids, the breakpoint_info.tsv LR_accessions list integer read IDs instead of the
+## read names (the ordinal of the read in the bam, or as tagged in the shard bams split by
+## partition_LR-FI_by_fusion_shards.py, so shards of the same bam agree), with the
+## read names of those IDs in:
+##
+##    <output_prefix>.read_ids.tsv                          : read_id, read_name (see expand_read_ids.py)
+
+
+DONOR_TYPE = "DONOR"
+ACCEPTOR_TYPE = "ACCEPTOR"
+NA_TYPE = "NA"
+
+FILTERED_LOG_SUFFIX = ".LR-FI_fusion_align_extractor-filtered-log"
+READ_IDS_SUFFIX = ".read_ids.tsv"
+READ_ORDINAL_TAG = "ZO"  # ordinal of the read in the unsplit bam, as tagged on shard bam records
+LOG_SPILL_ENTRIES = 1000000  # filtered-log entries held in memory before sorting to a temp file
+
+PROGRESS_INTERVAL = 15  # seconds
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="extract fusion read evidence directly from the long read alignments to the fusion contigs",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument("--FI_gtf", type=str, required=True, help="FI contigs gtf filename")
+    parser.add_argument(
+        "--LR_bam", type=str, required=True, help="LR alignments to the FI contigs, grouped by read name"
+    )
+    parser.add_argument("--seq_similar_gff3", type=str, required=True, help="seq-similar regions gff3 file")
+    parser.add_argument(
+        "--min_trans_overlap_length",
+        type=int,
+        required=True,
+        help="minimum read overlap length for each gene in the fusion pair",
+    )
+    parser.add_argument("--output_prefix", type=str, required=True, help="prefix for output files")
+    parser.add_argument(
+        "--snap_dist",
+        type=int,
+        required=True,
+        help="if breakpoint is at most this distance from a reference exon boundary, position gets snapped to the splice site",
+    )
+    parser.add_argument(
+        "--fusion_contigs_only",
+        action="store_true",
+        default=False,
+        help="only consider alignments to the fusion contigs (named geneA--geneB), ie. ignoring the genome decoy",
+    )
+    parser.add_argument("--threads", type=int, default=1, help="number of bam decompression threads")
+    parser.add_argument(
+        "--encode_read_ids",
+        action="store_true",
+        default=False,
+        help="report integer read IDs as the LR_accessions, writing the read names to <output_prefix>"
+        + READ_IDS_SUFFIX,
+    )
+
+    args = parser.parse_args()
+
+    fusion_contigs = FusionContigAnnotations(args.FI_gtf, args.seq_similar_gff3)
+
+    filtered_log = FilteredLog(args.output_prefix + FILTERED_LOG_SUFFIX)
+    for scaffold, message in fusion_contigs.eliminated_scaffolds.items():
+        filtered_log.add(scaffold, None, message)
+
+    with pysam.AlignmentFile(args.LR_bam, "rb", check_sq=False, threads=args.threads) as bamreader, open(
+        args.output_prefix + ".gff3", "wt"
+    ) as gff3_ofh:
+
+        LR_fusion_trans_ids, scaffolds_with_reads, read_ids = extract_fusion_reads(
+            bamreader,
+            fusion_contigs,
+            args.min_trans_overlap_length,
+            args.fusion_contigs_only,
+            filtered_log,
+            gff3_ofh,
+        )
+
+    for scaffold in fusion_contigs.scaffolds:
+        if scaffold not in fusion_contigs.eliminated_scaffolds and scaffold not in scaffolds_with_reads:
+            filtered_log.add(scaffold, None, "{} has no LR reads aligned.".format(scaffold))
+
+    filtered_log.close()
+
+    if args.encode_read_ids:
+        write_read_ids(read_ids, args.output_prefix + READ_IDS_SUFFIX)
+    else:
+        read_ids = None
+
+    report_LR_fusions(LR_fusion_trans_ids, fusion_contigs, args.snap_dist, args.output_prefix, sys.stdout, read_ids)
+
+    logger.info("-done")
+
+    sys.exit(0)
+
+
+####################
+## fusion contig annotations
+
+
+class FusionContigAnnotations:
+    """
+    The gene structures and original (genome) coordinate mappings of each fusion contig,
+    as prepared by LR-FI_fusion_align_extractor.pl
+    """
+
+    def __init__(self, FI_gtf_filename, seq_similar_gff3_filename):
+
+        # scaffold -> gene -> [ (lend, rend), ...]
+        self.scaffold_to_gene_coordsets = dict()
+        # scaffold -> gene -> transcript -> [ (lend, rend), ...]
+        self.scaffold_to_gene_trans_to_coordsets = dict()
+        # scaffold -> contig coord -> coordinate mapping info
+        self.orig_coord_info = dict()
+
+        self._parse_FI_gtf(FI_gtf_filename)
+
+        # scaffold -> coordinate mapping infos, ordered by contig coordinate
+        self.scaffold_to_orig_coords = {
+            scaffold: [coord_info[coord] for coord in sorted(coord_info)]
+            for scaffold, coord_info in self.orig_coord_info.items()
+        }
+        # scaffold -> the sorted contig coordinates of the above, for binary search
+        self.scaffold_to_contig_coords = {
+            scaffold: sorted(coord_info) for scaffold, coord_info in self.orig_coord_info.items()
+        }
+
+        # (scaffold, local breakpoint, splice site type) -> inferred breakpoint info
+        self.breakpoint_inference_cache = dict()
+
+        seqsimilar_regions = parse_seqsimilar_gff3(seq_similar_gff3_filename)
+
+        self.scaffolds = sorted(self.scaffold_to_gene_coordsets.keys())
+
+        # scaffold -> (left gene, right gene, geneA_max, geneB_min, transA coords, transB coords)
+        self.scaffold_gene_structs = dict()
+        self.eliminated_scaffolds = dict()
+
+        for scaffold in self.scaffolds:
+
+            left_gene, right_gene = scaffold.split("--")[0:2]
+
+            genes = self.scaffold_to_gene_coordsets[scaffold]
+            if len(genes) != 2:
+                raise RuntimeError(
+                    "Error, dont have only two genes for scaffold: {}: {}".format(scaffold, sorted(genes))
+                )
+
+            geneA_coords, geneB_coords = [
+                set(coord for coordpair in genes[gene] for coord in coordpair) for gene in (left_gene, right_gene)
+            ]
+
+            transA_all_coords, transB_all_coords = [
+                get_trans_coordsets_single_gene(self.scaffold_to_gene_trans_to_coordsets[scaffold].get(gene, dict()))
+                for gene in (left_gene, right_gene)
+            ]
+
+            if scaffold in seqsimilar_regions:
+                transA_all_coords = exclude_seqsimilar_regions(transA_all_coords, seqsimilar_regions[scaffold])
+                transB_all_coords = exclude_seqsimilar_regions(transB_all_coords, seqsimilar_regions[scaffold])
+
+            if not (transA_all_coords and transB_all_coords):
+                message = "{} eliminated as candidate due to no surviving transcript exons after seq-similar region exclusions".format(
+                    scaffold
+                )
+                logger.warning("-warning, " + message)
+                self.eliminated_scaffolds[scaffold] = message
+                continue
+
+            self.scaffold_gene_structs[scaffold] = (
+                left_gene,
+                right_gene,
+                max(geneA_coords),
+                min(geneB_coords),
+                collapse_overlapping_trans_segments(transA_all_coords),
+                collapse_overlapping_trans_segments(transB_all_coords),
+            )
+
+    def infer_genome_breakpoint(self, scaffold, break_coord, splice_site_type, snap_dist):
+
+        # many reads share breakpoints
+        cache_key = (scaffold, break_coord, splice_site_type)
+        if cache_key not in self.breakpoint_inference_cache:
+            self.breakpoint_inference_cache[cache_key] = infer_genome_breakpoint_from_local_coord(
+                break_coord,
+                self.orig_coord_info[scaffold],
+                self.scaffold_to_orig_coords[scaffold],
+                self.scaffold_to_contig_coords[scaffold],
+                splice_site_type,
+                snap_dist,
+            )
+
+        return self.breakpoint_inference_cache[cache_key]
+
+    def _parse_FI_gtf(self, FI_gtf_filename):
+
+        with open(FI_gtf_filename, "rt") as fh:
+            for line in fh:
+                x = line.rstrip("\n").split("\t")
+                if len(x) < 9 or x[2] != "exon":
+                    continue
+
+                scaffold_id = x[0]
+                info = x[8]
+
+                m = re.search(r"gene_name \"([^\"]+)\"", info)
+                if m:
+                    gene_id = m.group(1)
+                else:
+                    m = re.search(r"FI_gene_label \"([^\"]+)\"", info)
+                    if m is None:
+                        raise RuntimeError(
+                            "Error, not able to extract gene_name or FI_gene_label value from {}".format(info)
+                        )
+                    gene_id = m.group(1).split("^")[0]
+
+                m = re.search(r"transcript_id \"([^\"]+)\"", info)
+                if m is None:
+                    raise RuntimeError("Error, cannot extract transcript id from {}".format(info))
+                transcript_id = m.group(1)
+
+                lend, rend = int(x[3]), int(x[4])
+
+                self.scaffold_to_gene_coordsets.setdefault(scaffold_id, dict()).setdefault(gene_id, list()).append(
+                    (lend, rend)
+                )
+                self.scaffold_to_gene_trans_to_coordsets.setdefault(scaffold_id, dict()).setdefault(
+                    gene_id, dict()
+                ).setdefault(transcript_id, list()).append((lend, rend))
+
+                if x[6] != "+":
+                    raise RuntimeError("Error, FI contigs should always have annotations on the + strand only")
+
+                # get original coordinate mapping info
+                m = re.search(r"orig_coord_info \"([^,]+),(\d+),(\d+),([+-])\"", info)
+                if m is None:
+                    raise RuntimeError("Error, cannot parse original coordinate info from {}".format(info))
+                orig_chr, orig_lend, orig_rend, orig_orient = m.group(1), int(m.group(2)), int(m.group(3)), m.group(4)
+
+                orig_end5, orig_end3 = (orig_lend, orig_rend) if orig_orient == "+" else (orig_rend, orig_lend)
+
+                coord_info = self.orig_coord_info.setdefault(scaffold_id, dict())
+                coord_info[lend] = {
+                    "chrom": orig_chr,
+                    "coord": orig_end5,
+                    "orient": orig_orient,
+                    "contig_coord": lend,
+                    "splice_junc": NA_TYPE,  # update later
+                }
+                coord_info[rend] = {
+                    "chrom": orig_chr,
+                    "coord": orig_end3,
+                    "orient": orig_orient,
+                    "contig_coord": rend,
+                    "splice_junc": NA_TYPE,  # update later
+                }
+
+        ## update splice junction info
+        for scaffold_id in sorted(self.scaffold_to_gene_trans_to_coordsets):
+            gene_to_trans = self.scaffold_to_gene_trans_to_coordsets[scaffold_id]
+            for fusion_gene in scaffold_id.split("--"):
+                for transcript_id in sorted(gene_to_trans.get(fusion_gene, dict())):
+                    coordsets = sorted(gene_to_trans[fusion_gene][transcript_id], key=lambda x: x[0])
+                    for i in range(len(coordsets) - 1):
+                        self.orig_coord_info[scaffold_id][coordsets[i][1]]["splice_junc"] = DONOR_TYPE
+                        self.orig_coord_info[scaffold_id][coordsets[i + 1][0]]["splice_junc"] = ACCEPTOR_TYPE
+
+
+def get_trans_coordsets_single_gene(trans_to_coordsets):
+
+    # (as per the extractor, each transcript contributes the exons of all the gene's transcripts,
+    #  with the duplicates removed on collapsing the segments)
+    all_coord_pairs = list()
+    for _ in trans_to_coordsets:
+        for coordpairs in trans_to_coordsets.values():
+            all_coord_pairs.extend(coordpairs)
+
+    return all_coord_pairs
+
+
+def parse_seqsimilar_gff3(seqsimilar_gff3_filename):
+
+    seqsimilar_regions = defaultdict(list)
+
+    with open(seqsimilar_gff3_filename, "rt") as fh:
+        for line in fh:
+            x = line.rstrip("\n").split("\t")
+            if len(x) < 5:
+                continue
+            if re.search(r"\d", x[3]) and re.search(r"\d", x[4]):
+                seqsimilar_regions[x[0]].append((int(x[3]), int(x[4])))
+
+    return seqsimilar_regions
+
+
+def exclude_seqsimilar_regions(trans_coords, seqsimilar_regions):
+
+    surviving_trans_coords = list()
+    for lend, rend in trans_coords:
+        if not any(lend <= region_rend and rend >= region_lend for (region_lend, region_rend) in seqsimilar_regions):
+            surviving_trans_coords.append((lend, rend))
+
+    return surviving_trans_coords
+
+
+def collapse_overlapping_trans_segments(trans_coords):
+    """
+    merges overlapping segments into their spans (as per Overlap_piler::simple_coordsets_collapser)
+    """
+
+    if len(trans_coords) < 2:
+        return list(trans_coords)
+
+    collapsed_coords = list()
+    for lend, rend in sorted((min(x), max(x)) for x in trans_coords):
+        if collapsed_coords and lend <= collapsed_coords[-1][1]:
+            collapsed_coords[-1][1] = max(collapsed_coords[-1][1], rend)
+        else:
+            collapsed_coords.append([lend, rend])
+
+    return [tuple(x) for x in collapsed_coords]
+
+
+####################
+## read evaluation
+
+
+def extract_fusion_reads(bamreader, fusion_contigs, min_trans_overlap_length, fusion_contigs_only, filtered_log, gff3_ofh):
+    """
+    returns (LR_fusion_trans_ids: read -> set of scaffold breakpoints, set of scaffolds having read alignments,
+             read_ids: fusion read -> ordinal of the read in the bam)
+    """
+
+    LR_fusion_trans_ids = dict()
+    scaffolds_with_reads = set()
+    read_ids = dict()
+
+    num_reads = 0
+    last_progress_time = time.time()
+
+    for reads in group_reads_by_name(bamreader):
+
+        num_reads += 1
+        current_time = time.time()
+        if current_time - last_progress_time >= PROGRESS_INTERVAL:
+            logger.info("  ... processed alignments for {} reads".format(num_reads))
+            last_progress_time = current_time
+
+        if fusion_contigs_only:
+            reads = [read for read in reads if not read.is_unmapped and "--" in read.reference_name]
+
+        if not any(
+            not read.is_unmapped and read.reference_name in fusion_contigs.scaffold_to_gene_coordsets for read in reads
+        ):
+            # nothing to evaluate
+            continue
+
+        align_id_to_exons = reads_to_gxf_alignments(reads, allow_non_primary=True)
+        if not align_id_to_exons:
+            continue
+
+        LR_acc = reads[0].query_name
+
+        # all alignments of the read to each scaffold are evaluated together
+        scaffold_to_LR_coordsets = dict()
+        for exons in align_id_to_exons.values():
+            for exon in exons:
+                scaffold_to_LR_coordsets.setdefault(exon["chr"], list()).append((exon["lend"], exon["rend"]))
+
+        scaffolds_with_reads.update(scaffold_to_LR_coordsets.keys())
+
+        for scaffold, LR_coordsets in scaffold_to_LR_coordsets.items():
+
+            gene_struct = fusion_contigs.scaffold_gene_structs.get(scaffold)
+            if gene_struct is None:
+                continue
+
+            breakpoint = evaluate_read_alignment(
+                scaffold, LR_acc, LR_coordsets, gene_struct, min_trans_overlap_length, filtered_log
+            )
+            if breakpoint is not None:
+                # allow for multiple paralog breakpoint support.
+                LR_fusion_trans_ids.setdefault(LR_acc, set()).add(breakpoint)
+
+        if LR_acc in LR_fusion_trans_ids:
+            write_gff3_alignments(align_id_to_exons, LR_acc, gff3_ofh)
+            read_ids.setdefault(
+                LR_acc,
+                reads[0].get_tag(READ_ORDINAL_TAG) if reads[0].has_tag(READ_ORDINAL_TAG) else num_reads - 1,
+            )
+
+    logger.info("  ... processed alignments for {} reads".format(num_reads))
+
+    return LR_fusion_trans_ids, scaffolds_with_reads, read_ids
+
+
+def evaluate_read_alignment(scaffold, LR_acc, LR_coordsets, gene_struct, min_trans_overlap_length, filtered_log):
+    """
+    returns the scaffold breakpoint (scaffold:left-right) if the read supports the fusion, otherwise None
+    """
+
+    left_gene, right_gene, geneA_max, geneB_min, transA_all_coords, transB_all_coords = gene_struct
+
+    LR_coordsets = sorted(LR_coordsets, key=lambda x: x[0])
+
+    # ignore singletons
+    if len(LR_coordsets) < 2:
+        # at least 2 sets of coordinates, indicating an intron
+        filtered_log.add(scaffold, LR_acc, "{}\t{}\tsingle exon alignment".format(scaffold, LR_acc))
+        return None
+
+    min_LR_coord = LR_coordsets[0][0]
+    max_LR_coord = LR_coordsets[-1][1]
+
+    if not (min_LR_coord < geneA_max and max_LR_coord > geneB_min):
+        # doesn't span both genes
+        return None
+
+    # ensure we have overlap with annotated exons
+    left_gene_align_coords = [x for x in LR_coordsets if x[0] < geneA_max]
+    right_gene_align_coords = [x for x in LR_coordsets if x[1] > geneB_min]
+
+    if not has_exon_overlapping_segment(left_gene_align_coords, transA_all_coords):
+        filtered_log.add(
+            scaffold, LR_acc, "{}\t{} as lacks exon overlap for left gene {}".format(scaffold, LR_acc, left_gene)
+        )
+        return None
+
+    if not has_exon_overlapping_segment(right_gene_align_coords, transB_all_coords):
+        filtered_log.add(
+            scaffold, LR_acc, "{}\t{} as lacks exon overlap for right gene: {}".format(scaffold, LR_acc, right_gene)
+        )
+        return None
+
+    # check that the amount of overlap meets minimum requirements
+    left_gene_overlapped_bases = sum_overlaps(left_gene_align_coords, transA_all_coords)
+    if left_gene_overlapped_bases < min_trans_overlap_length:
+        filtered_log.add(
+            scaffold,
+            LR_acc,
+            "{}\t{} as lacks minimum overlap length ({}) for left: {}: {}".format(
+                scaffold, LR_acc, min_trans_overlap_length, left_gene, left_gene_overlapped_bases
+            ),
+        )
+        return None
+
+    right_gene_overlapped_bases = sum_overlaps(right_gene_align_coords, transB_all_coords)
+    if right_gene_overlapped_bases < min_trans_overlap_length:
+        filtered_log.add(
+            scaffold,
+            LR_acc,
+            "{}\t{} as lacks minimum overlap length ({}) for right: {}: {}".format(
+                scaffold, LR_acc, min_trans_overlap_length, right_gene, right_gene_overlapped_bases
+            ),
+        )
+        return None
+
+    break_left, break_right = get_breakpoint_coords(LR_coordsets, geneA_max, geneB_min)
+
+    return "{}:{}-{}".format(scaffold, break_left, break_right)
+
+
+def has_exon_overlapping_segment(LR_align_coords, all_trans_coords):
+
+    for align_coordset in LR_align_coords:
+        align_lend, align_rend = sorted(align_coordset)
+        for trans_coordset in all_trans_coords:
+            trans_lend, trans_rend = sorted(trans_coordset)
+            if trans_lend < align_rend and trans_rend > align_lend:
+                return True
+
+    return False
+
+
+def sum_overlaps(coordsets_A, coordsets_B):
+
+    overlap_sum = 0
+    for coordset_A in coordsets_A:
+        lendA, rendA = sorted(coordset_A)
+        for coordset_B in coordsets_B:
+            lendB, rendB = sorted(coordset_B)
+            if lendA <= rendB and rendA >= lendB:
+                overlap_sum += min(rendA, rendB) - max(lendA, lendB) + 1
+
+    return overlap_sum
+
+
+def get_breakpoint_coords(LR_coordsets, geneA_max, geneB_min):
+
+    for segment_left, segment_right in zip(LR_coordsets, LR_coordsets[1:]):
+
+        # check adjacent exon coordinate boundaries to see if they are closest to the different gene boundaries
+        # as expected for a fusion breakpoint.
+        left_end = segment_left[1]
+        right_end = segment_right[0]
+
+        if is_closer(left_end, geneA_max, geneB_min) and is_closer(right_end, geneB_min, geneA_max):
+            return left_end, right_end
+
+    raise RuntimeError(
+        "Error, not finding a proper fusion breakpoint for : {} with gene bounds {{{}, {}}}".format(
+            LR_coordsets, geneA_max, geneB_min
+        )
+    )
+
+
+def is_closer(coord_A, coord_B, coord_C):
+    # determine if coord_A is closer to coord_B than to coord_C
+    return abs(coord_A - coord_B) < abs(coord_A - coord_C)
+
+
+def write_gff3_alignments(align_id_to_exons, read_name, ofh):
+    """
+    writes the alignments as per SAM_to_gxf.pl --format gff3
+    """
+
+    for align_id, exons in align_id_to_exons.items():
+        for exon in exons:
+            ofh.write(
+                "\t".join(
+                    [
+                        exon["chr"],
+                        "minimap2",
+                        "cDNA_match",
+                        str(exon["lend"]),
+                        str(exon["rend"]),
+                        "{:.1f}".format(exon["per_id"]),
+                        exon["orient"],
+                        ".",
+                        "ID={0};Parent={0}.mrna;Target={1} {2} {3}".format(
+                            align_id, read_name, exon["range_lend"], exon["range_rend"]
+                        ),
+                    ]
+                )
+                + "\n"
+            )
+
+
+class FilteredLog:
+    """
+    The filtered-log entries are reported ordered by scaffold, with the scaffold-level entries first
+    and then the read entries ordered by read name. Entries are sorted in bounded memory, spilling
+    sorted runs to temp files as needed.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.entries = list()
+        self.run_files = list()
+
+    def add(self, scaffold, LR_acc, message):
+        self.entries.append((scaffold, "" if LR_acc is None else "\t" + LR_acc, message))
+        if len(self.entries) >= LOG_SPILL_ENTRIES:
+            self._spill()
+
+    def _spill(self):
+        self.entries.sort()
+        run_fh = tempfile.TemporaryFile(mode="w+t", dir=os.path.dirname(os.path.abspath(self.filename)))
+        for entry in self.entries:
+            run_fh.write("\x00".join(entry) + "\n")
+        run_fh.seek(0)
+        self.run_files.append(run_fh)
+        self.entries = list()
+
+    def close(self):
+        self.entries.sort()
+        runs = [(tuple(line.rstrip("\n").split("\x00")) for line in run_fh) for run_fh in self.run_files]
+        with open(self.filename, "wt") as ofh:
+            for entry in heapq.merge(self.entries, *runs):
+                ofh.write(entry[2] + "\n")
+        for run_fh in self.run_files:
+            run_fh.close()
+
+
+####################
+## reporting
+
+
+def write_read_ids(read_ids, output_filename):
+
+    with open(output_filename, "wt") as ofh:
+        ofh.write("#read_id\tread_name\n")
+        for read_name, read_id in sorted(read_ids.items(), key=lambda x: x[1]):
+            ofh.write("{}\t{}\n".format(read_id, read_name))
+
+
+def report_LR_fusions(LR_fusion_trans_ids, fusion_contigs, snap_dist, output_prefix, ofh, read_ids=None):
+
+    scaff_breakpoint_to_read_support = defaultdict(list)
+    for LR_id in sorted(LR_fusion_trans_ids):
+        for scaff_breakpoint in sorted(LR_fusion_trans_ids[LR_id]):
+            ofh.write("#LRFusionTranscript:\t{}\t{}\n".format(LR_id, scaff_breakpoint))
+            scaff_breakpoint_to_read_support[scaff_breakpoint].append(LR_id)
+
+    ## generate fusion breakpoint summary report
+    fusion_structs = list()
+    for breakpoint in sorted(scaff_breakpoint_to_read_support):
+        LR_reads = scaff_breakpoint_to_read_support[breakpoint]
+        scaffold, breakpoint_coords = breakpoint.split(":")[0:2]
+        break_lend, break_rend = [int(x) for x in breakpoint_coords.split("-")[0:2]]
+
+        # (breakpoints may snap to the reference splice sites)
+        break_lend, left_genome_breakpoint, left_ref_splice_mapping = fusion_contigs.infer_genome_breakpoint(
+            scaffold, break_lend, DONOR_TYPE, snap_dist
+        )
+        break_rend, right_genome_breakpoint, right_ref_splice_mapping = fusion_contigs.infer_genome_breakpoint(
+            scaffold, break_rend, ACCEPTOR_TYPE, snap_dist
+        )
+
+        splice_type = (
+            "ONLY_REF_SPLICE" if left_ref_splice_mapping and right_ref_splice_mapping else "INCL_NON_REF_SPLICE"
+        )
+
+        left_gene, right_gene = scaffold.split("--")[0:2]
+
+        fusion_structs.append(
+            {
+                "fusion_name": scaffold,
+                "LeftGene": left_gene,
+                "RightGene": right_gene,
+                "LeftLocalBreakpoint": break_lend,
+                "RightLocalBreakpoint": break_rend,
+                "LeftBreakpoint": left_genome_breakpoint,
+                "RightBreakpoint": right_genome_breakpoint,
+                "num_LR": len(LR_reads),
+                "LR_accessions": list(LR_reads),
+                "SpliceType": splice_type,
+            }
+        )
+
+    fusion_structs = merge_identical_breakpoints(fusion_structs)
+
+    # as per the extractor: reverse of (ascending num_LR, descending fusion name), each sort being stable
+    fusion_structs.sort(key=lambda x: x["fusion_name"], reverse=True)
+    fusion_structs.sort(key=lambda x: x["num_LR"])
+    fusion_structs.reverse()
+
+    with open(output_prefix + ".breakpoint_info.tsv", "wt") as summary_ofh:
+        summary_ofh.write(
+            "\t".join(
+                [
+                    "#FusionName",
+                    "num_LR",
+                    "LeftGene",
+                    "LeftLocalBreakpoint",
+                    "LeftBreakpoint",
+                    "RightGene",
+                    "RightLocalBreakpoint",
+                    "RightBreakpoint",
+                    "SpliceType",
+                    "LR_accessions",
+                ]
+            )
+            + "\n"
+        )
+        for fusion in fusion_structs:
+            summary_ofh.write(
+                "\t".join(
+                    [
+                        fusion["fusion_name"],
+                        str(fusion["num_LR"]),
+                        fusion["LeftGene"],
+                        str(fusion["LeftLocalBreakpoint"]),
+                        fusion["LeftBreakpoint"],
+                        fusion["RightGene"],
+                        str(fusion["RightLocalBreakpoint"]),
+                        fusion["RightBreakpoint"],
+                        fusion["SpliceType"],
+                        ",".join(
+                            fusion["LR_accessions"]
+                            if read_ids is None
+                            else [str(read_ids[LR_acc]) for LR_acc in fusion["LR_accessions"]]
+                        ),
+                    ]
+                )
+                + "\n"
+            )
+
+
+def infer_genome_breakpoint_from_local_coord(
+    break_coord, orig_coord_info, coordinate_mappings, contig_coords, splice_site_type, snap_dist
+):
+    """
+    returns (possibly snapped breakpoint, genome breakpoint chrom:coord:orient, whether at a reference splice site)
+    """
+
+    struct = orig_coord_info.get(break_coord)
+    if struct is not None and struct["splice_junc"] == splice_site_type:
+        return break_coord, "{}:{}:{}".format(struct["chrom"], struct["coord"], struct["orient"]), True
+
+    # map to closest coordinate, visiting the mappings in order of distance (ties to the lower coordinate)
+    closest_structs = iter_closest_coordinate_mappings(break_coord, coordinate_mappings, contig_coords)
+
+    closest_struct = next(closest_structs)
+
+    # keep searching if not a matched splice type
+    if closest_struct["splice_junc"] != splice_site_type:
+        for other_struct in closest_structs:
+            if abs(break_coord - other_struct["contig_coord"]) > snap_dist:
+                break
+            if other_struct["splice_junc"] == splice_site_type:
+                # take it instead
+                closest_struct = other_struct
+                break
+
+    delta = break_coord - closest_struct["contig_coord"]
+    chrom = closest_struct["chrom"]
+    orient = closest_struct["orient"]
+
+    if abs(delta) <= snap_dist and closest_struct["splice_junc"] == splice_site_type:
+        # now at splice site
+        return closest_struct["contig_coord"], "{}:{}:{}".format(chrom, closest_struct["coord"], orient), True
+
+    if orient == "+":
+        coord = closest_struct["coord"] + delta
+    else:
+        coord = closest_struct["coord"] - delta
+
+    return break_coord, "{}:{}:{}".format(chrom, coord, orient), False
+
+
+def iter_closest_coordinate_mappings(break_coord, coordinate_mappings, contig_coords):
+    """
+    yields the coordinate mappings by increasing distance from break_coord, walking outwards
+    from its binary search position in the (contig coordinate ordered) mappings
+    """
+
+    right_idx = bisect.bisect_left(contig_coords, break_coord)
+    left_idx = right_idx - 1
+
+    while left_idx >= 0 or right_idx < len(contig_coords):
+        if right_idx >= len(contig_coords) or (
+            left_idx >= 0 and break_coord - contig_coords[left_idx] <= contig_coords[right_idx] - break_coord
+        ):
+            yield coordinate_mappings[left_idx]
+            left_idx -= 1
+        else:
+            yield coordinate_mappings[right_idx]
+            right_idx += 1
+
+
+def merge_identical_breakpoints(fusion_structs):
+
+    token_to_consolidated_fusion = dict()
+    consolidated_fusions = list()  # retain input order, for deterministic ordering of ties in the report
+
+    for fusion in fusion_structs:
+        token = (
+            fusion["fusion_name"],
+            fusion["LeftLocalBreakpoint"],
+            fusion["RightLocalBreakpoint"],
+            fusion["LeftBreakpoint"],
+            fusion["RightBreakpoint"],
+            fusion["SpliceType"],
+        )
+        existing_fusion = token_to_consolidated_fusion.get(token)
+        if existing_fusion is not None:
+            existing_fusion["num_LR"] += fusion["num_LR"]
+            existing_fusion["LR_accessions"].extend(fusion["LR_accessions"])
+        else:
+            token_to_consolidated_fusion[token] = fusion
+            consolidated_fusions.append(fusion)
+
+    return consolidated_fusions
+
+
+if __name__ == "__main__":
+    main()
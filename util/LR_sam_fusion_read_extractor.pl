@@ -15,6 +15,8 @@ my $usage = <<__EOUSAGE__;
 ############################################################################################
 #
 #  --FI_LR_sam <string>             : sam alignment file for the long reads
+#                                      (if a bam having a read name index, see bam_read_index.py, only the
+#                                       fusion read records are retrieved from it)
 #
 #  --LR_fusion_report <string>      :  fusion report indicating long reads as evidence.
 #
@@ -72,7 +74,14 @@ main: {
         }
     }
     close $fh;
-    if ($FI_LR_sam =~ /\.bam$/) {
+    my $read_names_file;
+    if ($FI_LR_sam =~ /\.bam$/ && -e "$FI_LR_sam.read_idx/meta.json") {
+        # seek directly to the fusion reads
+        $read_names_file = "$LR_fusion_report.LR_sam_fusion_reads.$$";
+        &write_read_names($read_names_file, \%fusion_to_LR_accs);
+        open($fh, "$FindBin::Bin/bam_read_index.py --bam $FI_LR_sam --read_names $read_names_file | ") or die "Error, cannot read $FI_LR_sam via bam_read_index.py";
+    }
+    elsif ($FI_LR_sam =~ /\.bam$/) {
         open($fh, "samtools view -h $FI_LR_sam | ") or die "Error, cannot read $FI_LR_sam via samtools";
     }
     else {
@@ -91,8 +100,34 @@ main: {
             print $line;
         }
     }
+    close $fh or die "Error, reading $FI_LR_sam failed";
+
+    if ($read_names_file) {
+        unlink($read_names_file);
+    }
         
     exit(0);
     
 }
 
+
+####
+sub write_read_names {
+    my ($read_names_file, $fusion_to_LR_accs_href) = @_;
+
+    my %read_names;
+    foreach my $LR_accs_href (values %$fusion_to_LR_accs_href) {
+        foreach my $read_name (keys %$LR_accs_href) {
+            $read_names{$read_name} = 1;
+        }
+    }
+    
+    open(my $ofh, ">$read_names_file") or die "Error, cannot write to $read_names_file";
+    foreach my $read_name (sort keys %read_names) {
+        print $ofh "$read_name\n";
+    }
+    close $ofh;
+
+    return;
+}
+
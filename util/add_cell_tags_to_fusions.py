@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+import sys, os, re
+import logging
+import argparse
+
+from expand_read_ids import parse_read_ids, LR_ACCESSIONS_COLUMN, EMPTY_VALUES
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s : %(levelname)s : %(message)s",
+    datefmt="%H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+## Adds the cell barcode and UMI of each fusion evidence read to a fusion table, using the
+## side table written by build_read_store.py --cell_tags_output when ingesting a uBAM.
+##
+## Two columns are added following LR_accessions, each comma-delimited and parallel to the
+## LR_accessions read list:
+##
+##    LR_cell_barcodes
+##    LR_UMIs
+##
+## If the LR_accessions are integer read IDs (--encode_read_names), pass the read ID table via
+## --read_ids and the read names are expanded in the same pass.
+
+
+CELL_BARCODES_COLUMN = "LR_cell_barcodes"
+UMIS_COLUMN = "LR_UMIs"
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="add the cell barcodes and UMIs of the evidence reads to a fusion table",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument("--fusions", type=str, required=True, help="fusion table with LR_accessions")
+    parser.add_argument(
+        "--cell_tags", type=str, required=True, help="cell tags table (read_name, cell_barcode, umi)"
+    )
+    parser.add_argument(
+        "--read_ids",
+        type=str,
+        required=False,
+        default=None,
+        help="read ID table (read_id, read_name) if the LR_accessions are read IDs, to expand them",
+    )
+    parser.add_argument("--output", type=str, required=True, help="output fusion table")
+
+    args = parser.parse_args()
+
+    read_names = parse_read_ids(args.read_ids) if args.read_ids else None
+
+    # only the evidence reads are kept from the (whole read set) cell tags table
+    fusion_reads = get_fusion_reads(args.fusions, read_names)
+
+    cell_tags = parse_cell_tags(args.cell_tags, fusion_reads)
+
+    num_fusions = add_cell_tags(args.fusions, read_names, cell_tags, args.output)
+
+    logger.info("-added cell tags to {} fusions in {}".format(num_fusions, args.output))
+
+    sys.exit(0)
+
+
+def get_LR_accessions_idx(column_headers, fusions_filename):
+
+    if LR_ACCESSIONS_COLUMN not in column_headers:
+        raise RuntimeError("Error, no {} column in {}".format(LR_ACCESSIONS_COLUMN, fusions_filename))
+
+    return column_headers.index(LR_ACCESSIONS_COLUMN)
+
+
+def get_evidence_read_names(LR_accessions, read_names):
+
+    if LR_accessions in EMPTY_VALUES:
+        return list()
+
+    reads = LR_accessions.split(",")
+
+    if read_names is not None:
+        try:
+            reads = [read_names[read_id] for read_id in reads]
+        except KeyError as e:
+            raise RuntimeError("Error, read ID {} not found in the read ID table".format(e))
+
+    return reads
+
+
+def get_fusion_reads(fusions_filename, read_names):
+    """
+    returns set of the evidence read names across the fusion table
+    """
+
+    fusion_reads = set()
+
+    with open(fusions_filename, "rt") as fh:
+        column_headers = fh.readline().rstrip("\n").split("\t")
+        LR_accessions_idx = get_LR_accessions_idx(column_headers, fusions_filename)
+
+        for line in fh:
+            vals = line.rstrip("\n").split("\t")
+            fusion_reads.update(get_evidence_read_names(vals[LR_accessions_idx], read_names))
+
+    return fusion_reads
+
+
+def parse_cell_tags(cell_tags_filename, reads_want):
+    """
+    returns dict of read name -> (cell_barcode, umi) for the reads wanted
+    """
+
+    cell_tags = dict()
+
+    with open(cell_tags_filename, "rt") as fh:
+        for line in fh:
+            if line.startswith("#"):
+                continue
+            read_name, cell_barcode, umi = line.rstrip("\n").split("\t")
+            if read_name in reads_want:
+                cell_tags[read_name] = (cell_barcode, umi)
+
+    num_missing = len(reads_want) - len(cell_tags)
+    if num_missing > 0:
+        logger.warning("-{} fusion evidence reads lack cell tags in {}".format(num_missing, cell_tags_filename))
+
+    return cell_tags
+
+
+def add_cell_tags(fusions_filename, read_names, cell_tags, output_filename):
+    """
+    returns number of fusion rows written
+    """
+
+    num_fusions = 0
+
+    with open(fusions_filename, "rt") as fh, open(output_filename, "wt") as ofh:
+
+        column_headers = fh.readline().rstrip("\n").split("\t")
+        LR_accessions_idx = get_LR_accessions_idx(column_headers, fusions_filename)
+        insert_idx = LR_accessions_idx + 1
+
+        column_headers[insert_idx:insert_idx] = [CELL_BARCODES_COLUMN, UMIS_COLUMN]
+        ofh.write("\t".join(column_headers) + "\n")
+
+        for line in fh:
+            vals = line.rstrip("\n").split("\t")
+
+            reads = get_evidence_read_names(vals[LR_accessions_idx], read_names)
+            if reads:
+                vals[LR_accessions_idx] = ",".join(reads)
+                tags = [cell_tags.get(read_name, ("NA", "NA")) for read_name in reads]
+                cell_barcodes = ",".join(cell_barcode for cell_barcode, umi in tags)
+                umis = ",".join(umi for cell_barcode, umi in tags)
+            else:
+                cell_barcodes = umis = "NA"
+
+            vals[insert_idx:insert_idx] = [cell_barcodes, umis]
+            ofh.write("\t".join(vals) + "\n")
+            num_fusions += 1
+
+    return num_fusions
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+
+import sys, os, re
+import logging
+import argparse
+import gzip
+import json
+import shutil
+from collections import defaultdict
+import numpy as np
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s : %(levelname)s : %(message)s",
+    datefmt="%H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+## Compact gene / exon index of the reference annotation gtf.
+##
+## Built once (ctat-LR-fusion --prep_reference) as a directory of .npy arrays next to
+## the gtf in the genome lib:
+##
+##    ref_annot.gtf.annot_idx/
+##
+## Each array is loaded memory-mapped, so loading takes milliseconds and the pages are
+## shared via the page cache among all samples running on a node.
+##
+## Layout (CSR style, each *_offsets array has one more entry than the records it indexes):
+##
+##   chroms                  sorted chromosome names
+##   chrom_gene_offsets      chrom -> range of genes
+##   gene_names              genes sorted by (chrom, gene name); gene_name used when available, otherwise gene_id
+##   gene_lend, gene_rend    gene span (min, max of its exon coordinates)
+##   gene_transcript_offsets gene -> range of transcripts
+##   transcript_ids          transcripts sorted by id within each gene
+##   transcript_exon_offsets transcript -> range of exons
+##   exon_lend, exon_rend, exon_orient   exons, in gtf file order within each transcript
+##
+## meta.json records the size and modification time of the gtf it was built from, and the
+## index is ignored if the gtf no longer matches both.
+
+
+ANNOT_INDEX_FORMAT_VERSION = 1
+
+ANNOT_INDEX_ARRAYS = (
+    "chroms",
+    "chrom_gene_offsets",
+    "gene_names",
+    "gene_lend",
+    "gene_rend",
+    "gene_transcript_offsets",
+    "transcript_ids",
+    "transcript_exon_offsets",
+    "exon_lend",
+    "exon_rend",
+    "exon_orient",
+)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="build memory-mappable annotation index from the reference annotation gtf",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument(
+        "--annot_gtf",
+        type=str,
+        required=True,
+        help="transcript structures in gtf file format",
+    )
+
+    parser.add_argument(
+        "--index_dir",
+        type=str,
+        required=False,
+        default=None,
+        help="output index directory (default: {annot_gtf}.annot_idx)",
+    )
+
+    args = parser.parse_args()
+
+    index_dir = args.index_dir if args.index_dir else get_default_index_dir(args.annot_gtf)
+
+    build_annot_index(args.annot_gtf, index_dir)
+
+    logger.info("-done")
+
+    sys.exit(0)
+
+
+def get_default_index_dir(annot_gtf_file):
+    return annot_gtf_file + ".annot_idx"
+
+
+def parse_gtf_exons(annot_gtf_file):
+    """
+    returns chrom -> gene -> transcript -> list of (lend, rend, orient) in file order,
+    where gene is the gene_name if available, otherwise the gene_id
+    """
+
+    logger.info("-parsing {}".format(annot_gtf_file))
+
+    genes = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
+
+    opener = gzip.open if re.search(r"\.gz$", annot_gtf_file) else open
+
+    with opener(annot_gtf_file, "rt") as fh:
+        for line in fh:
+            line = line.rstrip("\n")
+            if not re.search(r"\w", line):
+                continue
+            if line.startswith("#"):
+                continue
+            if line.startswith(">"):
+                line = line[1:]
+            x = line.split("\t")
+
+            if x[2] != "exon":
+                continue
+
+            info = x[8]
+            m = re.search(r'gene_id "([^"]+)', info)
+            if not m:
+                raise RuntimeError(
+                    "Error, cannot extract gene_id from {} [specifically from: {}]".format(
+                        line, info
+                    )
+                )
+            gene_id = m.group(1)
+
+            m = re.search(r'gene_name "([^"]+)', info)
+            if m:
+                # use gene name instead
+                gene_id = m.group(1)
+
+            m = re.search(r'transcript_id "([^"]+)', info)
+            if not m:
+                raise RuntimeError(
+                    "Error, cannot extract transcript_id from {}".format(line)
+                )
+            transcript_id = m.group(1)
+
+            genes[x[0]][gene_id][transcript_id].append((int(x[3]), int(x[4]), x[6]))
+
+    return genes
+
+
+def build_annot_index(annot_gtf_file, index_dir):
+
+    genes = parse_gtf_exons(annot_gtf_file)
+
+    logger.info("-building annotation index: {}".format(index_dir))
+
+    chroms = sorted(genes.keys())
+
+    chrom_gene_offsets = [0]
+    gene_names = list()
+    gene_lend = list()
+    gene_rend = list()
+    gene_transcript_offsets = [0]
+    transcript_ids = list()
+    transcript_exon_offsets = [0]
+    exon_lend = list()
+    exon_rend = list()
+    exon_orient = list()
+
+    for chrom in chroms:
+        for gene_name in sorted(genes[chrom].keys()):
+            gene_transcripts = genes[chrom][gene_name]
+            gene_coords = list()
+            for transcript_id in sorted(gene_transcripts.keys()):
+                for lend, rend, orient in gene_transcripts[transcript_id]:
+                    exon_lend.append(lend)
+                    exon_rend.append(rend)
+                    exon_orient.append(orient)
+                    gene_coords.extend([lend, rend])
+                transcript_ids.append(transcript_id)
+                transcript_exon_offsets.append(len(exon_lend))
+
+            gene_names.append(gene_name)
+            gene_lend.append(min(gene_coords))
+            gene_rend.append(max(gene_coords))
+            gene_transcript_offsets.append(len(transcript_ids))
+
+        chrom_gene_offsets.append(len(gene_names))
+
+    arrays = {
+        "chroms": np.array(chroms, dtype=str),
+        "chrom_gene_offsets": np.array(chrom_gene_offsets, dtype=np.int64),
+        "gene_names": np.array(gene_names, dtype=str),
+        "gene_lend": np.array(gene_lend, dtype=np.int64),
+        "gene_rend": np.array(gene_rend, dtype=np.int64),
+        "gene_transcript_offsets": np.array(gene_transcript_offsets, dtype=np.int64),
+        "transcript_ids": np.array(transcript_ids, dtype=str),
+        "transcript_exon_offsets": np.array(transcript_exon_offsets, dtype=np.int64),
+        "exon_lend": np.array(exon_lend, dtype=np.int64),
+        "exon_rend": np.array(exon_rend, dtype=np.int64),
+        "exon_orient": np.array(exon_orient, dtype="S1"),
+    }
+
+    # write to a tmp dir then move into place, so a partial index is never picked up.
+    tmp_index_dir = index_dir + ".tmp.{}".format(os.getpid())
+    if os.path.exists(tmp_index_dir):
+        shutil.rmtree(tmp_index_dir)
+    os.makedirs(tmp_index_dir)
+
+    for array_name, array in arrays.items():
+        np.save(os.path.join(tmp_index_dir, array_name + ".npy"), array)
+
+    with open(os.path.join(tmp_index_dir, "meta.json"), "wt") as ofh:
+        json.dump(
+            {
+                "format_version": ANNOT_INDEX_FORMAT_VERSION,
+                "source_gtf": os.path.basename(annot_gtf_file),
+                "source_gtf_size": os.path.getsize(annot_gtf_file),
+                "source_gtf_mtime_ns": os.stat(annot_gtf_file).st_mtime_ns,
+                "num_genes": len(gene_names),
+                "num_transcripts": len(transcript_ids),
+                "num_exons": len(exon_lend),
+            },
+            ofh,
+            indent=2,
+        )
+
+    if os.path.exists(index_dir):
+        shutil.rmtree(index_dir)
+    os.rename(tmp_index_dir, index_dir)
+
+    logger.info(
+        "-indexed {} genes, {} transcripts, {} exons".format(
+            len(gene_names), len(transcript_ids), len(exon_lend)
+        )
+    )
+
+    return
+
+
+class AnnotIndex:
+    """
+    Read-only, memory-mapped view of an annotation index built by build_annot_index()
+    """
+
+    def __init__(self, index_dir):
+
+        self.index_dir = index_dir
+
+        with open(os.path.join(index_dir, "meta.json"), "rt") as fh:
+            self.meta = json.load(fh)
+
+        if self.meta["format_version"] != ANNOT_INDEX_FORMAT_VERSION:
+            raise RuntimeError(
+                "Error, annotation index {} is format version {}, expected {}. Please rebuild via --prep_reference".format(
+                    index_dir, self.meta["format_version"], ANNOT_INDEX_FORMAT_VERSION
+                )
+            )
+
+        for array_name in ANNOT_INDEX_ARRAYS:
+            setattr(
+                self,
+                array_name,
+                np.load(os.path.join(index_dir, array_name + ".npy"), mmap_mode="r"),
+            )
+
+        self.chrom_to_idx = {str(chrom): i for i, chrom in enumerate(self.chroms)}
+
+    @staticmethod
+    def load_if_current(index_dir, annot_gtf_file):
+        """
+        returns the AnnotIndex if it exists and was built from the current gtf, otherwise None
+        """
+
+        if index_dir is None or not os.path.exists(os.path.join(index_dir, "meta.json")):
+            return None
+
+        annot_index = AnnotIndex(index_dir)
+
+        gtf_stat = os.stat(annot_gtf_file)
+        if annot_index.meta["source_gtf_size"] != gtf_stat.st_size or annot_index.meta.get(
+            "source_gtf_mtime_ns"
+        ) != gtf_stat.st_mtime_ns:
+            logger.warning(
+                "annotation index {} is out of date with respect to {}, ignoring it. Please rebuild via --prep_reference".format(
+                    index_dir, annot_gtf_file
+                )
+            )
+            return None
+
+        return annot_index
+
+    def get_chroms(self):
+        return [str(chrom) for chrom in self.chroms]
+
+    def get_chrom_gene_range(self, chrom):
+        """
+        returns (first gene idx, last gene idx + 1) for genes on chrom
+        """
+        chrom_idx = self.chrom_to_idx.get(chrom, None)
+        if chrom_idx is None:
+            return 0, 0
+
+        return (
+            int(self.chrom_gene_offsets[chrom_idx]),
+            int(self.chrom_gene_offsets[chrom_idx + 1]),
+        )
+
+    def get_gene_transcripts(self, gene_idx):
+        """
+        returns dict of transcript_id -> list of (lend, rend, orient)
+        """
+        gene_transcripts = dict()
+        for transcript_idx in range(
+            self.gene_transcript_offsets[gene_idx],
+            self.gene_transcript_offsets[gene_idx + 1],
+        ):
+            exon_start = self.transcript_exon_offsets[transcript_idx]
+            exon_end = self.transcript_exon_offsets[transcript_idx + 1]
+            gene_transcripts[str(self.transcript_ids[transcript_idx])] = list(
+                zip(
+                    self.exon_lend[exon_start:exon_end].tolist(),
+                    self.exon_rend[exon_start:exon_end].tolist(),
+                    [x.decode() for x in self.exon_orient[exon_start:exon_end]],
+                )
+            )
+
+        return gene_transcripts
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+
+import sys, os, re
+import logging
+import argparse
+import array
+import hashlib
+import json
+import multiprocessing
+import shutil
+import time
+import numpy as np
+import pysam
+
+from extract_chimeric_alignments_from_bam import plan_bam_shards
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s : %(levelname)s : %(message)s",
+    datefmt="%H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+## Read name index of a bam file, for retrieving the records of a known set of reads by seeking
+## directly to them rather than scanning the full bam (ie. 100M read single cell bams).
+##
+## Built once, by worker processes each indexing a shard of the bam (split on record boundaries via
+## plan_bam_shards), as a directory of .npy arrays next to the bam:
+##
+##    reads.bam.read_idx/
+##
+##   name_hashes       64-bit hash of the read name of each record, sorted
+##   virtual_offsets   BGZF virtual offset of each record, ordered as the hashes (file order among equal hashes)
+##
+## Each array is loaded memory-mapped. All records of a read (ie. supplementary and secondary alignments)
+## are indexed, and hash collisions are resolved on retrieval by checking the record read names.
+##
+## ie.
+##    bam_read_index.py --bam reads.bam --threads 8                               # build
+##    bam_read_index.py --bam reads.bam --read_names names.txt --output reads.sam  # retrieve
+##
+## The index is built by hand, for bams queried repeatedly (ie. a single cell ubam revisited across runs):
+## no pipeline step builds it, as each bam is read once per run, and a build is itself a full pass.
+
+
+BAM_READ_INDEX_FORMAT_VERSION = 1
+
+BAM_READ_INDEX_ARRAYS = ("name_hashes", "virtual_offsets")
+
+PROGRESS_INTERVAL = 15  # seconds
+
+SHARDS_PER_WORKER = 4
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="build or query a read name index of a bam file",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument("--bam", type=str, required=True, help="bam file")
+    parser.add_argument(
+        "--index_dir",
+        type=str,
+        required=False,
+        default=None,
+        help="read name index directory (default: <bam>.read_idx)",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=1,
+        help="number of index building worker processes, or of bam decompression threads on retrieval",
+    )
+    parser.add_argument(
+        "--read_names",
+        type=str,
+        required=False,
+        default=None,
+        help="retrieve the records for the reads named in this file (one per line) instead of building the index",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        required=False,
+        default=None,
+        help="with --read_names, output sam (or .bam) filename (default: sam to stdout)",
+    )
+
+    args = parser.parse_args()
+
+    index_dir = args.index_dir or get_default_index_dir(args.bam)
+
+    if args.read_names is None:
+        build_bam_read_index(args.bam, index_dir, args.threads)
+        sys.exit(0)
+
+    reads_want = set()
+    with open(args.read_names, "rt") as fh:
+        for line in fh:
+            read_name = line.rstrip()
+            if read_name:
+                reads_want.add(read_name)
+
+    with pysam.AlignmentFile(args.bam, "rb", check_sq=False, threads=args.threads) as bamreader:
+
+        output_mode = "wb" if args.output and args.output.endswith(".bam") else "wh"
+        with pysam.AlignmentFile(args.output or "-", output_mode, template=bamreader) as writer:
+            num_records = 0
+            for read in iter_reads_by_name(bamreader, reads_want, index_dir, args.bam):
+                writer.write(read)
+                num_records += 1
+
+    logger.info("-retrieved {} records for {} reads".format(num_records, len(reads_want)))
+
+    sys.exit(0)
+
+
+def get_default_index_dir(bam_filename):
+    return bam_filename + ".read_idx"
+
+
+def hash_read_name(read_name):
+    return int.from_bytes(hashlib.blake2b(read_name.encode(), digest_size=8).digest(), "little")
+
+
+def build_bam_read_index(bam_filename, index_dir, num_workers=1):
+
+    logger.info("-building read name index of {}".format(bam_filename))
+
+    # shards end where the next one begins
+    shard_starts = [start_voffset for start_voffset, _ in plan_bam_shards(bam_filename, num_workers * SHARDS_PER_WORKER)]
+    job_params = [
+        (bam_filename, start_voffset, end_voffset)
+        for start_voffset, end_voffset in zip(shard_starts, shard_starts[1:] + [None])
+    ]
+    logger.info("-indexing {} shards by {} workers".format(len(job_params), num_workers))
+
+    shard_name_hashes = list()
+    shard_virtual_offsets = list()
+
+    last_progress_time = time.time()
+
+    with multiprocessing.get_context("fork").Pool(processes=min(num_workers, len(job_params))) as pool:
+        # shard arrays come back in file order
+        for shard_num, (name_hashes, virtual_offsets) in enumerate(pool.imap(_index_bam_shard_star, job_params), 1):
+            shard_name_hashes.append(name_hashes)
+            shard_virtual_offsets.append(virtual_offsets)
+
+            current_time = time.time()
+            if current_time - last_progress_time >= PROGRESS_INTERVAL:
+                logger.info("  ... indexed {} of {} shards".format(shard_num, len(job_params)))
+                last_progress_time = current_time
+
+    name_hashes = np.concatenate(shard_name_hashes)
+    virtual_offsets = np.concatenate(shard_virtual_offsets)
+
+    # stable, so the records of each read stay in file order
+    order = np.argsort(name_hashes, kind="stable")
+
+    arrays = {
+        "name_hashes": name_hashes[order],
+        "virtual_offsets": virtual_offsets[order],
+    }
+
+    # write to a tmp dir then move into place, so a partial index is never picked up.
+    tmp_index_dir = index_dir + ".tmp.{}".format(os.getpid())
+    if os.path.exists(tmp_index_dir):
+        shutil.rmtree(tmp_index_dir)
+    os.makedirs(tmp_index_dir)
+
+    for array_name, array_vals in arrays.items():
+        np.save(os.path.join(tmp_index_dir, array_name + ".npy"), array_vals)
+
+    bam_stat = os.stat(bam_filename)
+    with open(os.path.join(tmp_index_dir, "meta.json"), "wt") as ofh:
+        json.dump(
+            {
+                "format_version": BAM_READ_INDEX_FORMAT_VERSION,
+                "source_bam": os.path.basename(bam_filename),
+                "source_bam_size": bam_stat.st_size,
+                "source_bam_mtime_ns": bam_stat.st_mtime_ns,
+                "num_records": len(order),
+            },
+            ofh,
+            indent=2,
+        )
+
+    if os.path.exists(index_dir):
+        shutil.rmtree(index_dir)
+    os.rename(tmp_index_dir, index_dir)
+
+    logger.info("-indexed {} records".format(len(order)))
+
+    return
+
+
+def _index_bam_shard_star(params):
+    return _index_bam_shard(*params)
+
+
+def _index_bam_shard(bam_filename, start_voffset, end_voffset):
+    """
+    returns (name hashes, virtual offsets) of the records from start_voffset up to end_voffset (or eof)
+    """
+
+    name_hashes = array.array("Q")
+    virtual_offsets = array.array("Q")
+
+    with pysam.AlignmentFile(bam_filename, "rb", check_sq=False) as bamreader:
+        bamreader.seek(start_voffset)
+        while True:
+            virtual_offset = bamreader.tell()
+            if end_voffset is not None and virtual_offset >= end_voffset:
+                break
+            try:
+                read = next(bamreader)
+            except StopIteration:
+                break
+
+            name_hashes.append(hash_read_name(read.query_name))
+            virtual_offsets.append(virtual_offset)
+
+    return np.frombuffer(name_hashes, dtype=np.uint64), np.frombuffer(virtual_offsets, dtype=np.uint64)
+
+
+class BamReadIndex:
+    """
+    Read-only, memory-mapped view of a bam read name index built by build_bam_read_index()
+    """
+
+    def __init__(self, index_dir):
+
+        self.index_dir = index_dir
+
+        with open(os.path.join(index_dir, "meta.json"), "rt") as fh:
+            self.meta = json.load(fh)
+
+        if self.meta["format_version"] != BAM_READ_INDEX_FORMAT_VERSION:
+            raise RuntimeError(
+                "Error, bam read index {} is format version {}, expected {}. Please rebuild via bam_read_index.py".format(
+                    index_dir, self.meta["format_version"], BAM_READ_INDEX_FORMAT_VERSION
+                )
+            )
+
+        for array_name in BAM_READ_INDEX_ARRAYS:
+            setattr(
+                self,
+                array_name,
+                np.load(os.path.join(index_dir, array_name + ".npy"), mmap_mode="r"),
+            )
+
+    @staticmethod
+    def load_if_current(index_dir, bam_filename):
+        """
+        returns the BamReadIndex if it exists and was built from the current bam, otherwise None
+        """
+
+        if index_dir is None or not os.path.exists(os.path.join(index_dir, "meta.json")):
+            return None
+
+        bam_read_index = BamReadIndex(index_dir)
+
+        bam_stat = os.stat(bam_filename)
+        if (
+            bam_read_index.meta["source_bam_size"] != bam_stat.st_size
+            or bam_read_index.meta["source_bam_mtime_ns"] != bam_stat.st_mtime_ns
+        ):
+            logger.warning(
+                "bam read index {} is out of date with respect to {}, ignoring it. Please rebuild via bam_read_index.py".format(
+                    index_dir, bam_filename
+                )
+            )
+            return None
+
+        return bam_read_index
+
+    def get_virtual_offsets(self, read_names):
+        """
+        returns the sorted candidate record offsets for the read names (including any hash collisions)
+        """
+
+        hashes = np.array(sorted(set(hash_read_name(read_name) for read_name in read_names)), dtype=np.uint64)
+
+        starts = np.searchsorted(self.name_hashes, hashes, side="left")
+        ends = np.searchsorted(self.name_hashes, hashes, side="right")
+
+        offsets = [self.virtual_offsets[start:end] for start, end in zip(starts, ends) if end > start]
+        if not offsets:
+            return np.array([], dtype=np.uint64)
+
+        return np.sort(np.concatenate(offsets))
+
+    def iter_reads(self, bamreader, read_names):
+        """
+        yields the records of the named reads, in file order
+        """
+
+        read_names = set(read_names)
+
+        for virtual_offset in self.get_virtual_offsets(read_names):
+            bamreader.seek(int(virtual_offset))
+            read = next(bamreader)
+            if read.query_name in read_names:
+                yield read
+
+
+def iter_reads_by_name(bamreader, read_names, index_dir, bam_filename):
+    """
+    yields the records of the named reads in file order, via the read name index if current,
+    otherwise by scanning the bam
+    """
+
+    bam_read_index = BamReadIndex.load_if_current(index_dir, bam_filename)
+
+    if bam_read_index is not None:
+        logger.info("-retrieving {} reads via read name index {}".format(len(read_names), index_dir))
+        yield from bam_read_index.iter_reads(bamreader, read_names)
+    else:
+        logger.info("-no read name index for {}, scanning for {} reads".format(bam_filename, len(read_names)))
+        for read in bamreader:
+            if read.query_name in read_names:
+                yield read
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+
+import sys, os, re
+import logging
+import argparse
+import struct
+import time
+import zlib
+import multiprocessing
+import pysam
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s : %(levelname)s : %(message)s",
+    datefmt="%H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+## Ingests long reads (fasta, fastq, or bam) into a read store: a BGZF-compressed fasta
+## (one line per sequence) along with its samtools faidx-compatible .fai and .gzi indexes,
+## written directly during compression so no second pass over the data is needed.
+##
+## The store is a valid (b)gzipped fasta file for any downstream tool, and supports
+## fetching individual reads by seeking (see fetch_reads_from_store.py).
+##
+## For unaligned bam (uBAM) input from single cell protocols, the cell barcode and UMI tags
+## of each read can be written alongside as a side table (--cell_tags_output), since they
+## don't survive the conversion to fasta:
+##
+##    read_name <tab> cell_barcode <tab> umi       (NA where the read lacks the tag)
+
+
+BGZF_BLOCK_DATA_SIZE = 0xFF00  # uncompressed bytes per block, as per htslib
+BGZF_EOF = bytes.fromhex(
+    "1f8b08040000000000ff0600424302001b0003000000000000000000"
+)
+BGZF_COMPRESS_LEVEL = 1  # favor speed, the store is an intermediate file
+COMPRESS_BATCH_BLOCKS = 64  # blocks per worker per batch, bounds memory use
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="ingest long reads into an indexed block-compressed read store",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument(
+        "--reads",
+        type=str,
+        required=True,
+        help="reads in fasta or fastq format (optionally gzipped), or unaligned/aligned bam",
+    )
+
+    parser.add_argument(
+        "--store",
+        type=str,
+        required=True,
+        help="output read store filename (ie. reads.fa.gz), .fai and .gzi indexes are written alongside",
+    )
+
+    parser.add_argument(
+        "--require_SA",
+        action="store_true",
+        default=False,
+        help="for bam input, only store reads having an SA tag (as per samtools fasta -d SA)",
+    )
+
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=1,
+        help="number of block compression processes",
+    )
+
+    parser.add_argument(
+        "--bam_threads",
+        type=int,
+        default=1,
+        help="for bam input, number of bam decompression threads",
+    )
+
+    parser.add_argument(
+        "--cell_tags_output",
+        type=str,
+        required=False,
+        default=None,
+        help="for bam input, write the cell barcode and UMI tags of each stored read to this file",
+    )
+
+    parser.add_argument(
+        "--cell_barcode_tag",
+        type=str,
+        default="CB",
+        help="bam tag holding the cell barcode",
+    )
+
+    parser.add_argument(
+        "--umi_tag",
+        type=str,
+        default="UB",
+        help="bam tag holding the UMI (ie. UB for 10x, XM for sc-Kinnex)",
+    )
+
+    args = parser.parse_args()
+
+    start_time = time.time()
+
+    cell_tags_ofh = None
+
+    if re.search(r"\.bam$", args.reads):
+        if args.cell_tags_output:
+            cell_tags_ofh = open(args.cell_tags_output + ".tmp", "wt")
+            cell_tags_ofh.write("\t".join(["#read_name", "cell_barcode", "umi"]) + "\n")
+        read_iter = iter_bam_reads(
+            args.reads,
+            args.require_SA,
+            args.bam_threads,
+            cell_tags_ofh,
+            args.cell_barcode_tag,
+            args.umi_tag,
+        )
+    else:
+        if args.cell_tags_output:
+            raise RuntimeError("Error, --cell_tags_output requires bam input")
+        read_iter = iter_fastx_reads(args.reads)
+
+    num_reads = write_read_store(read_iter, args.store, max(1, args.threads))
+
+    if cell_tags_ofh is not None:
+        cell_tags_ofh.close()
+        os.rename(args.cell_tags_output + ".tmp", args.cell_tags_output)
+
+    logger.info(
+        "-stored {} reads in {}, in {:.1f} sec".format(
+            num_reads, args.store, time.time() - start_time
+        )
+    )
+
+    sys.exit(0)
+
+
+def iter_fastx_reads(reads_filename):
+
+    with pysam.FastxFile(reads_filename) as fh:
+        for entry in fh:
+            yield entry.name, entry.sequence
+
+
+def iter_bam_reads(
+    bam_filename,
+    require_SA,
+    num_threads=1,
+    cell_tags_ofh=None,
+    cell_barcode_tag="CB",
+    umi_tag="UB",
+):
+
+    with pysam.AlignmentFile(bam_filename, "rb", check_sq=False, threads=num_threads) as bamreader:
+        for read in bamreader.fetch(until_eof=True):
+            if read.is_secondary or read.is_supplementary:
+                continue
+            if require_SA and not read.has_tag("SA"):
+                continue
+            if cell_tags_ofh is not None:
+                cell_tags_ofh.write(
+                    "\t".join(
+                        [
+                            read.query_name,
+                            get_tag_value(read, cell_barcode_tag),
+                            get_tag_value(read, umi_tag),
+                        ]
+                    )
+                    + "\n"
+                )
+            # restore the original read orientation
+            yield read.query_name, read.get_forward_sequence()
+
+
+def get_tag_value(read, tag):
+
+    if read.has_tag(tag):
+        return str(read.get_tag(tag))
+    else:
+        return "NA"
+
+
+def write_read_store(read_iter, store_filename, num_threads):
+    """
+    returns number of reads stored
+    """
+
+    tmp_store_filename = store_filename + ".tmp"
+    pool = multiprocessing.Pool(processes=num_threads) if num_threads > 1 else None
+
+    num_reads = 0
+    uncompressed_offset = 0  # offset of next uncompressed byte
+    compressed_offset = 0
+    block_offsets = list()  # compressed offset following each block written
+
+    with open(tmp_store_filename, "wb") as ofh, open(
+        store_filename + ".fai", "wt"
+    ) as fai_ofh:
+
+        def write_blocks(blocks):
+            nonlocal compressed_offset
+            compressed_blocks = (
+                pool.map(compress_bgzf_block, blocks)
+                if pool is not None
+                else [compress_bgzf_block(block) for block in blocks]
+            )
+            for compressed_block in compressed_blocks:
+                ofh.write(compressed_block)
+                compressed_offset += len(compressed_block)
+                block_offsets.append(compressed_offset)
+
+        batch_size = COMPRESS_BATCH_BLOCKS * num_threads
+        blocks = list()
+        buf = bytearray()
+
+        for read_name, sequence in read_iter:
+
+            if sequence is None:
+                sequence = ""
+
+            header = ">{}\n".format(read_name).encode()
+            sequence = sequence.encode()
+
+            seq_offset = uncompressed_offset + len(header)
+            seq_len = len(sequence)
+            # zero-length reads are indexed too, so they can be fetched (as empty records) like any other
+            fai_ofh.write(
+                "{}\t{}\t{}\t{}\t{}\n".format(
+                    read_name, seq_len, seq_offset, seq_len, seq_len + 1
+                )
+            )
+
+            buf += header
+            buf += sequence
+            buf += b"\n"
+            uncompressed_offset = seq_offset + seq_len + 1
+            num_reads += 1
+
+            while len(buf) >= BGZF_BLOCK_DATA_SIZE:
+                blocks.append(bytes(buf[:BGZF_BLOCK_DATA_SIZE]))
+                del buf[:BGZF_BLOCK_DATA_SIZE]
+
+            if len(blocks) >= batch_size:
+                write_blocks(blocks)
+                blocks = list()
+
+        if buf:
+            blocks.append(bytes(buf))
+        write_blocks(blocks)
+
+        ofh.write(BGZF_EOF)
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    # .gzi: (compressed, uncompressed) offsets of each block start after the first
+    # the uncompressed offsets follow from the fixed block data size.
+    num_data_blocks = len(block_offsets)
+    with open(store_filename + ".gzi", "wb") as gzi_ofh:
+        gzi_ofh.write(struct.pack("<Q", max(num_data_blocks - 1, 0)))
+        for i in range(num_data_blocks - 1):
+            gzi_ofh.write(
+                struct.pack("<QQ", block_offsets[i], (i + 1) * BGZF_BLOCK_DATA_SIZE)
+            )
+
+    os.rename(tmp_store_filename, store_filename)
+
+    return num_reads
+
+
+def compress_bgzf_block(data):
+
+    compressor = zlib.compressobj(BGZF_COMPRESS_LEVEL, zlib.DEFLATED, -15)
+    cdata = compressor.compress(data) + compressor.flush()
+
+    block_size = 18 + len(cdata) + 8
+    header = struct.pack(
+        "<4sIBBHccHH",
+        b"\x1f\x8b\x08\x04",
+        0,  # mtime
+        0,  # xfl
+        0xFF,  # os
+        6,  # xlen
+        b"B",
+        b"C",
+        2,  # slen
+        block_size - 1,
+    )
+
+    return header + cdata + struct.pack("<II", zlib.crc32(data), len(data))
+
+
+if __name__ == "__main__":
+    main()
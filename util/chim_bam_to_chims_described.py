@@ -0,0 +1,948 @@
+#!/usr/bin/env python3
+
+import sys, os, re
+import logging
+import argparse
+import time
+import multiprocessing
+import pysam
+
+from extract_chimeric_alignments_from_bam import group_reads_by_name, plan_bam_shards
+from annot_index import AnnotIndex, parse_gtf_exons
+from chims_columnar import ChimsColumnarBuilder
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s : %(levelname)s : %(message)s",
+    datefmt="%H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+## Streams a name-grouped (samtools sort -N) chimeric alignment bam directly into the
+## chims_described report, replacing the round trip:
+##
+##    SAM_to_gxf.pl --format gff3  |  genome_gff3_to_chim_summary.pl
+##
+## The alignment-to-span conversion mirrors SAM_to_gxf.pl and the annotation mapping
+## mirrors genome_gff3_to_chim_summary.pl, including its tie-breaking order, so
+## the output is identical to the two-step route.
+##
+## With --CPU > 1, the reads are evaluated by forked worker processes over shards of the bam
+## split on read boundaries, sharing the annotation interval trees built once up front
+## (copy-on-write). The shard reports are written in input order, so the output is unchanged.
+
+
+MERGE_DIST = 10  # as per SAM_to_gxf.pl
+
+PROGRESS_INTERVAL = 15  # seconds
+
+SHARDS_PER_WORKER = 4  # smaller shards, for load balancing across the workers
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="generate chims_described report directly from chimeric alignment bam",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument(
+        "--chim_bam",
+        type=str,
+        required=True,
+        help="chimeric alignments bam, grouped by read name",
+    )
+
+    parser.add_argument(
+        "--annot_gtf",
+        type=str,
+        required=True,
+        help="transcript structures in gtf file format",
+    )
+
+    parser.add_argument(
+        "--annot_index",
+        type=str,
+        required=False,
+        default=None,
+        help="prebuilt annotation index for --annot_gtf (see annot_index.py), used if up to date with the gtf",
+    )
+
+    parser.add_argument(
+        "--min_per_id",
+        type=float,
+        default=80,
+        help="minimum percent identity",
+    )
+
+    parser.add_argument(
+        "--output",
+        type=str,
+        required=False,
+        default=None,
+        help="output chims_described filename (default: stdout)",
+    )
+
+    parser.add_argument(
+        "--columnar_output",
+        type=str,
+        required=False,
+        default=None,
+        help="also write the columnar chims_described directory (see chims_columnar.py)",
+    )
+
+    parser.add_argument(
+        "--CPU",
+        type=int,
+        default=1,
+        help="number of worker processes evaluating the read alignments",
+    )
+
+    args = parser.parse_args()
+
+    if args.min_per_id <= 1:
+        raise RuntimeError("Error, --min_per_id must be > 1")
+
+    chim_annot_mapper = ChimAnnotMapper(args.annot_gtf, args.annot_index)
+
+    ofh = open(args.output, "wt") if args.output else sys.stdout
+
+    bamreader = pysam.AlignmentFile(args.chim_bam, "rb", check_sq=False)
+
+    columnar_builder = ChimsColumnarBuilder() if args.columnar_output else None
+
+    if args.CPU > 1:
+        bamreader.close()
+        num_errors = write_chims_described_sharded(
+            args.chim_bam, chim_annot_mapper, args.min_per_id, ofh, columnar_builder, args.CPU
+        )
+    else:
+        num_errors = write_chims_described(
+            bamreader, chim_annot_mapper, args.min_per_id, ofh, columnar_builder
+        )
+
+    if ofh is not sys.stdout:
+        ofh.close()
+
+    if columnar_builder is not None:
+        columnar_builder.write(args.columnar_output, args.output or "stdout")
+
+    if num_errors:
+        logger.warning("*** {} alignment errors were identified.".format(num_errors))
+
+    logger.info("-done")
+
+    sys.exit(0)
+
+
+def write_chims_described_header(ofh):
+
+    print(
+        "\t".join(
+            ["#transcript", "num_alignments", "align_descr(s)", "[chim_annot_mapping]"]
+        ),
+        file=ofh,
+    )
+
+
+def write_chims_described(bamreader, chim_annot_mapper, min_per_id, ofh, columnar_builder=None):
+
+    logger.info("-mapping candidate fusion transcripts to gene annotations.")
+
+    write_chims_described_header(ofh)
+
+    num_errors = 0
+    num_reads = 0
+    last_progress_time = time.time()
+
+    for reads in group_reads_by_name(bamreader):
+
+        num_reads += 1
+        current_time = time.time()
+        if current_time - last_progress_time >= PROGRESS_INTERVAL:
+            logger.info("  ... processed alignments for {} reads".format(num_reads))
+            last_progress_time = current_time
+
+        report_lines, errors = evaluate_read_alignments(reads, chim_annot_mapper, min_per_id)
+        num_errors += errors
+
+        for report_line in report_lines:
+            ofh.write(report_line)
+            if columnar_builder is not None:
+                columnar_builder.add_report_line(report_line)
+
+    logger.info("  ... processed alignments for {} reads".format(num_reads))
+
+    return num_errors
+
+
+def evaluate_read_alignments(reads, chim_annot_mapper, min_per_id):
+    """
+    returns (list of chims_described report lines, num errors encountered) for a read's alignments
+    """
+
+    read_aligns = reads_to_gxf_alignments(reads)
+
+    if len(read_aligns) < 2:
+        # only want candidate chimeras
+        return [], 0
+
+    return chim_annot_mapper.evaluate_target_alignments(reads[0].query_name, read_aligns, min_per_id)
+
+
+###################################
+## Sharded (multi-process) evaluation
+###################################
+
+_shard_chim_annot_mapper = None  # inherited by the forked workers
+
+
+def write_chims_described_sharded(
+    chim_bam_filename, chim_annot_mapper, min_per_id, ofh, columnar_builder, num_workers
+):
+
+    global _shard_chim_annot_mapper
+
+    logger.info("-mapping candidate fusion transcripts to gene annotations.")
+
+    shards = plan_bam_shards(chim_bam_filename, num_workers * SHARDS_PER_WORKER)
+    logger.info(
+        "-evaluating {} in {} shards by {} workers".format(chim_bam_filename, len(shards), num_workers)
+    )
+
+    # built once here, and shared with the workers
+    chim_annot_mapper.build_interval_trees()
+    _shard_chim_annot_mapper = chim_annot_mapper
+
+    write_chims_described_header(ofh)
+
+    job_params = [
+        (chim_bam_filename, start_voffset, stop_read_name, min_per_id)
+        for start_voffset, stop_read_name in shards
+    ]
+
+    num_errors = 0
+    num_reads = 0
+    last_progress_time = time.time()
+
+    with multiprocessing.get_context("fork").Pool(processes=min(num_workers, len(shards))) as pool:
+        # shard reports come back in input order
+        for shard_num, (shard_num_reads, report_lines, errors) in enumerate(
+            pool.imap(_evaluate_bam_shard_star, job_params), 1
+        ):
+            num_reads += shard_num_reads
+            num_errors += errors
+
+            for report_line in report_lines:
+                ofh.write(report_line)
+                if columnar_builder is not None:
+                    columnar_builder.add_report_line(report_line)
+
+            current_time = time.time()
+            if current_time - last_progress_time >= PROGRESS_INTERVAL:
+                logger.info(
+                    "  ... processed alignments for {} reads ({} of {} shards)".format(
+                        num_reads, shard_num, len(shards)
+                    )
+                )
+                last_progress_time = current_time
+
+    logger.info("  ... processed alignments for {} reads".format(num_reads))
+
+    return num_errors
+
+
+def _evaluate_bam_shard_star(params):
+    return _evaluate_bam_shard(*params)
+
+
+def _evaluate_bam_shard(chim_bam_filename, start_voffset, stop_read_name, min_per_id):
+    """
+    returns (num reads examined, list of chims_described report lines, num errors encountered)
+    """
+
+    bamreader = pysam.AlignmentFile(chim_bam_filename, "rb", check_sq=False)
+    bamreader.seek(start_voffset)
+
+    num_reads = 0
+    shard_report_lines = list()
+    num_errors = 0
+
+    for reads in group_reads_by_name(bamreader, stop_read_name):
+        num_reads += 1
+        report_lines, errors = evaluate_read_alignments(reads, _shard_chim_annot_mapper, min_per_id)
+        shard_report_lines.extend(report_lines)
+        num_errors += errors
+
+    bamreader.close()
+
+    return num_reads, shard_report_lines, num_errors
+
+
+def reads_to_gxf_alignments(reads, allow_non_primary=False):
+    """
+    Converts the bam records for a single read into the alignment segments that
+    SAM_to_gxf.pl would write, keyed by the same alignment IDs (read_name.p<N>).
+    """
+
+    align_id_to_exons = dict()
+    path_counter = 0
+
+    for read in reads:
+
+        if read.is_secondary and not allow_non_primary:
+            continue
+
+        if read.is_unmapped:
+            continue
+
+        read_name = read.query_name
+        if re.search(r"\.p\d$", read_name):
+            # not the first path reported.
+            continue
+
+        if not read.has_tag("NM"):
+            raise RuntimeError(
+                "Error, couldn't extract num mismatches from sam record: {}".format(
+                    read.to_string()
+                )
+            )
+        NM = read.get_tag("NM")
+
+        cigar_align = read.cigarstring
+        num_indel_nts = sum(
+            [int(x) for x in re.findall(r"(\d+)[DI]", cigar_align)]
+        )
+
+        num_mismatches = NM - num_indel_nts
+        if num_mismatches < 0:
+            raise RuntimeError(
+                "Error, calculated negative mismatch count from: NM:{}, indel:{}, cigar: {}".format(
+                    NM, num_indel_nts, cigar_align
+                )
+            )
+
+        scaff_name = read.reference_name
+        strand = "-" if read.is_reverse else "+"
+
+        genome_coords, query_coords = get_alignment_coords(read, cigar_align, strand)
+
+        align_len = 0
+        for coordset in genome_coords:
+            align_len += abs(coordset[1] - coordset[0]) + 1
+
+        per_id = "{:.1f}".format(100 - num_mismatches / align_len * 100)
+
+        path_counter += 1
+        align_id = "{}.p{}".format(read_name, path_counter)
+
+        genome_n_trans_coords = list()
+        for genome_coordset, trans_coordset in zip(genome_coords, query_coords):
+            trans_lend, trans_rend = sorted(trans_coordset)
+            genome_n_trans_coords.append(
+                [genome_coordset[0], genome_coordset[1], trans_lend, trans_rend]
+            )
+
+        ## merge neighboring features if within a short distance unlikely to represent an intron.
+        merged_coords = [genome_n_trans_coords.pop(0)]
+        for coordset in genome_n_trans_coords:
+            last_coordset = merged_coords[-1]
+            if coordset[0] - last_coordset[1] <= MERGE_DIST:
+                last_coordset[1] = coordset[1]
+                if strand == "+":
+                    last_coordset[3] = coordset[3]
+                else:
+                    last_coordset[2] = coordset[2]
+            else:
+                merged_coords.append(coordset)
+
+        align_id_to_exons[align_id] = [
+            {
+                "chr": scaff_name,
+                "lend": genome_lend,
+                "rend": genome_rend,
+                "orient": strand,
+                "per_id": float(per_id),
+                "range_lend": trans_lend,
+                "range_rend": trans_rend,
+            }
+            for (genome_lend, genome_rend, trans_lend, trans_rend) in merged_coords
+        ]
+
+    return align_id_to_exons
+
+
+def get_alignment_coords(read, cigar_align, strand):
+    """
+    Per SAM_entry::get_alignment_coords(), returns the list of aligned genome
+    segments and the corresponding read coordinates (read coordinates are
+    reverse-complemented for minus strand alignments).
+    """
+
+    genome_lend = read.reference_start  # pointer just before first position.
+    query_lend = 0
+
+    genome_coords = list()
+    query_coords = list()
+
+    sum_hardmasked_query = 0
+
+    for length, code in re.findall(r"(\d+)([A-Z=])", cigar_align):
+        length = int(length)
+
+        if code not in "MSDNIH=X":
+            raise RuntimeError(
+                "Error, cannot parse cigar code [{}] {}".format(code, read.to_string())
+            )
+
+        if code in "M=X":
+            genome_rend = genome_lend + length
+            query_rend = query_lend + length
+
+            genome_coords.append([genome_lend + 1, genome_rend])
+            query_coords.append([query_lend + 1, query_rend])
+
+            genome_lend = genome_rend
+            query_lend = query_rend
+
+        elif code in "DN":
+            genome_lend += length
+
+        else:
+            # I, S, H
+            query_lend += length
+            if code == "H":
+                sum_hardmasked_query += length
+
+    if strand == "-":
+        seq = read.query_sequence
+        read_len = len(seq) if seq else 1  # SAM '*' sequence
+        read_len += sum_hardmasked_query
+
+        query_coords = [
+            [read_len - lend + 1, read_len - rend + 1] for (lend, rend) in query_coords
+        ]
+
+    return genome_coords, query_coords
+
+
+class ChimAnnotMapper:
+    """
+    Maps chimeric alignment segments to annotated genes and exon boundaries,
+    as done by genome_gff3_to_chim_summary.pl
+    """
+
+    def __init__(self, annot_gtf_file, annot_index_dir=None):
+
+        self.interval_trees = dict()
+
+        # use the prebuilt annotation index when available, otherwise parse the gtf.
+        self.annot_index = AnnotIndex.load_if_current(annot_index_dir, annot_gtf_file)
+
+        if self.annot_index is not None:
+            logger.info("-using annotation index {}".format(annot_index_dir))
+            self.genes = None
+            self.gene_name_to_idx = dict()
+            self.gene_transcripts_cache = dict()
+        else:
+            self.genes = parse_gtf_exons(annot_gtf_file)
+
+    def build_interval_trees(self):
+        """
+        builds the interval trees of all chroms up front (ie. before forking workers)
+        """
+
+        chroms = self.annot_index.get_chroms() if self.annot_index is not None else sorted(self.genes.keys())
+        for chrom in chroms:
+            self._get_interval_tree(chrom)
+
+    def _get_interval_tree(self, chrom):
+
+        # built on first use of each chrom
+        if chrom in self.interval_trees:
+            return self.interval_trees[chrom]
+
+        i_tree = None
+
+        if self.annot_index is not None:
+            gene_start, gene_end = self.annot_index.get_chrom_gene_range(chrom)
+            if gene_start < gene_end:
+                i_tree = PerlIntervalTree()
+                gene_names = self.annot_index.gene_names[gene_start:gene_end].tolist()
+                gene_lends = self.annot_index.gene_lend[gene_start:gene_end].tolist()
+                gene_rends = self.annot_index.gene_rend[gene_start:gene_end].tolist()
+                for i, gene_id in enumerate(gene_names):
+                    i_tree.insert(gene_id, gene_lends[i], gene_rends[i])
+                    self.gene_name_to_idx[(chrom, gene_id)] = gene_start + i
+
+        elif chrom in self.genes:
+            i_tree = PerlIntervalTree()
+            for gene_id in sorted(self.genes[chrom].keys()):
+                coords = list()
+                for exons in self.genes[chrom][gene_id].values():
+                    for exon in exons:
+                        coords.extend([exon[0], exon[1]])
+                i_tree.insert(gene_id, min(coords), max(coords))
+
+        self.interval_trees[chrom] = i_tree
+
+        return i_tree
+
+    def _get_gene_transcripts(self, chrom, gene_id):
+        """
+        returns dict of transcript_id -> list of (lend, rend, orient)
+        """
+
+        if self.annot_index is None:
+            return self.genes[chrom][gene_id]
+
+        gene_idx = self.gene_name_to_idx[(chrom, gene_id)]
+        gene_transcripts = self.gene_transcripts_cache.get(gene_idx, None)
+        if gene_transcripts is None:
+            gene_transcripts = self.gene_transcripts_cache[
+                gene_idx
+            ] = self.annot_index.get_gene_transcripts(gene_idx)
+
+        return gene_transcripts
+
+    def get_overlapping_genes(self, chrom, lend, rend):
+
+        if lend == rend:
+            ## let's not trust this single point.
+            return []
+
+        interval_tree = self._get_interval_tree(chrom)
+        if interval_tree is None:
+            # no genes on that chr?
+            return []
+
+        return interval_tree.fetch(lend, rend)
+
+    def evaluate_target_alignments(self, target, align_id_to_exons, min_per_id):
+        """
+        returns (list of chims_described report lines, num errors encountered)
+        """
+
+        num_errors = 0
+
+        span_ids = sorted(align_id_to_exons.keys())
+        if len(span_ids) < 2:
+            return [], num_errors
+
+        spans = list()
+        for span_id in span_ids:
+            try:
+                span_struct = convert_to_span(align_id_to_exons[span_id])
+            except RuntimeError as e:
+                logger.error(str(e))
+                num_errors += 1
+                continue
+
+            if float(span_struct["per_id"]) >= min_per_id:
+                spans.append(span_struct)
+
+        outline_text = "{}\t{}".format(target, len(spans))
+
+        # order spans according to transcript coordinates (stable sort)
+        spans = sorted(
+            spans, key=lambda x: (x["range_lend"], x["range_rend"], x["chr"], x["lend"])
+        )
+
+        fusion_preds = list()
+
+        prev_align = None
+        for align in spans:
+
+            align["align_text"] = "[{}:({}-{}){}-{} ({}) {}%]".format(
+                align["chr"],
+                align["range_lend"],
+                align["range_rend"],
+                align["lend"],
+                align["rend"],
+                align["orient"],
+                align["per_id"],
+            )
+
+            if prev_align is not None:
+
+                left_align, right_align = prev_align, align
+
+                left_possibilities = self.map_to_annotated_exon_junctions(
+                    left_align, "left"
+                )
+                right_possibilities = self.map_to_annotated_exon_junctions(
+                    right_align, "right"
+                )
+
+                for left_possibility in left_possibilities:
+                    for right_possibility in right_possibilities:
+
+                        left_entry, right_entry = left_possibility, right_possibility
+
+                        if left_entry["gene_id"] == right_entry["gene_id"]:
+                            continue  # no selfies
+
+                        if (
+                            left_entry["sense_or_antisense"]
+                            != right_entry["sense_or_antisense"]
+                        ):
+                            continue
+
+                        if left_entry["sense_or_antisense"] == "antisense":
+                            # swap em
+                            left_entry, right_entry = right_entry, left_entry
+
+                        foldback_flag = (
+                            "FOLDBACK"
+                            if is_foldback_alignment(left_align, right_align)
+                            else ""
+                        )
+
+                        at_exon_junctions = [
+                            left_entry["gene_id"],
+                            left_entry["delta"],
+                            left_entry["trans_brkpt"],
+                            "{}:{}".format(left_entry["chr"], left_entry["pt_align"]),
+                            right_entry["gene_id"],
+                            right_entry["delta"],
+                            right_entry["trans_brkpt"],
+                            "{}:{}".format(right_entry["chr"], right_entry["pt_align"]),
+                            "--".join([left_entry["gene_id"], right_entry["gene_id"]]),
+                            foldback_flag,
+                        ]
+
+                        chim_align_descrs = [
+                            left_entry["alignment"]["align_text"],
+                            right_entry["alignment"]["align_text"],
+                        ]
+
+                        report_text = (
+                            outline_text
+                            + "\t"
+                            + ";".join(chim_align_descrs)
+                            + "\t"
+                            + ";".join([str(x) for x in at_exon_junctions])
+                            + "\n"
+                        )
+
+                        fusion_preds.append(
+                            {
+                                "delta_sum": left_entry["delta"] + right_entry["delta"],
+                                "report_text": report_text,
+                            }
+                        )
+
+            prev_align = align
+
+        report_lines = list()
+        if fusion_preds:
+            fusion_preds = sorted(fusion_preds, key=lambda x: x["delta_sum"])
+            min_delta_sum = fusion_preds[0]["delta_sum"]
+            for pred in fusion_preds:
+                if pred["delta_sum"] != min_delta_sum:
+                    break
+                report_lines.append(pred["report_text"])
+
+        return report_lines, num_errors
+
+    def map_to_annotated_exon_junctions(self, align_struct, left_or_right):
+
+        chrom = align_struct["chr"]
+        align_lend = align_struct["lend"]
+        align_rend = align_struct["rend"]
+        align_orient = align_struct["orient"]
+
+        align_end5, align_end3 = (
+            (align_lend, align_rend) if align_orient == "+" else (align_rend, align_lend)
+        )
+
+        genome_to_trans_coord_mapping = {
+            align_end5: align_struct["range_lend"],
+        }
+        genome_to_trans_coord_mapping[align_end3] = align_struct["range_rend"]
+
+        hits = list()
+
+        for gene_id in self.get_overlapping_genes(chrom, align_lend, align_rend):
+
+            gene_transcripts = self._get_gene_transcripts(chrom, gene_id)
+
+            for transcript_id in sorted(gene_transcripts.keys()):
+
+                exons = sorted(gene_transcripts[transcript_id], key=lambda x: x[0])
+
+                trans_rend = exons[-1][1]
+                if not align_lend < trans_rend:
+                    # no overlap
+                    continue
+
+                for exon_lend, exon_rend, exon_orient in exons:
+
+                    exon_end5, exon_end3 = (
+                        (exon_lend, exon_rend)
+                        if exon_orient == "+"
+                        else (exon_rend, exon_lend)
+                    )
+
+                    if not (exon_lend < align_rend and exon_rend > align_lend):
+                        continue
+
+                    # annotated exon overlaps transcript
+
+                    if exon_orient == align_orient:
+                        sense_or_antisense = "sense"
+                        if left_or_right == "left":
+                            # examine donor sites
+                            exon_coord, align_coord = exon_end3, align_end3
+                        else:
+                            # examine acceptor sites
+                            exon_coord, align_coord = exon_end5, align_end5
+                    else:
+                        # antisense orientation to gene
+                        sense_or_antisense = "antisense"
+                        if left_or_right == "left":
+                            exon_coord, align_coord = exon_end5, align_end3
+                        else:
+                            exon_coord, align_coord = exon_end3, align_end5
+
+                    hits.append(
+                        {
+                            "delta": abs(align_coord - exon_coord),
+                            "gene_id": gene_id,
+                            "pt_align": align_coord,
+                            "sense_or_antisense": sense_or_antisense,
+                            "alignment": align_struct,
+                            "chr": chrom,
+                            "trans_brkpt": genome_to_trans_coord_mapping[align_coord],
+                        }
+                    )
+
+        # only best per gene
+        hits_ret = list()
+        seen = set()
+        for hit in sorted(hits, key=lambda x: x["delta"]):
+            if hit["gene_id"] not in seen:
+                hits_ret.append(hit)
+                seen.add(hit["gene_id"])
+
+        return hits_ret
+
+
+def convert_to_span(exons):
+
+    chr_coords = list()
+    span_coords = list()
+
+    chrom = None
+    orient = None
+
+    sum_per_id = 0
+    sum_len = 0
+
+    for exon in exons:
+
+        chr_coords.extend([exon["lend"], exon["rend"]])
+        span_coords.extend([exon["range_lend"], exon["range_rend"]])
+
+        exon_len = abs(exon["rend"] - exon["lend"] + 1)
+        sum_len += exon_len
+        sum_per_id += exon_len * exon["per_id"]
+
+        if chrom is not None and exon["chr"] != chrom:
+            raise RuntimeError("inconsistent ({}) chr assignments: {}".format(chrom, exons))
+        chrom = exon["chr"]
+
+        if orient is not None and exon["orient"] != orient:
+            raise RuntimeError("inconsistent exon orient: {}".format(exons))
+        orient = exon["orient"]
+
+    return {
+        "lend": min(chr_coords),
+        "rend": max(chr_coords),
+        "orient": orient,
+        "chr": chrom,
+        "range_lend": min(span_coords),
+        "range_rend": max(span_coords),
+        "per_id": "{:.2f}".format(sum_per_id / sum_len),
+    }
+
+
+def is_foldback_alignment(left_align, right_align):
+
+    ## Fold-back alignments are artifacts where a read maps to physically overlapping
+    ## genomic regions on opposite strands.
+
+    if left_align["chr"] != right_align["chr"]:
+        return False
+
+    if left_align["orient"] == right_align["orient"]:
+        return False
+
+    return (
+        left_align["lend"] <= right_align["rend"]
+        and right_align["lend"] <= left_align["rend"]
+    )
+
+
+class PerlIntervalTree:
+    """
+    Red-black interval tree replicating the insertion and fetch traversal of the
+    Set::IntervalTree perl module (plugins/Set-IntervalTree-0.01), so that the
+    order of overlapping genes reported, and hence tie-breaking downstream,
+    matches genome_gff3_to_chim_summary.pl.  Intervals are closed: [low, high].
+    """
+
+    INT_MIN = -(2**31)
+    INT_MAX = 2**31 - 1
+
+    class _Node:
+        __slots__ = ("value", "key", "high", "max_high", "left", "right", "parent", "red")
+
+        def __init__(self, value, low, high):
+            self.value = value
+            self.key = low
+            self.high = high
+            self.max_high = high
+            self.left = self.right = self.parent = None
+            self.red = False
+
+    def __init__(self):
+        nil = self._Node(None, self.INT_MIN, self.INT_MIN)
+        nil.left = nil.right = nil.parent = nil
+        self.nil = nil
+
+        root = self._Node(None, self.INT_MAX, self.INT_MAX)
+        root.left = root.right = root.parent = nil
+        self.root = root
+
+    def _left_rotate(self, x):
+        nil = self.nil
+        y = x.right
+        x.right = y.left
+        if y.left is not nil:
+            y.left.parent = x
+        y.parent = x.parent
+        if x is x.parent.left:
+            x.parent.left = y
+        else:
+            x.parent.right = y
+        y.left = x
+        x.parent = y
+
+        x.max_high = max(x.left.max_high, x.right.max_high, x.high)
+        y.max_high = max(x.max_high, y.right.max_high, y.high)
+
+    def _right_rotate(self, y):
+        nil = self.nil
+        x = y.left
+        y.left = x.right
+        if x.right is not nil:
+            x.right.parent = y
+        x.parent = y.parent
+        if y is y.parent.left:
+            y.parent.left = x
+        else:
+            y.parent.right = x
+        x.right = y
+        y.parent = x
+
+        y.max_high = max(y.left.max_high, y.right.max_high, y.high)
+        x.max_high = max(x.left.max_high, y.max_high, x.high)
+
+    def insert(self, value, low, high):
+
+        nil, root = self.nil, self.root
+
+        z = self._Node(value, low, high)
+        z.left = z.right = nil
+        y = root
+        x = root.left
+        while x is not nil:
+            y = x
+            x = x.left if x.key > z.key else x.right
+        z.parent = y
+        if y is root or y.key > z.key:
+            y.left = z
+        else:
+            y.right = z
+
+        # fix up max high
+        w = z.parent
+        while w is not root:
+            w.max_high = max(w.high, w.left.max_high, w.right.max_high)
+            w = w.parent
+
+        x = z
+        x.red = True
+        while x.parent.red:
+            if x.parent is x.parent.parent.left:
+                y = x.parent.parent.right
+                if y.red:
+                    x.parent.red = False
+                    y.red = False
+                    x.parent.parent.red = True
+                    x = x.parent.parent
+                else:
+                    if x is x.parent.right:
+                        x = x.parent
+                        self._left_rotate(x)
+                    x.parent.red = False
+                    x.parent.parent.red = True
+                    self._right_rotate(x.parent.parent)
+            else:
+                y = x.parent.parent.left
+                if y.red:
+                    x.parent.red = False
+                    y.red = False
+                    x.parent.parent.red = True
+                    x = x.parent.parent
+                else:
+                    if x is x.parent.left:
+                        x = x.parent
+                        self._right_rotate(x)
+                    x.parent.red = False
+                    x.parent.parent.red = True
+                    self._left_rotate(x.parent.parent)
+        root.left.red = False
+
+        return
+
+    def fetch(self, low, high):
+
+        nil = self.nil
+        results = list()
+
+        # entries: [start_node, try_right_branch, parent_index]
+        recursion_node_stack = [[None, False, 0]]
+        current_parent = 0
+
+        x = self.root.left
+        stuff_to_do = x is not nil
+
+        while stuff_to_do:
+            if low <= x.high and x.key <= high:
+                results.append(x.value)
+                recursion_node_stack[current_parent][1] = True
+
+            if x.left.max_high >= low:
+                recursion_node_stack.append([x, False, current_parent])
+                current_parent = len(recursion_node_stack) - 1
+                x = x.left
+            else:
+                x = x.right
+
+            stuff_to_do = x is not nil
+            while (not stuff_to_do) and len(recursion_node_stack) > 1:
+                start_node, try_right_branch, parent_index = recursion_node_stack.pop()
+                if try_right_branch:
+                    x = start_node.right
+                    current_parent = parent_index
+                    recursion_node_stack[current_parent][1] = True
+                    stuff_to_do = x is not nil
+
+        return results
+
+
+if __name__ == "__main__":
+    main()
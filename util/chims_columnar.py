@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+
+import sys, os, re
+import logging
+import argparse
+import json
+import shutil
+import numpy as np
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s : %(levelname)s : %(message)s",
+    datefmt="%H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+## Columnar form of the chims_described report, shared by the phase-1 consumers so that
+## each of them doesn't re-split the text report and rebuild per-fusion arrays.
+##
+## Written alongside the text report by chim_bam_to_chims_described.py --columnar_output
+## (or converted from an existing report via --build_from) as a directory of .npy arrays:
+##
+##    mm2.chims_described.columnar/
+##
+## One row per chims_described record, in report order. Read, gene and fusion names are
+## dictionary-encoded, each *_idx array indexing into the names array:
+##
+##   read_names, read_idx                  read (transcript) accession
+##   gene_names, geneA_idx, geneB_idx      genes at the left and right of the breakpoint
+##   fusion_names, fusion_idx              fusion name (geneA--geneB)
+##   deltaA, deltaB                        distance of the breakpoint from the reference exon boundary
+##   trans_brkptA, trans_brkptB            breakpoint coordinates along the read
+##   is_foldback                           FOLDBACK flagged records
+##   is_chrM                               records having a mitochondrial breakpoint
+##
+## Usage from the perl consumers:
+##
+##   --fusion_summary_output     per-fusion median/min deltas and read counts (vectorized group-by)
+##   --fusion_reads_output       fusion name and read for each record of the --fusions targets
+
+
+CHIMS_COLUMNAR_FORMAT_VERSION = 1
+
+CHIMS_COLUMNAR_ARRAYS = (
+    "read_names",
+    "read_idx",
+    "gene_names",
+    "geneA_idx",
+    "geneB_idx",
+    "fusion_names",
+    "fusion_idx",
+    "deltaA",
+    "deltaB",
+    "trans_brkptA",
+    "trans_brkptB",
+    "is_foldback",
+    "is_chrM",
+)
+
+FUSION_SUMMARY_COLUMNS = [
+    "#FusionName",
+    "median_deltaA",
+    "median_deltaB",
+    "min_deltaA",
+    "min_deltaB",
+    "median_trans_brkpt_delta",
+    "min_trans_brkpt_delta",
+    "num_reads",
+    "num_foldback_reads",
+]
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="build or summarize the columnar chims_described intermediate",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument(
+        "--chims_columnar",
+        type=str,
+        required=True,
+        help="columnar chims_described directory",
+    )
+    parser.add_argument(
+        "--build_from",
+        type=str,
+        required=False,
+        default=None,
+        help="chims_described text report to build the columnar directory from",
+    )
+    parser.add_argument(
+        "--fusion_summary_output",
+        type=str,
+        required=False,
+        default=None,
+        help="write per-fusion delta and read count summary (excluding chrM records)",
+    )
+    parser.add_argument(
+        "--fusions",
+        type=str,
+        required=False,
+        default=None,
+        help="fusion targets file (fusion name in the first column, with header) for --fusion_reads_output",
+    )
+    parser.add_argument(
+        "--fusion_reads_output",
+        type=str,
+        required=False,
+        default=None,
+        help="write fusion name and read of each (non-chrM) record, restricted to the --fusions targets",
+    )
+
+    args = parser.parse_args()
+
+    if args.build_from:
+        builder = ChimsColumnarBuilder()
+        with open(args.build_from, "rt") as fh:
+            for line in fh:
+                builder.add_report_line(line)
+        builder.write(args.chims_columnar, args.build_from)
+
+    chims = ChimsColumnar(args.chims_columnar)
+
+    if args.fusion_summary_output:
+        write_fusion_summary(chims, args.fusion_summary_output)
+
+    if args.fusion_reads_output:
+        if not args.fusions:
+            raise RuntimeError("Error, --fusion_reads_output requires --fusions")
+        write_fusion_reads(chims, parse_fusion_targets(args.fusions), args.fusion_reads_output)
+
+    sys.exit(0)
+
+
+class NameEncoder:
+    """
+    dictionary-encodes names in order of first appearance
+    """
+
+    def __init__(self):
+        self.name_to_idx = dict()
+
+    def encode(self, name):
+        idx = self.name_to_idx.get(name)
+        if idx is None:
+            idx = self.name_to_idx[name] = len(self.name_to_idx)
+        return idx
+
+    def get_names(self):
+        return np.array(list(self.name_to_idx.keys()), dtype=str)
+
+
+class ChimsColumnarBuilder:
+    """
+    accumulates chims_described report lines into columns
+    """
+
+    def __init__(self):
+
+        self.read_encoder = NameEncoder()
+        self.gene_encoder = NameEncoder()
+        self.fusion_encoder = NameEncoder()
+
+        self.columns = {
+            array_name: list()
+            for array_name in CHIMS_COLUMNAR_ARRAYS
+            if not array_name.endswith("_names")
+        }
+
+    def add_report_line(self, line):
+
+        if line.startswith("#"):
+            # header or comment
+            return
+
+        vals = line.rstrip("\n").split("\t")
+        trans_acc = vals[0]
+        fusion_info = vals[3]
+
+        fusion_info_vals = fusion_info.split(";")
+        geneA, deltaA, trans_brkptA, chrA_n_coordA = fusion_info_vals[0:4]
+        geneB, deltaB, trans_brkptB, chrB_n_coordB = fusion_info_vals[4:8]
+        fusion_name = fusion_info_vals[8]
+        # foldback flag may be empty or absent (older reports)
+        foldback_flag = fusion_info_vals[9] if len(fusion_info_vals) > 9 else ""
+
+        self.columns["read_idx"].append(self.read_encoder.encode(trans_acc))
+        self.columns["geneA_idx"].append(self.gene_encoder.encode(geneA))
+        self.columns["geneB_idx"].append(self.gene_encoder.encode(geneB))
+        self.columns["fusion_idx"].append(self.fusion_encoder.encode(fusion_name))
+        self.columns["deltaA"].append(int(deltaA))
+        self.columns["deltaB"].append(int(deltaB))
+        self.columns["trans_brkptA"].append(int(trans_brkptA))
+        self.columns["trans_brkptB"].append(int(trans_brkptB))
+        self.columns["is_foldback"].append(foldback_flag == "FOLDBACK")
+        self.columns["is_chrM"].append("chrM:" in fusion_info)
+
+    def write(self, columnar_dir, source_chims_described):
+
+        arrays = {
+            "read_names": self.read_encoder.get_names(),
+            "gene_names": self.gene_encoder.get_names(),
+            "fusion_names": self.fusion_encoder.get_names(),
+            "is_foldback": np.array(self.columns["is_foldback"], dtype=bool),
+            "is_chrM": np.array(self.columns["is_chrM"], dtype=bool),
+        }
+        for array_name in ("read_idx", "geneA_idx", "geneB_idx", "fusion_idx"):
+            arrays[array_name] = np.array(self.columns[array_name], dtype=np.int32)
+        for array_name in ("deltaA", "deltaB", "trans_brkptA", "trans_brkptB"):
+            arrays[array_name] = np.array(self.columns[array_name], dtype=np.int64)
+
+        # write to a tmp dir then move into place, so a partial directory is never picked up.
+        tmp_columnar_dir = columnar_dir + ".tmp.{}".format(os.getpid())
+        if os.path.exists(tmp_columnar_dir):
+            shutil.rmtree(tmp_columnar_dir)
+        os.makedirs(tmp_columnar_dir)
+
+        for array_name, array in arrays.items():
+            np.save(os.path.join(tmp_columnar_dir, array_name + ".npy"), array)
+
+        with open(os.path.join(tmp_columnar_dir, "meta.json"), "wt") as ofh:
+            json.dump(
+                {
+                    "format_version": CHIMS_COLUMNAR_FORMAT_VERSION,
+                    "source_chims_described": os.path.basename(source_chims_described),
+                    "num_records": len(arrays["read_idx"]),
+                    "num_reads": len(arrays["read_names"]),
+                    "num_fusions": len(arrays["fusion_names"]),
+                },
+                ofh,
+                indent=2,
+            )
+
+        if os.path.exists(columnar_dir):
+            shutil.rmtree(columnar_dir)
+        os.rename(tmp_columnar_dir, columnar_dir)
+
+        logger.info(
+            "-wrote columnar chims_described: {} records, {} reads, {} fusions".format(
+                len(arrays["read_idx"]), len(arrays["read_names"]), len(arrays["fusion_names"])
+            )
+        )
+
+        return
+
+
+class ChimsColumnar:
+    """
+    Read-only, memory-mapped view of a columnar chims_described directory
+    """
+
+    def __init__(self, columnar_dir):
+
+        with open(os.path.join(columnar_dir, "meta.json"), "rt") as fh:
+            self.meta = json.load(fh)
+
+        if self.meta["format_version"] != CHIMS_COLUMNAR_FORMAT_VERSION:
+            raise RuntimeError(
+                "Error, columnar chims_described {} is format version {}, expected {}".format(
+                    columnar_dir, self.meta["format_version"], CHIMS_COLUMNAR_FORMAT_VERSION
+                )
+            )
+
+        for array_name in CHIMS_COLUMNAR_ARRAYS:
+            setattr(
+                self,
+                array_name,
+                np.load(os.path.join(columnar_dir, array_name + ".npy"), mmap_mode="r"),
+            )
+
+
+def group_rows_by_fusion(fusion_idx):
+    """
+    returns (row order grouping rows by fusion while keeping report order within each fusion,
+             fusion idx of each group, group start offsets into the row order, group sizes)
+    """
+
+    row_order = np.argsort(fusion_idx, kind="stable")
+    sorted_fusion_idx = fusion_idx[row_order]
+
+    group_starts = np.flatnonzero(np.r_[True, sorted_fusion_idx[1:] != sorted_fusion_idx[:-1]])
+    group_sizes = np.diff(np.r_[group_starts, len(sorted_fusion_idx)])
+
+    return row_order, sorted_fusion_idx[group_starts], group_starts, group_sizes
+
+
+def group_min_and_median(fusion_idx, vals, group_starts, group_sizes):
+    """
+    per-group min and median (mean of the two middle values for even sized groups) of vals
+    """
+
+    # sort the values within each group
+    sorted_vals = vals[np.lexsort((vals, fusion_idx))]
+
+    group_min = sorted_vals[group_starts]
+    group_median = (
+        sorted_vals[group_starts + (group_sizes - 1) // 2] + sorted_vals[group_starts + group_sizes // 2]
+    ) / 2
+
+    return group_min, group_median
+
+
+def summarize_fusions(chims):
+    """
+    returns dict of per-fusion arrays, in order of fusion first appearance, excluding chrM records
+    """
+
+    keep = ~np.asarray(chims.is_chrM)
+    fusion_idx = np.asarray(chims.fusion_idx)[keep]
+
+    summary = {"fusion_names": np.array([], dtype=str), "num_reads": np.array([], dtype=np.int64)}
+
+    if len(fusion_idx) == 0:
+        return summary
+
+    _, group_fusion_idx, group_starts, group_sizes = group_rows_by_fusion(fusion_idx)
+
+    summary["fusion_names"] = np.asarray(chims.fusion_names)[group_fusion_idx]
+    summary["num_reads"] = group_sizes
+    summary["num_foldback_reads"] = np.bincount(
+        fusion_idx, weights=np.asarray(chims.is_foldback)[keep], minlength=len(chims.fusion_names)
+    )[group_fusion_idx].astype(np.int64)
+
+    trans_brkpt_delta = np.abs(np.asarray(chims.trans_brkptB)[keep] - np.asarray(chims.trans_brkptA)[keep])
+
+    for col_name, vals in (
+        ("deltaA", np.asarray(chims.deltaA)[keep]),
+        ("deltaB", np.asarray(chims.deltaB)[keep]),
+        ("trans_brkpt_delta", trans_brkpt_delta),
+    ):
+        summary["min_" + col_name], summary["median_" + col_name] = group_min_and_median(
+            fusion_idx, vals, group_starts, group_sizes
+        )
+
+    return summary
+
+
+def write_fusion_summary(chims, output_filename):
+
+    summary = summarize_fusions(chims)
+
+    with open(output_filename, "wt") as ofh:
+        print("\t".join(FUSION_SUMMARY_COLUMNS), file=ofh)
+        for i, fusion_name in enumerate(summary["fusion_names"]):
+            print(
+                "\t".join(
+                    [
+                        str(fusion_name),
+                        format_median(summary["median_deltaA"][i]),
+                        format_median(summary["median_deltaB"][i]),
+                        str(summary["min_deltaA"][i]),
+                        str(summary["min_deltaB"][i]),
+                        format_median(summary["median_trans_brkpt_delta"][i]),
+                        str(summary["min_trans_brkpt_delta"][i]),
+                        str(summary["num_reads"][i]),
+                        str(summary["num_foldback_reads"][i]),
+                    ]
+                ),
+                file=ofh,
+            )
+
+    logger.info("-wrote summary of {} fusions to {}".format(len(summary["fusion_names"]), output_filename))
+
+    return
+
+
+def format_median(val):
+    # medians are integral or half-integral
+    return str(int(val)) if val == int(val) else str(val)
+
+
+def write_fusion_reads(chims, fusion_targets, output_filename):
+
+    fusion_names = np.asarray(chims.fusion_names)
+    is_target_fusion = np.isin(fusion_names, np.array(sorted(fusion_targets), dtype=str))
+
+    fusion_idx = np.asarray(chims.fusion_idx)
+    rows = np.flatnonzero(is_target_fusion[fusion_idx] & ~np.asarray(chims.is_chrM))
+
+    # grouped by fusion, in report order within each fusion
+    row_order, _, _, _ = group_rows_by_fusion(fusion_idx[rows])
+    rows = rows[row_order]
+
+    read_names = np.asarray(chims.read_names)
+
+    with open(output_filename, "wt") as ofh:
+        print("#FusionName\tread", file=ofh)
+        for fusion_i, read_i in zip(fusion_idx[rows], np.asarray(chims.read_idx)[rows]):
+            print("{}\t{}".format(fusion_names[fusion_i], read_names[read_i]), file=ofh)
+
+    logger.info("-wrote {} fusion reads to {}".format(len(rows), output_filename))
+
+    return
+
+
+def parse_fusion_targets(fusions_filename):
+
+    fusion_targets = set()
+    with open(fusions_filename, "rt") as fh:
+        fh.readline()  # header
+        for line in fh:
+            fusion_targets.add(line.rstrip("\n").split("\t")[0])
+
+    return fusion_targets
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+
+import sys, os, re
+import logging
+import argparse
+import json
+import struct
+import time
+import zlib
+import multiprocessing
+import pysam
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s : %(levelname)s : %(message)s",
+    datefmt="%H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+## Counts the total number of reads (for FFPM calculations) in a fasta or fastq file (optionally gzipped),
+## or the number of primary records in a bam file (as per samtools flagstat).
+##
+## BGZF-compressed inputs (ie. bgzip, or the read store) are decompressed block-parallel across processes,
+## and record delimiters are counted over whole decompressed buffers rather than line by line.
+##
+## The count is cached in a <reads>.read_count.json sidecar (or in --cache_dir if the reads directory
+## is not writable), keyed by the file size, mtime, and inode, so the same input is only counted once.
+
+
+GZIP_MAGIC = b"\x1f\x8b"
+READ_CHUNK_SIZE = 1 << 24
+DECOMPRESS_BATCH_BLOCKS = 256  # BGZF blocks per worker task
+CACHE_SUFFIX = ".read_count.json"
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="count the total number of reads in a reads file",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument(
+        "--reads",
+        type=str,
+        required=True,
+        help="reads in fasta or fastq format (optionally gzipped), or bam",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        required=False,
+        default=None,
+        help="file to write the read count to (default: stdout)",
+    )
+    parser.add_argument(
+        "--threads", type=int, default=1, help="number of decompression processes"
+    )
+    parser.add_argument(
+        "--cache_dir",
+        type=str,
+        default=".",
+        help="directory for the read count cache if the reads directory is not writable",
+    )
+
+    args = parser.parse_args()
+
+    start_time = time.time()
+
+    cache_filenames = get_cache_filenames(args.reads, args.cache_dir)
+    file_key = get_file_key(args.reads)
+
+    num_reads = get_cached_read_count(cache_filenames, file_key)
+
+    if num_reads is not None:
+        logger.info("-using cached read count for {}: {}".format(args.reads, num_reads))
+    else:
+        num_reads = count_reads(args.reads, max(1, args.threads))
+        if num_reads < 1:
+            raise RuntimeError("Error, could not count number of reads from file: {}".format(args.reads))
+
+        write_cached_read_count(cache_filenames, file_key, num_reads)
+
+        logger.info(
+            "-counted {} reads in {}, in {:.1f} sec".format(num_reads, args.reads, time.time() - start_time)
+        )
+
+    if args.output:
+        with open(args.output, "wt") as ofh:
+            print(num_reads, file=ofh)
+    else:
+        print(num_reads)
+
+    sys.exit(0)
+
+
+def count_reads(reads_filename, num_threads):
+
+    if re.search(r"\.bam$", reads_filename, re.I):
+        return count_bam_primary_reads(reads_filename, num_threads)
+    elif re.search(r"\.(fasta|fa)(\.gz)?$", reads_filename, re.I):
+        return count_fastx_records(reads_filename, "fasta", num_threads)
+    elif re.search(r"\.(fastq|fq)(\.gz)?$", reads_filename, re.I):
+        return count_fastx_records(reads_filename, "fastq", num_threads)
+    else:
+        raise RuntimeError("Error, not recognizing type of reads file: {}".format(reads_filename))
+
+
+def count_bam_primary_reads(bam_filename, num_threads):
+
+    flagstat = pysam.flagstat("-@", str(num_threads), bam_filename)
+
+    for line in flagstat.split("\n"):
+        parts = line.split()
+        if parts and parts[-1] == "primary":
+            return int(parts[0])
+
+    raise RuntimeError("Error, no primary read count found in flagstat of {}".format(bam_filename))
+
+
+####################
+## fasta/fastq counting
+
+
+def count_fastx_records(reads_filename, fmt, num_threads):
+
+    counter = DelimiterCounter(fmt)
+
+    with open(reads_filename, "rb") as fh:
+        magic = fh.read(2)
+        fh.seek(0)
+
+        if magic != GZIP_MAGIC:
+            for chunk in iter(lambda: fh.read(READ_CHUNK_SIZE), b""):
+                counter.add(*count_delimiters(chunk, fmt))
+
+        elif is_bgzf(fh):
+            pool = multiprocessing.Pool(processes=num_threads) if num_threads > 1 else None
+            block_batches = ((block_batch, fmt) for block_batch in iter_bgzf_block_batches(fh))
+            for chunk_counts in (
+                pool.imap(decompress_and_count_blocks, block_batches)
+                if pool is not None
+                else map(decompress_and_count_blocks, block_batches)
+            ):
+                counter.add(*chunk_counts)
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        else:
+            for chunk in iter_gzip_decompressed_chunks(fh):
+                counter.add(*count_delimiters(chunk, fmt))
+
+    return counter.get_num_records()
+
+
+class DelimiterCounter:
+    """
+    combines the delimiter counts of consecutive chunks of the decompressed reads.
+    fasta records start with '>' at the start of a line, fastq records are every 4 lines.
+    """
+
+    def __init__(self, fmt):
+        self.fmt = fmt
+        self.count = 0
+        self.last_byte = ord("\n")  # as if a newline preceded the file start
+
+    def add(self, count, first_byte, last_byte):
+
+        if first_byte is None:
+            # empty chunk
+            return
+
+        self.count += count
+        if self.fmt == "fasta" and self.last_byte == ord("\n") and first_byte == ord(">"):
+            # record start spanning the chunk boundary (or at the file start)
+            self.count += 1
+
+        self.last_byte = last_byte
+
+    def get_num_records(self):
+
+        if self.fmt == "fasta":
+            return self.count
+
+        num_lines = self.count
+        if self.last_byte != ord("\n"):
+            # unterminated last line
+            num_lines += 1
+        if num_lines % 4 != 0:
+            logger.warning("-number of fastq lines ({}) is not a multiple of 4".format(num_lines))
+
+        return num_lines // 4
+
+
+def count_delimiters(data, fmt):
+    """
+    returns (count within data, first byte, last byte)
+    """
+
+    if not data:
+        return 0, None, None
+
+    if fmt == "fasta":
+        count = data.count(b"\n>")
+    else:
+        count = data.count(b"\n")
+
+    return count, data[0], data[-1]
+
+
+def iter_gzip_decompressed_chunks(fh):
+
+    # handles multi-member (concatenated) gzip files
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    for raw in iter(lambda: fh.read(READ_CHUNK_SIZE), b""):
+        while raw:
+            yield decompressor.decompress(raw)
+            if decompressor.eof:
+                raw = decompressor.unused_data
+                decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            else:
+                raw = b""
+    yield decompressor.flush()
+
+
+####################
+## BGZF block-parallel decompression
+
+
+def get_bgzf_block_size(header):
+    """
+    returns the total block size from a gzip member header having the BGZF 'BC' extra subfield, or None
+    """
+
+    if len(header) < 18 or header[:2] != GZIP_MAGIC or not (header[3] & 4):
+        return None
+
+    xlen = struct.unpack("<H", header[10:12])[0]
+    extra = header[12 : 12 + xlen]
+    pos = 0
+    while pos + 4 <= len(extra):
+        si1, si2, slen = extra[pos], extra[pos + 1], struct.unpack("<H", extra[pos + 2 : pos + 4])[0]
+        if si1 == ord("B") and si2 == ord("C") and slen == 2:
+            return struct.unpack("<H", extra[pos + 4 : pos + 6])[0] + 1
+        pos += 4 + slen
+
+    return None
+
+
+def is_bgzf(fh):
+
+    pos = fh.tell()
+    header = fh.read(18)
+    fh.seek(pos)
+
+    return get_bgzf_block_size(header) is not None
+
+
+def iter_bgzf_block_batches(fh):
+    """
+    yields lists of raw (compressed) BGZF blocks
+    """
+
+    batch = list()
+    while True:
+        header = fh.read(18)
+        if not header:
+            break
+        block_size = get_bgzf_block_size(header)
+        if block_size is None:
+            raise RuntimeError("Error, invalid BGZF block at offset {}".format(fh.tell() - len(header)))
+        block = header + fh.read(block_size - len(header))
+        if len(block) != block_size:
+            raise RuntimeError("Error, truncated BGZF block at offset {}".format(fh.tell() - len(block)))
+        batch.append(block)
+        if len(batch) >= DECOMPRESS_BATCH_BLOCKS:
+            yield batch
+            batch = list()
+
+    if batch:
+        yield batch
+
+
+def decompress_and_count_blocks(args):
+
+    blocks, fmt = args
+
+    data = b"".join(
+        zlib.decompress(block[12 + struct.unpack("<H", block[10:12])[0] : -8], -15) for block in blocks
+    )
+
+    return count_delimiters(data, fmt)
+
+
+####################
+## read count cache
+
+
+def get_cache_filenames(reads_filename, cache_dir):
+
+    cache_filenames = [
+        reads_filename + CACHE_SUFFIX,
+        os.path.join(cache_dir, os.path.basename(reads_filename) + CACHE_SUFFIX),
+    ]
+
+    if os.path.abspath(cache_filenames[0]) == os.path.abspath(cache_filenames[1]):
+        cache_filenames.pop()
+
+    return cache_filenames
+
+
+def get_file_key(reads_filename):
+
+    st = os.stat(reads_filename)
+
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "inode": st.st_ino}
+
+
+def get_cached_read_count(cache_filenames, file_key):
+
+    for cache_filename in cache_filenames:
+        if not os.path.exists(cache_filename):
+            continue
+        try:
+            with open(cache_filename, "rt") as fh:
+                cached = json.load(fh)
+        except (OSError, ValueError):
+            logger.warning("-ignoring unreadable read count cache: {}".format(cache_filename))
+            continue
+
+        if all(cached.get(key) == val for key, val in file_key.items()) and cached.get("num_reads", 0) > 0:
+            return cached["num_reads"]
+
+        logger.info("-read count cache {} is stale, recounting".format(cache_filename))
+
+    return None
+
+
+def write_cached_read_count(cache_filenames, file_key, num_reads):
+
+    cached = dict(file_key)
+    cached["num_reads"] = num_reads
+
+    for cache_filename in cache_filenames:
+        try:
+            tmp_cache_filename = cache_filename + ".tmp.{}".format(os.getpid())
+            with open(tmp_cache_filename, "wt") as ofh:
+                json.dump(cached, ofh)
+                ofh.write("\n")
+            os.replace(tmp_cache_filename, cache_filename)
+            return
+        except OSError:
+            continue
+
+    logger.warning("-unable to write a read count cache file, tried: {}".format(", ".join(cache_filenames)))
+
+
+if __name__ == "__main__":
+    main()
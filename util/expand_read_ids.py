@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+import sys, os, re
+import logging
+import argparse
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s : %(levelname)s : %(message)s",
+    datefmt="%H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+## Expands the integer read IDs in the LR_accessions column of a fusion table back into the
+## read names, using the read ID table written by LR_FI_bam_fusion_extractor.py --encode_read_ids
+## (or merge_LR-FI_fusion_shards.py --encode_read_ids).
+##
+## The intermediate fusion tables carry the compact read IDs through merging, annotation and
+## filtering, and only the deliverable reports are expanded. All other columns pass through as is.
+
+
+LR_ACCESSIONS_COLUMN = "LR_accessions"
+EMPTY_VALUES = ("", "NA", ".")
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="expand the read IDs of the LR_accessions column into the read names",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument("--fusions", type=str, required=True, help="fusion table with read IDs as the LR_accessions")
+    parser.add_argument("--read_ids", type=str, required=True, help="read ID table (read_id, read_name)")
+    parser.add_argument("--output", type=str, required=True, help="output fusion table with the read names")
+
+    args = parser.parse_args()
+
+    read_names = parse_read_ids(args.read_ids)
+
+    num_fusions = expand_read_ids(args.fusions, read_names, args.output)
+
+    logger.info("-expanded the read IDs of {} fusions to {}".format(num_fusions, args.output))
+
+    sys.exit(0)
+
+
+def parse_read_ids(read_ids_filename):
+    """
+    returns dict of read_id (as in the fusion table) -> read name
+    """
+
+    read_names = dict()
+    with open(read_ids_filename, "rt") as fh:
+        for line in fh:
+            if line.startswith("#"):
+                continue
+            read_id, read_name = line.rstrip("\n").split("\t")
+            read_names[read_id] = read_name
+
+    return read_names
+
+
+def expand_read_ids(fusions_filename, read_names, output_filename):
+    """
+    returns number of fusion rows written
+    """
+
+    num_fusions = 0
+
+    with open(fusions_filename, "rt") as fh, open(output_filename, "wt") as ofh:
+
+        header = fh.readline()
+        column_headers = header.rstrip("\n").split("\t")
+        if LR_ACCESSIONS_COLUMN not in column_headers:
+            raise RuntimeError("Error, no {} column in {}".format(LR_ACCESSIONS_COLUMN, fusions_filename))
+        LR_accessions_idx = column_headers.index(LR_ACCESSIONS_COLUMN)
+
+        ofh.write(header)
+
+        for line in fh:
+            vals = line.rstrip("\n").split("\t")
+            read_ids = vals[LR_accessions_idx]
+            if read_ids not in EMPTY_VALUES:
+                try:
+                    vals[LR_accessions_idx] = ",".join(read_names[read_id] for read_id in read_ids.split(","))
+                except KeyError as e:
+                    raise RuntimeError(
+                        "Error, read ID {} of {} not found in the read ID table".format(e, fusions_filename)
+                    )
+            ofh.write("\t".join(vals) + "\n")
+            num_fusions += 1
+
+    return num_fusions
+
+
+if __name__ == "__main__":
+    main()
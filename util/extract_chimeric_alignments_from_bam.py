@@ -1,11 +1,31 @@
 #!/usr/bin/env python3
 
-import sys
+import sys, os
 import logging
 import argparse
+import struct
+import time
+import zlib
+import multiprocessing
 import pysam
 
 
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s : %(levelname)s : %(message)s",
+    datefmt="%H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+## Filters a read-name grouped alignment bam (ie. minimap2 output) for the reads having chimeric alignments.
+##
+##   --input_bam -                  streamed from minimap2, as run by ctat-LR-fusion (optionally teeing --full_bam)
+##   --input_bam <bam> --threads N  an on-disk bam, split into N shards on read boundaries (see plan_bam_shards)
+##                                  and filtered by worker processes. Not run by the pipeline: for bams
+##                                  filtered by hand (ie. as kept via ctat-LR-fusion --keep_mm2_bam)
+
+
 def main():
 
     parser = argparse.ArgumentParser(
@@ -17,7 +37,7 @@ def main():
         "--input_bam",
         type=str,
         required=True,
-        help="input bam filename",
+        help="input bam filename, or '-' to stream sam/bam from stdin (ie. piped from minimap2)",
     )
 
     parser.add_argument(
@@ -27,28 +47,127 @@ def main():
         help="output bam filename",
     )
 
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=1,
+        help="number of worker processes; the input bam is split into this many shards on read-name boundaries. "
+        + "For streamed input, the number of bam compression threads instead",
+    )
+
+    parser.add_argument(
+        "--full_bam",
+        type=str,
+        required=False,
+        default=None,
+        help="with streamed input, also write all of the input alignments to this bam (ie. for archiving)",
+    )
+
     args = parser.parse_args()
 
     input_bam_filename = args.input_bam
     output_bam_filename = args.output_bam
+    num_threads = max(1, args.threads)
 
-    bamreader = pysam.AlignmentFile(input_bam_filename, "rb")
+    streaming = input_bam_filename == "-"
+    if args.full_bam and not streaming:
+        raise RuntimeError("Error, --full_bam applies to streamed input (--input_bam -)")
 
-    if (not "SO" in bamreader.header.as_dict()["HD"]) or (
-        bamreader.header.as_dict()["HD"]["SO"] != "unsorted"
-    ):
+    # mode 'r' detects sam or bam on the stream
+    bamreader = pysam.AlignmentFile(input_bam_filename, "r" if streaming else "rb", check_sq=False)
+
+    header_HD = bamreader.header.as_dict().get("HD", {})
+    if header_HD.get("SO", None) == "coordinate":
         raise RuntimeError(
-            "Error, file: {} must be coordinate sorted".format(input_bam_filename)
+            "Error, file: {} must be grouped by read name (ie. minimap2 unsorted output)".format(
+                input_bam_filename
+            )
         )
 
-    bamwriter = pysam.AlignmentFile(output_bam_filename, "wb", template=bamreader)
+    start_time = time.time()
+
+    if streaming:
+        num_reads, num_chim_reads = process_bam_stream(bamreader, output_bam_filename, args.full_bam, num_threads)
+        bamreader.close()
 
-    process_bam(bamreader, bamwriter)
+    elif num_threads == 1:
+        bamwriter = pysam.AlignmentFile(output_bam_filename, "wb", template=bamreader)
+        num_reads, num_chim_reads = process_bam(bamreader, bamwriter)
+        bamwriter.close()
+        bamreader.close()
+
+    else:
+        bamreader.close()
+        num_reads, num_chim_reads = process_bam_sharded(
+            input_bam_filename, output_bam_filename, num_threads
+        )
+
+    elapsed_time = max(time.time() - start_time, 1e-6)
+    logger.info(
+        "-processed {} reads, {} chimeric candidates retained, in {:.1f} sec ({:.0f} reads/sec)".format(
+            num_reads, num_chim_reads, elapsed_time, num_reads / elapsed_time
+        )
+    )
 
     sys.exit(0)
 
 
-def process_bam(bam_reader, bam_writer):
+def process_bam(bam_reader, bam_writer, stop_read_name=None, full_bam_writer=None):
+    """
+    returns (num reads examined, num chimeric read candidates written)
+    """
+
+    num_reads = 0
+    num_chim_reads = 0
+
+    for reads in group_reads_by_name(bam_reader, stop_read_name):
+        num_reads += 1
+        if full_bam_writer is not None:
+            for read in reads:
+                full_bam_writer.write(read)
+        if evaluate_chimeric_read_candidates(reads, bam_writer):
+            num_chim_reads += 1
+
+    return num_reads, num_chim_reads
+
+
+def process_bam_stream(bam_reader, output_bam_filename, full_bam_filename, num_threads):
+    """
+    Filters alignments streamed in read-grouped order (ie. minimap2 output on a pipe) in a
+    single pass, so the full alignments never need to be written and re-read.
+
+    The full alignments are optionally teed to full_bam_filename, and the bam compression
+    of both outputs runs in htslib worker threads alongside the filtering.
+
+    returns (num reads examined, num chimeric read candidates written)
+    """
+
+    # the full bam carries most of the compression work
+    full_bam_threads = num_threads - 1 if full_bam_filename else 0
+    chim_bam_threads = max(1, num_threads - full_bam_threads)
+
+    bamwriter = pysam.AlignmentFile(output_bam_filename, "wb", template=bam_reader, threads=chim_bam_threads)
+    full_bamwriter = None
+    if full_bam_filename:
+        full_bamwriter = pysam.AlignmentFile(
+            full_bam_filename, "wb", template=bam_reader, threads=max(1, full_bam_threads)
+        )
+
+    results = process_bam(bam_reader, bamwriter, full_bam_writer=full_bamwriter)
+
+    bamwriter.close()
+    if full_bamwriter is not None:
+        full_bamwriter.close()
+
+    return results
+
+
+def group_reads_by_name(bam_reader, stop_read_name=None):
+    """
+    yields lists of consecutive alignment records sharing the same read name
+
+    If stop_read_name is given, stops upon reaching the first record of that read.
+    """
 
     prev_read_name = ""
     reads = list()
@@ -56,14 +175,18 @@ def process_bam(bam_reader, bam_writer):
     for read in bam_reader:
         read_name = read.query_name
         if read_name != prev_read_name:
-            evaluate_chimeric_read_candidates(reads, bam_writer)
-            reads.clear()
+            if read_name == stop_read_name:
+                break
+            if reads:
+                yield reads
+                reads = list()
 
         prev_read_name = read_name
         reads.append(read)
 
     # get last one.
-    evaluate_chimeric_read_candidates(reads, bam_writer)
+    if reads:
+        yield reads
 
     return
 
@@ -71,7 +194,7 @@ def process_bam(bam_reader, bam_writer):
 def evaluate_chimeric_read_candidates(reads, bam_writer):
 
     if len(reads) < 2:
-        return
+        return False
 
     # ensure there's a supplementary alignment
     has_supplementary_alignment = False
@@ -81,13 +204,304 @@ def evaluate_chimeric_read_candidates(reads, bam_writer):
             break
 
     if not has_supplementary_alignment:
-        return
+        return False
 
     # write candidates
     for read in reads:
         bam_writer.write(read)
 
-    return
+    return True
+
+
+###################################
+## Sharded (multi-process) filtering
+###################################
+
+
+def process_bam_sharded(input_bam_filename, output_bam_filename, num_shards):
+
+    shards = plan_bam_shards(input_bam_filename, num_shards)
+    logger.info("-processing {} in {} shards".format(input_bam_filename, len(shards)))
+
+    shard_bam_filenames = [
+        "{}.shard_{}.bam".format(output_bam_filename, i) for i in range(len(shards))
+    ]
+
+    job_params = [
+        (input_bam_filename, start_voffset, stop_read_name, shard_bam_filename)
+        for (start_voffset, stop_read_name), shard_bam_filename in zip(
+            shards, shard_bam_filenames
+        )
+    ]
+
+    with multiprocessing.Pool(processes=min(num_shards, len(shards))) as pool:
+        shard_results = pool.starmap(_process_bam_shard, job_params)
+
+    num_reads = sum([x[0] for x in shard_results])
+    num_chim_reads = sum([x[1] for x in shard_results])
+
+    # shards are in input order, so simple concatenation retains the read grouping.
+    if len(shard_bam_filenames) == 1:
+        os.rename(shard_bam_filenames[0], output_bam_filename)
+    else:
+        pysam.cat("-o", output_bam_filename, *shard_bam_filenames, catch_stdout=False)
+        for shard_bam_filename in shard_bam_filenames:
+            os.remove(shard_bam_filename)
+
+    return num_reads, num_chim_reads
+
+
+def _process_bam_shard(input_bam_filename, start_voffset, stop_read_name, shard_bam_filename):
+
+    bamreader = pysam.AlignmentFile(input_bam_filename, "rb", check_sq=False)
+    bamwriter = pysam.AlignmentFile(shard_bam_filename, "wb", template=bamreader)
+
+    bamreader.seek(start_voffset)
+
+    results = process_bam(bamreader, bamwriter, stop_read_name)
+
+    bamwriter.close()
+    bamreader.close()
+
+    return results
+
+
+def plan_bam_shards(input_bam_filename, num_shards):
+    """
+    Splits a read-name grouped bam into up to num_shards pieces, each beginning at
+    the first record of a read (so a read's alignments never straddle shards).
+
+    Returns list of (start virtual offset, read name that begins the next shard or None)
+    """
+
+    bamreader = pysam.AlignmentFile(input_bam_filename, "rb", check_sq=False)
+    first_record_voffset = bamreader.tell()
+    num_refs = bamreader.nreferences
+    bamreader.close()
+
+    file_size = os.path.getsize(input_bam_filename)
+    first_record_coffset = first_record_voffset >> 16
+
+    boundaries = list()  # (voffset, read_name)
+
+    with open(input_bam_filename, "rb") as fh:
+        for i in range(1, num_shards):
+            target_coffset = first_record_coffset + int(
+                (file_size - first_record_coffset) * i / num_shards
+            )
+            boundary = _find_read_boundary_after(fh, target_coffset, file_size, num_refs)
+            if boundary is None:
+                break
+            if boundaries and boundary[0] <= boundaries[-1][0]:
+                # same read group spans the targeted region
+                continue
+            if boundary[0] <= first_record_voffset:
+                continue
+            boundaries.append(boundary)
+
+    shards = list()
+    start_voffset = first_record_voffset
+    for voffset, read_name in boundaries:
+        shards.append((start_voffset, read_name))
+        start_voffset = voffset
+    shards.append((start_voffset, None))
+
+    return shards
+
+
+BGZF_MAGIC = b"\x1f\x8b\x08\x04"
+BAM_RECORD_CHAIN_CHECK = 5  # num consecutive valid records required to accept a record start
+BAM_MAX_CANDIDATE_RECORD_SIZE = 1 << 24  # larger block_size values at a candidate record start are taken as garbage
+
+
+def _find_read_boundary_after(fh, target_coffset, file_size, num_refs):
+    """
+    Locates the first bgzf block at or after target_coffset, then the first bam
+    record start within it (validated by a chain of consecutive well-formed records),
+    then advances to the first record of the following read.
+
+    Returns (virtual offset, read name) or None if the end of the file is reached.
+    """
+
+    block_coffset = _find_bgzf_block_start(fh, target_coffset, file_size)
+
+    while block_coffset is not None:
+
+        reader = _BgzfBlockReader(fh, block_coffset, file_size)
+        if not reader.ensure(1):
+            return None
+
+        first_block_len = reader.blocks[0][2]
+
+        for i in range(first_block_len):
+            if not _is_valid_record_chain(reader, i, num_refs):
+                continue
+
+            # found a record start, now advance to the start of the next read.
+            record_start = i
+            read_name = _get_record_read_name(reader, record_start)
+            while True:
+                block_size = struct.unpack_from("<i", reader.data, record_start)[0]
+                record_start += 4 + block_size
+                if not reader.ensure(record_start + 37):
+                    return None
+                # in sync with the records, so no cap on their size
+                if not _is_valid_record(reader, record_start, num_refs, max_block_size=None):
+                    raise RuntimeError(
+                        "Error, unexpected malformed bam record at block {}".format(
+                            block_coffset
+                        )
+                    )
+                next_read_name = _get_record_read_name(reader, record_start)
+                if next_read_name != read_name:
+                    return reader.get_voffset(record_start), next_read_name
+
+        # no record starts in this block (ie. block is fully within a large record)
+        next_block_coffset = block_coffset + reader.blocks[0][3]
+        block_coffset = next_block_coffset if next_block_coffset < file_size else None
+
+    return None
+
+
+def _find_bgzf_block_start(fh, target_coffset, file_size):
+
+    search_len = 1 << 18
+    coffset = target_coffset
+    while coffset < file_size:
+        fh.seek(coffset)
+        buf = fh.read(search_len + 18)
+        pos = buf.find(BGZF_MAGIC)
+        while pos >= 0:
+            block_coffset = coffset + pos
+            block_size = _get_bgzf_block_size(fh, block_coffset)
+            if block_size is not None:
+                next_block_coffset = block_coffset + block_size
+                if next_block_coffset == file_size or (
+                    _get_bgzf_block_size(fh, next_block_coffset) is not None
+                ):
+                    return block_coffset
+            pos = buf.find(BGZF_MAGIC, pos + 1)
+        coffset += search_len
+
+    return None
+
+
+def _get_bgzf_block_size(fh, block_coffset):
+
+    fh.seek(block_coffset)
+    header = fh.read(18)
+    if (
+        len(header) < 18
+        or header[0:4] != BGZF_MAGIC
+        or struct.unpack_from("<H", header, 10)[0] != 6
+        or header[12:14] != b"BC"
+        or struct.unpack_from("<H", header, 14)[0] != 2
+    ):
+        return None
+
+    return struct.unpack_from("<H", header, 16)[0] + 1
+
+
+class _BgzfBlockReader:
+    """
+    decompresses consecutive bgzf blocks on demand, tracking block offsets so buffer
+    positions can be converted into bgzf virtual offsets.
+    """
+
+    def __init__(self, fh, block_coffset, file_size):
+        self.fh = fh
+        self.next_coffset = block_coffset
+        self.file_size = file_size
+        self.data = bytearray()
+        self.blocks = list()  # (coffset, data start, data len, compressed block size)
+
+    def ensure(self, num_bytes):
+        while len(self.data) < num_bytes:
+            if self.next_coffset >= self.file_size:
+                return False
+            block_size = _get_bgzf_block_size(self.fh, self.next_coffset)
+            if block_size is None:
+                return False
+            self.fh.seek(self.next_coffset)
+            block = self.fh.read(block_size)
+            payload = zlib.decompress(block[18:-8], -15)
+            self.blocks.append((self.next_coffset, len(self.data), len(payload), block_size))
+            self.data.extend(payload)
+            self.next_coffset += block_size
+
+        return True
+
+    def get_voffset(self, pos):
+        for coffset, data_start, data_len, block_size in self.blocks:
+            if data_start <= pos < data_start + data_len:
+                return (coffset << 16) | (pos - data_start)
+
+        raise RuntimeError("Error, position {} not within decompressed blocks".format(pos))
+
+
+def _is_valid_record_chain(reader, pos, num_refs):
+
+    for i in range(BAM_RECORD_CHAIN_CHECK):
+        if not reader.ensure(pos + 36):
+            # reached eof having only seen valid records
+            return i > 0 and len(reader.data) == pos
+        if not _is_valid_record(reader, pos, num_refs):
+            return False
+        block_size = struct.unpack_from("<i", reader.data, pos)[0]
+        pos += 4 + block_size
+
+    return True
+
+
+def _is_valid_record(reader, pos, num_refs, max_block_size=BAM_MAX_CANDIDATE_RECORD_SIZE):
+
+    if not reader.ensure(pos + 36):
+        return False
+
+    (
+        block_size,
+        ref_id,
+        ref_pos,
+        l_read_name,
+        mapq,
+        bin_,
+        n_cigar_op,
+        flag,
+        l_seq,
+        next_ref_id,
+        next_pos,
+        tlen,
+    ) = struct.unpack_from("<iiiBBHHHiiii", reader.data, pos)
+
+    if max_block_size is not None and block_size > max_block_size:
+        # checked before decompressing up to the record end
+        return False
+    if not (-1 <= ref_id < num_refs and -1 <= next_ref_id < num_refs):
+        return False
+    if ref_pos < -1 or next_pos < -1 or l_read_name < 2 or l_seq < 0:
+        return False
+    if (
+        block_size
+        < 32 + l_read_name + 4 * n_cigar_op + ((l_seq + 1) >> 1) + l_seq
+    ):
+        return False
+
+    if not reader.ensure(pos + 36 + l_read_name):
+        return False
+    read_name = reader.data[pos + 36 : pos + 36 + l_read_name]
+    if read_name[-1] != 0:
+        return False
+    for c in read_name[:-1]:
+        if c < 0x21 or c > 0x7E or c == 0x40:  # printable, excluding '@'
+            return False
+
+    return reader.ensure(pos + 4 + block_size)
+
+
+def _get_record_read_name(reader, pos):
+
+    l_read_name = reader.data[pos + 12]
+    return reader.data[pos + 36 : pos + 36 + l_read_name - 1].decode()
 
 
 if __name__ == "__main__":
@@ -7,6 +7,7 @@ use lib ("$FindBin::Bin/../PerlLib");
 use Fasta_reader;
 use Getopt::Long qw(:config posix_default no_ignore_case bundling pass_through);
 use DelimParser;
+use Process_cmd;
 
 
 my $usage = <<__EOUSAGE__;
@@ -19,6 +20,11 @@ my $usage = <<__EOUSAGE__;
 #
 #  --reads_output <string> : fusion evidence reads output filename
 #
+#  --read_store <string>   : indexed read store (see build_read_store.py) to fetch
+#                            reads from instead of streaming through --reads_fasta
+#
+#  --CPU <int>             : number of read store retrieval processes (default: 1)
+#
 ##################################################################
 
 
@@ -31,12 +37,16 @@ my $help_flag;
 my $fusions;
 my $reads_fasta;
 my $reads_output;
+my $read_store;
+my $CPU = 1;
 
 
 &GetOptions ( 'help|h' => \$help_flag,
 	      'fusions=s' => \$fusions,
 	      'reads_fasta=s' => \$reads_fasta,
 	      'reads_output=s' => \$reads_output,
+	      'read_store=s' => \$read_store,
+	      'CPU=i' => \$CPU,
 	      
     );
 
@@ -44,7 +54,7 @@ if ($help_flag) {
     die $usage;
 }
 
-unless ($fusions && $reads_fasta && $reads_output) {
+unless ($fusions && ($reads_fasta || $read_store) && $reads_output) {
     die $usage;
 }
 
@@ -66,6 +76,20 @@ main: {
 
 
     my %accs_to_capture = %read_to_fusion;
+
+    if ($read_store) {
+        # fetch just the fusion reads from the store, then relabel them below.
+        my $read_names_file = "$reads_output.read_names";
+        open(my $ofh, ">$read_names_file") or die "Error, cannot write to $read_names_file";
+        foreach my $acc (keys %read_to_fusion) {
+            print $ofh "$acc\n";
+        }
+        close $ofh;
+
+        $reads_fasta = "$reads_output.store_fetched.fa";
+        &process_cmd("$FindBin::Bin/fetch_reads_from_store.py --store $read_store --read_names $read_names_file --output $reads_fasta --threads $CPU");
+        unlink($read_names_file);
+    }
     
     open(my $ofh, ">$reads_output") or die "Error, cannot write to $reads_output";
     
@@ -86,6 +110,10 @@ main: {
 
     close $ofh;
 
+    if ($read_store) {
+        unlink($reads_fasta);
+    }
+
     print STDERR "-extracted fusion reads into: $reads_output\n";
     
     exit(0);
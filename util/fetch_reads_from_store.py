@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+import sys, os, re
+import logging
+import argparse
+import multiprocessing
+import pysam
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s : %(levelname)s : %(message)s",
+    datefmt="%H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+## Retrieves the named reads from a read store (see build_read_store.py) by seeking to them
+## via the .fai/.gzi indexes, rather than streaming through the full read set.
+## Reads are retrieved in store order, split across worker processes that each decompress
+## only the blocks containing their reads.
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="retrieve reads by name from an indexed read store",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument(
+        "--store",
+        type=str,
+        required=True,
+        help="read store, as built by build_read_store.py",
+    )
+
+    parser.add_argument(
+        "--read_names",
+        type=str,
+        required=True,
+        help="file containing names of reads to retrieve, one per line",
+    )
+
+    parser.add_argument(
+        "--output",
+        type=str,
+        required=True,
+        help="output fasta filename",
+    )
+
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=1,
+        help="number of read retrieval processes",
+    )
+
+    args = parser.parse_args()
+
+    reads_want = set()
+    with open(args.read_names, "rt") as fh:
+        for line in fh:
+            read_name = line.rstrip()
+            if read_name:
+                reads_want.add(read_name)
+
+    logger.info("-retrieving {} reads from {}".format(len(reads_want), args.store))
+
+    read_names = get_read_names_in_store_order(args.store, reads_want)
+
+    if len(read_names) != len(reads_want):
+        missing = sorted(reads_want - set(read_names))
+        raise RuntimeError(
+            "Error, missing {} reads from read store {}: {}".format(
+                len(missing), args.store, ", ".join(missing[:100])
+            )
+        )
+
+    num_threads = max(1, min(args.threads, len(read_names)))
+    chunk_size = -(-len(read_names) // num_threads) if read_names else 1
+    chunks = [
+        read_names[i : i + chunk_size] for i in range(0, len(read_names), chunk_size)
+    ]
+
+    with open(args.output, "wt") as ofh:
+        if num_threads > 1:
+            with multiprocessing.Pool(processes=num_threads) as pool:
+                for records in pool.imap(
+                    _fetch_reads, [(args.store, chunk) for chunk in chunks]
+                ):
+                    ofh.write(records)
+        else:
+            for chunk in chunks:
+                ofh.write(_fetch_reads((args.store, chunk)))
+
+    logger.info("-done, wrote {}".format(args.output))
+
+    sys.exit(0)
+
+
+def get_read_names_in_store_order(store_filename, reads_want):
+
+    found = list()
+
+    with open(store_filename + ".fai", "rt") as fh:
+        for line in fh:
+            read_name = line.split("\t", 1)[0]
+            if read_name in reads_want:
+                found.append(read_name)
+
+    # retain first occurrence of any duplicate names (as done by faidx)
+    return list(dict.fromkeys(found))
+
+
+def _fetch_reads(params):
+
+    store_filename, read_names = params
+
+    records = list()
+    with pysam.FastaFile(store_filename) as store:
+        for read_name in read_names:
+            records.append(">{}\n{}\n".format(read_name, store.fetch(reference=read_name)))
+
+    return "".join(records)
+
+
+if __name__ == "__main__":
+    main()
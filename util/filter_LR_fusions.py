@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+
+import sys, os, re
+import logging
+import argparse
+import pandas as pd
+import csv
+
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s : %(levelname)s : %(message)s",
+    datefmt="%H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+## Post-filtering of the fusion predictions in a single process:
+##     evidence abundance filtering and dominant isoform fraction filtering
+##     (as per filter_LR_fusions_by_evidence_abundance.py and filter_low_pct_dom_iso.py),
+##     loading the predictions once.
+
+
+# column types forced on read, the others are inferred. The read count columns are left to inference,
+# as they hold NA where merged long read and FusionInspector tables lack the fusion (see merge_mm2fusion_FI.py),
+# and NA compares as False in the filters.
+PREDS_COLUMN_DTYPES = {
+    "LR_accessions": "str",  # kept as text, as may be integer read IDs (see expand_read_ids.py)
+}
+
+REMOVED_DOM_ISO_SUFFIX = ".removed_below_min_frac_dom_iso"
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="filter fusion predictions by evidence abundance and dominant isoform fraction",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument("--fusions_input", type=str, required=True, help="fusions input file")
+    parser.add_argument(
+        "--filtered_fusions_output",
+        type=str,
+        required=True,
+        help="name for filtered fusions output file",
+    )
+
+    parser.add_argument(
+        "--skip_abundance_filter",
+        action="store_true",
+        default=False,
+        help="do not apply the evidence abundance filter",
+    )
+    parser.add_argument(
+        "--abundance_filtered_output",
+        type=str,
+        default=None,
+        help="also write the fusions passing the evidence abundance filter (ie. before the dominant isoform filter) to this file",
+    )
+    parser.add_argument("--min_num_LR", default=1, type=int, help="min number of long reads with canonical splice support")
+    parser.add_argument("--min_LR_novel_junction_support", type=int, default=2, help="min number of long reads with non-canonical splice support")
+    parser.add_argument("--min_J", type=int, default=1, help="min number of Illumina junction reads with canonical splice breakpoints")
+    parser.add_argument("--min_sumJS", type=int, default=1, help="min number of Illumina reads supporting junction and spanning frags summed")
+    parser.add_argument("--min_novel_junction_support", type=int, default=3, help="min number of junction reads with non-canonical splice support")
+    parser.add_argument("--min_FFPM", type=float, default=0.1, help="min FFPM value for long or short reads.  If short reads >= min_FFPM and long reads < min_FFPM, still reported")
+
+    parser.add_argument(
+        "--min_frac_dom_iso",
+        type=float,
+        default=0.05,
+        help="min fraction expression of dominant fusion isoform (0 disables this filter)",
+    )
+
+    args = parser.parse_args()
+
+    data = read_fusion_preds(args.fusions_input)
+
+    if not args.skip_abundance_filter:
+        data = filter_by_evidence_abundance(
+            data,
+            min_num_LR=args.min_num_LR,
+            min_LR_novel_junction_support=args.min_LR_novel_junction_support,
+            min_J=args.min_J,
+            min_sumJS=args.min_sumJS,
+            min_novel_junction_support=args.min_novel_junction_support,
+            min_FFPM=args.min_FFPM,
+        )
+        logger.info("-retained {} fusions meeting evidence abundance criteria".format(data.shape[0]))
+        if args.abundance_filtered_output:
+            write_fusion_preds(data, args.abundance_filtered_output)
+
+    if args.min_frac_dom_iso > 0:
+        data, filtered_out_fusions = filter_by_dom_iso_frac(data, args.min_frac_dom_iso)
+        if filtered_out_fusions is not None:
+            write_fusion_preds(
+                filtered_out_fusions, args.filtered_fusions_output + REMOVED_DOM_ISO_SUFFIX
+            )
+
+    write_fusion_preds(data, args.filtered_fusions_output)
+
+    sys.exit(0)
+
+
+def read_fusion_preds(fusions_filename):
+
+    with open(fusions_filename, "rt") as fh:
+        column_headers = fh.readline().rstrip("\n").split("\t")
+
+    dtypes = {
+        column: dtype
+        for column, dtype in PREDS_COLUMN_DTYPES.items()
+        if column in column_headers
+    }
+
+    return pd.read_csv(fusions_filename, sep="\t", quotechar='"', dtype=dtypes)
+
+
+def write_fusion_preds(data, output_filename):
+    data.to_csv(output_filename, sep="\t", index=False, quoting=csv.QUOTE_NONE)
+
+
+def filter_by_evidence_abundance(
+    data,
+    min_num_LR,
+    min_LR_novel_junction_support,
+    min_J,
+    min_sumJS,
+    min_novel_junction_support,
+    min_FFPM,
+):
+    """
+    returns the fusions meeting the long read (or short read, when available) evidence criteria
+    """
+
+    keep = get_evidence_abundance_support(
+        data,
+        min_num_LR=min_num_LR,
+        min_LR_novel_junction_support=min_LR_novel_junction_support,
+        min_J=min_J,
+        min_sumJS=min_sumJS,
+        min_novel_junction_support=min_novel_junction_support,
+        min_FFPM=min_FFPM,
+    )
+
+    return data[keep]
+
+
+def get_evidence_abundance_support(
+    columns,
+    min_num_LR,
+    min_LR_novel_junction_support,
+    min_J,
+    min_sumJS,
+    min_novel_junction_support,
+    min_FFPM,
+):
+    """
+    returns boolean mask of the fusions meeting the evidence criteria
+
+    columns is the fusions data frame, or a dict of its column arrays. Given column arrays
+    shaped (num fusions, 1) and threshold arrays shaped (num settings,), the mask is evaluated
+    for all settings at once, shaped (num fusions, num settings)  (see sweep_fusion_filter_thresholds.py)
+    """
+
+    is_ref_splice = columns["SpliceType"] == "ONLY_REF_SPLICE"
+    num_LR = columns["num_LR"]
+
+    # long read criteria
+    LR_support = (is_ref_splice & (num_LR >= min_num_LR)) | (num_LR >= min_LR_novel_junction_support)
+
+    if "JunctionReadCount" in columns:
+        # filter based on long or short read results:
+        junction_read_count = columns["JunctionReadCount"]
+        FFPM = columns["FFPM"]
+
+        short_read_support = (
+            (
+                ((junction_read_count >= min_J) & is_ref_splice)
+                | (junction_read_count >= min_novel_junction_support)
+            )
+            & (junction_read_count + columns["SpanningFragCount"] >= min_sumJS)
+            & (FFPM >= min_FFPM)
+        )
+
+        # continue to report long read if the short read FFPM meets threshold.
+        keep = (LR_support & ((columns["LR_FFPM"] >= min_FFPM) | (FFPM >= min_FFPM))) | short_read_support
+
+    else:
+        # filter just based on long reads
+        keep = LR_support & (columns["LR_FFPM"] >= min_FFPM)
+
+    return keep
+
+
+def filter_by_dom_iso_frac(data, min_frac_dom_iso):
+    """
+    returns (retained fusions, filtered out fusions)
+    filtered out fusions is None if there were no fusion entries to filter.
+    """
+
+    if data.shape[0] == 0:
+        logger.info("no fusion entries to filter.\n")
+        return data, None
+
+    data = data.reset_index(drop=True)
+
+    data["max_LR_FFPM"] = data.groupby("#FusionName")["LR_FFPM"].transform("max")
+    data["frac_dom_iso"] = data["LR_FFPM"] / data["max_LR_FFPM"]
+    data["above_frac_dom_iso"] = data["frac_dom_iso"] >= min_frac_dom_iso
+
+    filtered_out_fusions = data[~data["above_frac_dom_iso"]]
+
+    retained_fusions = data[data["above_frac_dom_iso"]]
+
+    # retain any with Illumina read support
+    if "FFPM" in filtered_out_fusions.columns.tolist():
+        recovered_FI_fusions = filtered_out_fusions[filtered_out_fusions["FFPM"] > 0]
+        num_recovered_fusions = recovered_FI_fusions.shape[0]
+        logger.info("-recovering Illumina supported fusions: {}".format(num_recovered_fusions))
+        if num_recovered_fusions > 0:
+            retained_fusions = pd.concat([retained_fusions, recovered_FI_fusions])
+            filtered_out_fusions = filtered_out_fusions[~(filtered_out_fusions["FFPM"] > 0)]
+
+    # sort descending by long read support
+    filtered_out_fusions = filtered_out_fusions.sort_values(by=["num_LR"], ascending=False)
+    retained_fusions = retained_fusions.sort_values(by=["num_LR"], ascending=False)
+
+    logger.info("-removed low dom iso frac fusions: " + str(filtered_out_fusions.shape[0]))
+    logger.info("-RETAINED above min dom iso frac fusions: " + str(retained_fusions.shape[0]))
+
+    return retained_fusions, filtered_out_fusions
+
+
+if __name__ == "__main__":
+    main()
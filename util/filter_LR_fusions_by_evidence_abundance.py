@@ -3,8 +3,8 @@
 import sys, os, re
 import logging
 import argparse
-import pandas as pd
-import csv
+
+from filter_LR_fusions import read_fusion_preds, write_fusion_preds, filter_by_evidence_abundance
 
 
 logging.basicConfig(level=logging.INFO,
@@ -39,54 +39,17 @@ def main():
     min_novel_junction_support = args.min_novel_junction_support
     min_FFPM = args.min_FFPM
 
-    data = pd.read_csv(fusions_input_filename, sep="\t", quotechar='"')
-
-
-    if 'JunctionReadCount' in data.columns:
-        # filter based on long or short read results:
-        data_filtered = data[
-            (    # long read criteria
-
-                (
-                    ( (data.SpliceType == "ONLY_REF_SPLICE") & (data.num_LR >= min_num_LR) )
-                    |
-                    (data.num_LR >= min_LR_novel_junction_support)
-                ) & (
-                    (data.LR_FFPM >= min_FFPM) | (data.FFPM >= min_FFPM)  # continue to report long read if the short read FFPM meets threshold.
-                    )
-            )
-                |
-            (    # short read criteria
-              
-                (
-                    ( (data.JunctionReadCount >= min_J) & (data.SpliceType == "ONLY_REF_SPLICE"))
-                            |
-                            (data.JunctionReadCount >= min_novel_junction_support)
-                )
-                    &
-                (data.JunctionReadCount + data.SpanningFragCount >= min_sumJS)
-                    &
-                (data.FFPM >= min_FFPM)
-            )
-            ]                     
-
-    else:
-        # filter just based on long reads
-        data_filtered = data[
-            
-              (
-                (  (data.SpliceType == "ONLY_REF_SPLICE") & (data.num_LR >= min_num_LR) )
-                  |
-                (data.num_LR >= min_LR_novel_junction_support)
-              ) & (
-                 data.LR_FFPM >= min_FFPM
-                  )
-            
-            ]
-    
-    
+    data = read_fusion_preds(fusions_input_filename)
+
+    data_filtered = filter_by_evidence_abundance(data,
+                                                 min_num_LR=min_num_LR,
+                                                 min_LR_novel_junction_support=min_LR_novel_junction_support,
+                                                 min_J=min_J,
+                                                 min_sumJS=min_sumJS,
+                                                 min_novel_junction_support=min_novel_junction_support,
+                                                 min_FFPM=min_FFPM)
 
-    data_filtered.to_csv(fusions_output_filename, sep="\t", index=False, quoting=csv.QUOTE_NONE)
+    write_fusion_preds(data_filtered, fusions_output_filename)
 
     sys.exit(0)
 
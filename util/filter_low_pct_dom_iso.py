@@ -3,8 +3,8 @@
 import sys, os, re
 import logging
 import argparse
-import pandas as pd
-import csv
+
+from filter_LR_fusions import read_fusion_preds, write_fusion_preds, filter_by_dom_iso_frac, REMOVED_DOM_ISO_SUFFIX
 
 
 logging.basicConfig(level=logging.INFO,
@@ -28,50 +28,13 @@ def main():
     fusions_output_filename = args.filtered_fusions_output
     min_frac_dom_iso = args.min_frac_dom_iso
 
-    data = pd.read_csv(fusions_input_filename, sep="\t", quotechar='"')
-
-    if data.shape[0] == 0:
-        logger.info("no fusion entries to filter.\n")
-        data.to_csv(fusions_output_filename, sep="\t", index=False, quoting=csv.QUOTE_NONE)
-        sys.exit(0)
-    
-
-    def filter_frac_dom_iso (group_df):
-        group_df['max_LR_FFPM'] = group_df['LR_FFPM'].max()
-        group_df['frac_dom_iso'] = group_df['LR_FFPM'] / group_df['max_LR_FFPM']
-        group_df['above_frac_dom_iso'] =  group_df['frac_dom_iso'] >= min_frac_dom_iso
-
-        return(group_df)
-    
-    data = data.groupby('#FusionName', group_keys=False).apply(filter_frac_dom_iso).reset_index(drop=True)
-
-    filtered_out_fusions = data[ ~ data['above_frac_dom_iso' ] ]
+    data = read_fusion_preds(fusions_input_filename)
 
-    retained_fusions = data[ data['above_frac_dom_iso' ] ]  
+    retained_fusions, filtered_out_fusions = filter_by_dom_iso_frac(data, min_frac_dom_iso)
 
-
-    # retain any with Illumina read support
-    if "FFPM" in filtered_out_fusions.columns.tolist():
-        recovered_FI_fusions = filtered_out_fusions[filtered_out_fusions["FFPM"] > 0]
-        num_recovered_fusions = recovered_FI_fusions.shape[0]
-        logger.info("-recovering Illumina supported fusions: {}".format(num_recovered_fusions))
-        if num_recovered_fusions > 0:
-            retained_fusions = pd.concat([retained_fusions, recovered_FI_fusions])
-            filtered_out_fusions = filtered_out_fusions[~ (filtered_out_fusions["FFPM"] > 0) ] 
-
-
-
-    # sort descending by long read support
-    filtered_out_fusions = filtered_out_fusions.sort_values(by=['num_LR'], ascending=False)
-    retained_fusions = retained_fusions.sort_values(by=['num_LR'], ascending=False)
-
-            
-    filtered_out_fusions.to_csv(fusions_output_filename + ".removed_below_min_frac_dom_iso", sep="\t", index=False, quoting=csv.QUOTE_NONE) 
-    retained_fusions.to_csv(fusions_output_filename, sep="\t", index=False, quoting=csv.QUOTE_NONE)
-
-    logger.info("-filter_low_pct_dom_iso.py removed low dom iso frac fusions: " + str(filtered_out_fusions.shape[0]))
-    logger.info("-filter_low_pct_dom_iso.py RETAINED above min dom iso frac fusions: " + str(retained_fusions.shape[0]))
-    
+    if filtered_out_fusions is not None:
+        write_fusion_preds(filtered_out_fusions, fusions_output_filename + REMOVED_DOM_ISO_SUFFIX)
+    write_fusion_preds(retained_fusions, fusions_output_filename)
     
     sys.exit(0)
 
@@ -1,12 +1,11 @@
 #!/usr/bin/env python3
 
 import sys, os, re
-import intervaltree as itree
-import gzip
 from collections import defaultdict
 import csv
 import logging
 import argparse
+import numpy as np
 
 logging.basicConfig(
     level=logging.INFO,
@@ -16,8 +15,15 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+## Standalone filter, run by hand on a fusion predictions tsv (no ctat-LR-fusion step calls it).
+## Writes the retained predictions to stdout with the input columns, plus the distance of each
+## breakpoint to its nearest exon boundary if --report_exon_bound_dist.
+
+
 FUZZY = 5
 
+EXON_BOUNDS_CACHE_SUFFIX = ".exon_bounds.npz"
+
 
 def main():
 
@@ -43,6 +49,12 @@ def main():
         default=FUZZY,
         help="distance allowed +/- reference exon boundaries",
     )
+    parser.add_argument(
+        "--report_exon_bound_dist",
+        action="store_true",
+        default=False,
+        help="add columns LeftBreakExonBoundDist and RightBreakExonBoundDist: distance to the nearest exon boundary",
+    )
 
     args = parser.parse_args()
 
@@ -53,59 +65,164 @@ def main():
     if genome_lib_dir is None:
         raise RuntimeError("must specify --genome_lib_dir")
 
-    # build exon trees
-    logger.info("-building itrees for exon and fuzzy breakpoints")
-    ref_annot_gtf_exons = os.path.join(genome_lib_dir, "ref_annot.gtf.mini.sortu")
-    chrom_itrees = build_fuzzy_breakpoint_itree(ref_annot_gtf_exons, fuzzy_dist)
+    logger.info("-loading exon boundaries")
+    chrom_bounds = get_chrom_exon_bounds(genome_lib_dir)
 
     preds_reader = csv.DictReader(open(preds_file, "rt"), delimiter="\t")
+    rows = list(preds_reader)
+
+    logger.info("-filtering breakpoints for {} predictions".format(len(rows)))
+
+    left_ok, left_dists = eval_breakpoints_near_exon_bounds(
+        chrom_bounds, [row["LeftBreakpoint"] for row in rows], fuzzy_dist
+    )
+    right_ok, right_dists = eval_breakpoints_near_exon_bounds(
+        chrom_bounds, [row["RightBreakpoint"] for row in rows], fuzzy_dist
+    )
+
+    fieldnames = list(preds_reader.fieldnames)
+    if args.report_exon_bound_dist:
+        fieldnames += ["LeftBreakExonBoundDist", "RightBreakExonBoundDist"]
+
     preds_writer = csv.DictWriter(
         sys.stdout,
-        fieldnames=preds_reader.fieldnames,
+        fieldnames=fieldnames,
         delimiter="\t",
         lineterminator="\n",
     )
-
-    logger.info("-filtering breakpoints")
     preds_writer.writeheader()
 
-    for row in preds_reader:
+    for i in np.flatnonzero(left_ok & right_ok):
+        # within fuzzy break distance of exon boundaries
+        row = rows[i]
+        if args.report_exon_bound_dist:
+            row["LeftBreakExonBoundDist"] = left_dists[i]
+            row["RightBreakExonBoundDist"] = right_dists[i]
+        preds_writer.writerow(row)
 
-        break_lend = row["LeftBreakpoint"]
-        break_rend = row["RightBreakpoint"]
+    logger.info("-done")
 
-        chrom_lend, coord_lend, strand_lend = break_lend.split(":")
-        chrom_rend, coord_rend, strand_rend = break_rend.split(":")
+    sys.exit(0)
 
-        coord_lend = int(coord_lend)
-        coord_rend = int(coord_rend)
 
-        if (len(chrom_itrees[chrom_lend][coord_lend : coord_lend + 1]) > 0) and (
-            len(chrom_itrees[chrom_rend][coord_rend : coord_rend + 1]) > 0
-        ):
-            # within fuzzy break distance of exon boundaries
-            preds_writer.writerow(row)
+def eval_breakpoints_near_exon_bounds(chrom_bounds, breakpoints, fuzzy_dist):
+    """
+    breakpoints are formatted as chrom:coord:strand
 
-    logger.info("-done")
+    returns (bool array: breakpoint within fuzzy_dist of an exon boundary,
+             list of distance to the nearest exon boundary on the chrom, or 'NA' if none)
+    """
 
-    sys.exit(0)
+    num_breakpoints = len(breakpoints)
+    is_ok = np.zeros(num_breakpoints, dtype=bool)
+    dists = np.full(num_breakpoints, -1, dtype=np.int64)
+
+    chrom_to_breakpoint_idxs = defaultdict(list)
+    coords = np.zeros(num_breakpoints, dtype=np.int64)
+    for i, breakpoint in enumerate(breakpoints):
+        chrom, coord, strand = breakpoint.split(":")
+        chrom_to_breakpoint_idxs[chrom].append(i)
+        coords[i] = int(coord)
+
+    for chrom, idxs in chrom_to_breakpoint_idxs.items():
+        bounds = chrom_bounds.get(chrom, None)
+        if bounds is None or len(bounds) == 0:
+            continue
+
+        idxs = np.array(idxs)
+        chrom_coords = coords[idxs]
+
+        # retains the prior interval tree criterion: [bound - fuzzy - 1, bound + fuzzy + 1) overlaps the breakpoint coordinate
+        num_in_range = np.searchsorted(
+            bounds, chrom_coords + fuzzy_dist + 1, side="right"
+        ) - np.searchsorted(bounds, chrom_coords - fuzzy_dist, side="left")
+        is_ok[idxs] = num_in_range > 0
+
+        # nearest boundary on either side
+        pos = np.searchsorted(bounds, chrom_coords)
+        dist_right = np.abs(bounds[np.minimum(pos, len(bounds) - 1)] - chrom_coords)
+        dist_left = np.abs(bounds[np.maximum(pos - 1, 0)] - chrom_coords)
+        dists[idxs] = np.minimum(dist_left, dist_right)
 
+    return is_ok, [str(x) if x >= 0 else "NA" for x in dists.tolist()]
 
-def build_fuzzy_breakpoint_itree(ref_exons_file, fuzzy_dist):
 
-    chr_itrees = defaultdict(lambda: itree.IntervalTree())
+def get_chrom_exon_bounds(genome_lib_dir):
+    """
+    returns dict of chrom -> sorted unique array of exon boundary coordinates,
+    from the genome lib ref_annot.gtf.mini.sortu exons (cached as .npz)
+    """
+
+    ref_annot_gtf_exons = os.path.join(genome_lib_dir, "ref_annot.gtf.mini.sortu")
+    exon_bounds_cache = ref_annot_gtf_exons + EXON_BOUNDS_CACHE_SUFFIX
+
+    if os.path.exists(exon_bounds_cache) and os.path.getmtime(
+        exon_bounds_cache
+    ) >= os.path.getmtime(ref_annot_gtf_exons):
+        logger.info("-loading cached exon boundaries: {}".format(exon_bounds_cache))
+        return load_exon_bounds(exon_bounds_cache)
+
+    chrom_bounds = parse_exon_bounds(ref_annot_gtf_exons)
+
+    try:
+        write_exon_bounds(chrom_bounds, exon_bounds_cache)
+    except OSError as e:
+        logger.warning(
+            "unable to write exon boundary cache {}: {}".format(exon_bounds_cache, e)
+        )
+
+    return chrom_bounds
+
+
+def parse_exon_bounds(ref_exons_file):
+
+    logger.info("-parsing exon boundaries from {}".format(ref_exons_file))
+
+    chrom_coords = defaultdict(list)
 
     with open(ref_exons_file, "rt") as fh:
         for line in fh:
-            line = line.rstrip()
-            vals = line.split("\t")
-            chrom, lend, rend = vals[0], vals[3], vals[4]
-            lend = int(lend)
-            rend = int(rend)
-            chr_itrees[chrom][(lend - fuzzy_dist - 1) : (lend + fuzzy_dist + 1)] = True
-            chr_itrees[chrom][(rend - fuzzy_dist - 1) : (rend + fuzzy_dist + 1)] = True
-
-    return chr_itrees
+            vals = line.rstrip().split("\t")
+            chrom_coords[vals[0]].extend([int(vals[3]), int(vals[4])])
+
+    return {
+        chrom: np.unique(np.array(coords, dtype=np.int64))
+        for chrom, coords in chrom_coords.items()
+    }
+
+
+def write_exon_bounds(chrom_bounds, exon_bounds_cache):
+
+    chroms = sorted(chrom_bounds.keys())
+    offsets = np.cumsum([0] + [len(chrom_bounds[chrom]) for chrom in chroms])
+
+    # write to tmp file then move into place, so concurrent runs never see a partial cache.
+    tmp_exon_bounds_cache = "{}.tmp.{}.npz".format(exon_bounds_cache, os.getpid())
+    np.savez(
+        tmp_exon_bounds_cache,
+        chroms=np.array(chroms, dtype=str),
+        offsets=offsets.astype(np.int64),
+        coords=np.concatenate(
+            [chrom_bounds[chrom] for chrom in chroms] + [np.zeros(0, dtype=np.int64)]
+        ),
+    )
+    os.replace(tmp_exon_bounds_cache, exon_bounds_cache)
+
+    logger.info("-wrote exon boundary cache: {}".format(exon_bounds_cache))
+
+    return
+
+
+def load_exon_bounds(exon_bounds_cache):
+
+    with np.load(exon_bounds_cache) as npz:
+        chroms = npz["chroms"].tolist()
+        offsets = npz["offsets"]
+        coords = npz["coords"]
+
+    return {
+        chrom: coords[offsets[i] : offsets[i + 1]] for i, chrom in enumerate(chroms)
+    }
 
 
 if __name__ == "__main__":
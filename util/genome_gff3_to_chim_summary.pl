@@ -9,8 +9,12 @@ use List::Util qw (min max);
 use FindBin;
 use lib ("$FindBin::Bin/../PerlLib");
 use Set::IntervalTree;
+use File::Temp qw(tempdir);
+use POSIX ();
 
 my $min_per_id = 80;
+my $CPU = 1;
+my $TARGETS_PER_CHUNK = 1000;
 
 
 my $usage = <<__EOUSAGE__;
@@ -25,6 +29,10 @@ my $usage = <<__EOUSAGE__;
 #
 #  --min_per_id <float>        minimum percent identity (default: $min_per_id)
 #
+# Optional:
+#
+#  --CPU <int>                 number of worker processes evaluating the read alignments (default: $CPU)
+#                              (reads are evaluated in chunks of $TARGETS_PER_CHUNK, output order is retained)
 #
 #  --debug|D                   debug mode, extra verbose
 #
@@ -46,6 +54,7 @@ my $DEBUG = 0;
               'align_gff3=s' => \$align_gff3_file,
               'annot_gtf=s' => \$annot_gtf_file,
               'min_per_id=f' => \$min_per_id,
+              'CPU=i' => \$CPU,
               'debug|D' => \$DEBUG,
               );
 
@@ -63,6 +72,16 @@ my %genes;
 my %interval_trees;
 my $error_counter = 0;
 
+## parallel evaluation state: the reads are evaluated in chunks by forked workers, sharing the
+## annotation interval trees (copy-on-write), with the chunk outputs reported in input order.
+my @chunk_target_aligns;
+my $chunk_dir;
+my $num_chunks_launched = 0;
+my $num_chunks_reported = 0;
+my %chunk_pid_to_info;
+my %chunk_done;
+my $num_targets_evaluated = 0;
+
 main: {
 
     ########################
@@ -106,6 +125,10 @@ main: {
     my $last_progress_time = time();
     my $progress_interval = 15; # seconds
 
+    if ($CPU > 1) {
+        $chunk_dir = tempdir(CLEANUP => 1);
+    }
+    
     open (my $fh, $align_gff3_file) or die $!;
     while (<$fh>) {
         $line_counter++;
@@ -115,6 +138,9 @@ main: {
         if ($current_time - $last_progress_time >= $progress_interval) {
             my $pct_done = sprintf("%.1f", ($line_counter / $total_lines) * 100);
             print STDERR "\r  ... processing alignments: $pct_done% done ($line_counter / $total_lines lines)";
+            if ($CPU > 1) {
+                print STDERR ", $num_targets_evaluated reads evaluated";
+            }
             $last_progress_time = $current_time;
         }
 
@@ -136,7 +162,7 @@ main: {
 
         if ($target ne $prev_target && %target_to_aligns) {
             if ($DEBUG) { print "Evaluating $target\n";}
-            &evaluate_target_alignments(%target_to_aligns);
+            &queue_target_alignments(%target_to_aligns);
             %target_to_aligns = (); # reinit
         }
         $prev_target = $target;
@@ -159,7 +185,13 @@ main: {
 
     # get last one
     if (%target_to_aligns) {
-        &evaluate_target_alignments(%target_to_aligns);
+        &queue_target_alignments(%target_to_aligns);
+    }
+
+    # finish up the outstanding chunks
+    &launch_chunk();
+    while (%chunk_pid_to_info) {
+        &wait_for_chunk();
     }
     
     
@@ -175,7 +207,113 @@ main: {
 
 
 
+####
+sub queue_target_alignments {
+    my %target_to_aligns = @_;
+
+    if ($CPU == 1) {
+        &evaluate_target_alignments(%target_to_aligns);
+        return;
+    }
+
+    push (@chunk_target_aligns, { %target_to_aligns } );
+    if (scalar(@chunk_target_aligns) >= $TARGETS_PER_CHUNK) {
+        &launch_chunk();
+    }
+
+    return;
+}
+
+
+####
+sub launch_chunk {
+
+    unless (@chunk_target_aligns) { return; }
+
+    # bounded number of workers, also bounding how far the parsing gets ahead of the evaluation
+    while (scalar(keys %chunk_pid_to_info) >= $CPU) {
+        &wait_for_chunk();
+    }
+
+    my $chunk_idx = $num_chunks_launched++;
+    my $chunk_file = "$chunk_dir/chunk.$chunk_idx";
+    
+    my $pid = fork();
+    unless (defined $pid) {
+        die "Error, cannot fork to evaluate alignments chunk $chunk_idx";
+    }
+    
+    if ($pid == 0) {
+        # child: evaluate the chunk, reporting to the chunk file
+        open (STDOUT, ">", "$chunk_file.tmp") or die "Error, cannot write to $chunk_file.tmp";
+        $error_counter = 0;
+        foreach my $target_to_aligns_href (@chunk_target_aligns) {
+            &evaluate_target_alignments(%$target_to_aligns_href);
+        }
+        close STDOUT or die "Error, cannot close $chunk_file.tmp";
 
+        open (my $ofh, ">", "$chunk_file.num_errors") or die "Error, cannot write to $chunk_file.num_errors";
+        print $ofh "$error_counter\n";
+        close $ofh;
+
+        rename("$chunk_file.tmp", $chunk_file) or die "Error, cannot rename $chunk_file.tmp";
+        
+        # skip the END blocks (ie. temp dir cleanup), those are the parent's
+        POSIX::_exit(0);
+    }
+    
+    $chunk_pid_to_info{$pid} = { chunk_idx => $chunk_idx,
+                                num_targets => scalar(@chunk_target_aligns),
+    };
+    @chunk_target_aligns = ();
+    
+    return;
+}
+
+
+####
+sub wait_for_chunk {
+
+    my $pid = waitpid(-1, 0);
+    my $ret = $?;
+
+    my $chunk_info = delete $chunk_pid_to_info{$pid} or return;
+    my $chunk_idx = $chunk_info->{chunk_idx};
+    
+    if ($ret) {
+        die "Error, evaluation of alignments chunk $chunk_idx failed with ret $ret";
+    }
+    
+    $chunk_done{$chunk_idx} = 1;
+    $num_targets_evaluated += $chunk_info->{num_targets};
+    
+    ## report the completed chunks in input order
+    while ($chunk_done{$num_chunks_reported}) {
+        delete $chunk_done{$num_chunks_reported};
+
+        my $chunk_file = "$chunk_dir/chunk.$num_chunks_reported";
+        open (my $fh, $chunk_file) or die "Error, cannot open $chunk_file";
+        while (<$fh>) {
+            print;
+        }
+        close $fh;
+        
+        open ($fh, "$chunk_file.num_errors") or die "Error, cannot open $chunk_file.num_errors";
+        my $num_errors = <$fh>;
+        close $fh;
+        chomp $num_errors;
+        $error_counter += $num_errors;
+        
+        unlink($chunk_file, "$chunk_file.num_errors");
+        
+        $num_chunks_reported++;
+    }
+    
+    return;
+}
+
+
+####
 sub evaluate_target_alignments {
     my %target_to_aligns = @_;
 
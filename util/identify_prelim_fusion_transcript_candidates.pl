@@ -22,6 +22,9 @@ my $usage = <<__EOUSAGE__;
 #
 # --chims_described <string>   chims.described file.
 #
+# --chims_columnar <string>    columnar chims.described directory (see chims_columnar.py), used instead of
+#                              parsing --chims_described when provided
+#
 # --max_exon_delta <int>       maximum dist from ref exon boundary
 #
 # --output_prefix <string>    prefix name for output files (prefix).transcripts.fa and (prefix).FI_listing
@@ -43,6 +46,7 @@ __EOUSAGE__
 
 
 my $chims_described;
+my $chims_columnar;
 my $MAX_EXON_DELTA;
 my $help_flag;
 my $output_prefix;
@@ -55,6 +59,7 @@ my $ALT_MAX_EXON_DELTA = 1000;
 
 &GetOptions ( 'help|h' => \$help_flag,
               'chims_described=s' => \$chims_described,
+              'chims_columnar=s' => \$chims_columnar,
               'max_exon_delta=i' => \$MAX_EXON_DELTA,
               'output_prefix=s' => \$output_prefix,
               'min_FFPM=f' => \$min_FFPM,
@@ -67,8 +72,8 @@ if ($help_flag) {
     die $usage;
 }
 
-unless ($chims_described) {
-    print STDERR "\n\nERROR - must specify --chims_desacribed <string>\n";
+unless ($chims_described || $chims_columnar) {
+    print STDERR "\n\nERROR - must specify --chims_desacribed <string> or --chims_columnar <string>\n";
     die $usage;
 }
 
@@ -95,17 +100,26 @@ unless (defined ($min_FFPM) ) {
 
 
 
-$chims_described = &ensure_full_path($chims_described);
-
-
-unless (-s $chims_described) {
-    confess "Error, cannot locate file $chims_described";
+if ($chims_columnar) {
+    $chims_columnar = &ensure_full_path($chims_columnar);
+    unless (-s "$chims_columnar/meta.json") {
+        confess "Error, cannot locate columnar chims described: $chims_columnar";
+    }
+}
+else {
+    $chims_described = &ensure_full_path($chims_described);
+    
+    unless (-s $chims_described) {
+        confess "Error, cannot locate file $chims_described";
+    }
 }
 
 
 main: {
     
-    my @fusion_candidates = &parse_chims($chims_described);
+    my @fusion_candidates = ($chims_columnar)
+        ? &parse_columnar_fusion_summary($chims_columnar, $output_prefix)
+        : &parse_chims($chims_described);
 
     @fusion_candidates = reverse sort {
         $a->{num_reads} <=> $b->{num_reads}
@@ -225,6 +239,46 @@ sub parse_chims {
 
 }
 
+####
+sub parse_columnar_fusion_summary {
+    my ($chims_columnar, $output_prefix) = @_;
+
+    ## per-fusion deltas and read counts computed via vectorized group-by over the columnar chims
+    
+    my $fusion_summary_file = "$output_prefix.columnar_fusion_summary";
+    &process_cmd("$FindBin::Bin/chims_columnar.py --chims_columnar $chims_columnar --fusion_summary_output $fusion_summary_file");
+
+    my @fusion_candidates;
+    
+    open(my $fh, $fusion_summary_file) or die "Error, cannot open file $fusion_summary_file";
+    my $header = <$fh>;
+    while (<$fh>) {
+        chomp;
+        my ($fusion_name,
+            $median_deltaA, $median_deltaB,
+            $min_deltaA, $min_deltaB,
+            $median_trans_brkpt_delta, $min_trans_brkpt_delta,
+            $num_reads, $num_foldback_reads) = split(/\t/);
+
+        push (@fusion_candidates, { fusion_name => $fusion_name,
+                                    median_deltaA => $median_deltaA,
+                                    median_deltaB => $median_deltaB,
+                                    min_deltaA => $min_deltaA,
+                                    min_deltaB => $min_deltaB,
+                                    median_trans_brkpt_delta => $median_trans_brkpt_delta,
+                                    min_trans_brkpt_delta => $min_trans_brkpt_delta,
+                                    num_reads => $num_reads,
+                                    num_foldback_reads => $num_foldback_reads,
+              } );
+    }
+    close $fh;
+
+    unlink($fusion_summary_file);
+    
+    return(@fusion_candidates);
+}
+
+
 ####
 sub compute_mean_val {
     my @vals = @_;
@@ -241,7 +295,7 @@ sub compute_mean_val {
 
 ####
 sub compute_median_val {
-    my @vals = @_;
+    my @vals = sort {$a<=>$b} @_;
     my $num_vals = scalar @vals;
 
     if ($num_vals == 1) {
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+import sys, os, re
+import logging
+import argparse
+
+from LR_FI_bam_fusion_extractor import READ_IDS_SUFFIX
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s : %(levelname)s : %(message)s",
+    datefmt="%H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+## Merges the LR-FI_fusion_align_extractor.pl outputs of the fusion contig shards
+## (see partition_LR-FI_by_fusion_shards.py) into the outputs of a single extractor run:
+##
+##    <output_prefix>                                                : #LRFusionTranscript records, sorted by read, breakpoint
+##    <output_prefix>.breakpoint_info.tsv                            : sorted descending by num_LR, then by fusion name
+##    <output_prefix>.LR-FI_fusion_align_extractor-filtered-log      : concatenated in shard (fusion contig name) order
+##    <output_prefix>.gff3                                           : fusion read alignments, concatenated in shard order
+##                                                                     (each read's from the first shard it supports a fusion in,
+##                                                                      unless --shards_from_LR_gff3)
+##    <output_prefix>.read_ids.tsv                                   : (--encode_read_ids) union of the shard read IDs, by ID
+##
+## Each fusion contig is evaluated within a single shard, so the merged outputs are identical
+## to those of the unsharded extractor, except for the order of the fusion read alignments in the gff3.
+
+FILTERED_LOG_SUFFIX = ".LR-FI_fusion_align_extractor-filtered-log"
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="merge sharded LR-FI_fusion_align_extractor.pl outputs",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument(
+        "--shard_prefixes",
+        type=str,
+        nargs="+",
+        required=True,
+        help="extractor output prefixes for each shard, in shard order",
+    )
+    parser.add_argument(
+        "--encode_read_ids",
+        action="store_true",
+        default=False,
+        help="the shards were run with --encode_read_ids, so merge their read ID tables",
+    )
+    parser.add_argument(
+        "--shards_from_LR_gff3",
+        action="store_true",
+        default=False,
+        help="the shards were partitioned from --LR_gff3, so hold just the alignments to their own fusion contigs",
+    )
+    parser.add_argument("--output_prefix", type=str, required=True, help="prefix for merged output files")
+
+    args = parser.parse_args()
+
+    fusion_read_to_shard = merge_fusion_transcript_records(args.shard_prefixes, args.output_prefix)
+
+    num_fusions = merge_breakpoint_info(
+        [prefix + ".breakpoint_info.tsv" for prefix in args.shard_prefixes],
+        args.output_prefix + ".breakpoint_info.tsv",
+    )
+
+    concatenate_files(
+        [prefix + FILTERED_LOG_SUFFIX for prefix in args.shard_prefixes],
+        args.output_prefix + FILTERED_LOG_SUFFIX,
+    )
+
+    if args.shards_from_LR_gff3:
+        concatenate_files(
+            [prefix + ".gff3" for prefix in args.shard_prefixes],
+            args.output_prefix + ".gff3",
+        )
+    else:
+        merge_fusion_read_alignments(
+            [prefix + ".gff3" for prefix in args.shard_prefixes],
+            fusion_read_to_shard,
+            args.output_prefix + ".gff3",
+        )
+
+    if args.encode_read_ids:
+        merge_read_ids(
+            [prefix + READ_IDS_SUFFIX for prefix in args.shard_prefixes],
+            args.output_prefix + READ_IDS_SUFFIX,
+        )
+
+    logger.info(
+        "-merged {} shards: {} fusion breakpoints supported by {} reads".format(
+            len(args.shard_prefixes), num_fusions, len(fusion_read_to_shard)
+        )
+    )
+
+    sys.exit(0)
+
+
+def merge_fusion_transcript_records(shard_prefixes, output_filename):
+    """
+    returns dict of fusion read id -> index of the first shard it supports a fusion in
+    """
+
+    records = list()
+    fusion_read_to_shard = dict()
+    for shard_idx, prefix in enumerate(shard_prefixes):
+        with open(prefix, "rt") as fh:
+            for line in fh:
+                if line.startswith("#LRFusionTranscript:"):
+                    record = line.rstrip("\n").split("\t")
+                    records.append(record)
+                    fusion_read_to_shard.setdefault(record[1], shard_idx)
+
+    # as ordered by the extractor: by read, then by scaffold breakpoint
+    records.sort(key=lambda x: (x[1], x[2]))
+
+    with open(output_filename, "wt") as ofh:
+        for record in records:
+            ofh.write("\t".join(record) + "\n")
+
+    return fusion_read_to_shard
+
+
+def merge_breakpoint_info(shard_filenames, output_filename):
+    """
+    returns number of breakpoint records written
+    """
+
+    header = None
+    rows = list()
+    for filename in shard_filenames:
+        with open(filename, "rt") as fh:
+            shard_header = fh.readline()
+            if header is None:
+                header = shard_header
+            for line in fh:
+                rows.append(line.split("\t", 2))
+
+    # descending by num_LR, then by fusion name. The sort is stable, and each fusion
+    # is reported from a single shard, retaining the extractor order of its breakpoints.
+    rows.sort(key=lambda x: (-int(x[1]), x[0]))
+
+    with open(output_filename, "wt") as ofh:
+        ofh.write(header)
+        for row in rows:
+            ofh.write("\t".join(row))
+
+    return len(rows)
+
+
+def merge_read_ids(shard_filenames, output_filename):
+
+    # read IDs are the read ordinals in the shared LR bam, so agree across shards
+    read_ids = dict()
+    for filename in shard_filenames:
+        with open(filename, "rt") as fh:
+            header = fh.readline()
+            for line in fh:
+                read_id, read_name = line.rstrip("\n").split("\t")
+                read_ids[int(read_id)] = read_name
+
+    with open(output_filename, "wt") as ofh:
+        ofh.write(header)
+        for read_id in sorted(read_ids):
+            ofh.write("{}\t{}\n".format(read_id, read_ids[read_id]))
+
+
+def concatenate_files(input_filenames, output_filename):
+
+    with open(output_filename, "wt") as ofh:
+        for filename in input_filenames:
+            with open(filename, "rt") as fh:
+                for line in fh:
+                    ofh.write(line)
+
+
+def merge_fusion_read_alignments(shard_filenames, fusion_read_to_shard, output_filename):
+
+    # partitioned from the LR bam, a read supporting fusions in several shards carries all of its
+    # alignments into each of them (see partition_LR-FI_by_fusion_shards.py), and each reports them all.
+    with open(output_filename, "wt") as ofh:
+        for shard_idx, filename in enumerate(shard_filenames):
+            with open(filename, "rt") as fh:
+                for line in fh:
+                    read_name = line.rsplit("Target=", 1)[1].split(" ", 1)[0]
+                    if fusion_read_to_shard[read_name] == shard_idx:
+                        ofh.write(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -23,7 +23,8 @@ def main():
     output_filename = args.output_file
 
     logger.info("-parsing {}".format(mm2_fusions_filename))
-    mm2_df = pd.read_csv(mm2_fusions_filename, sep="\t")
+    # (LR_accessions may be integer read IDs, see expand_read_ids.py, so keep them as text)
+    mm2_df = pd.read_csv(mm2_fusions_filename, sep="\t", dtype={"LR_accessions": str})
 
     logger.info("-parsing {}".format(FI_fusions_filename))
     FI_df = pd.read_csv(FI_fusions_filename, sep="\t")
@@ -6,6 +6,9 @@ import argparse
 import csv
 import logging
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bam_read_index import iter_reads_by_name, get_default_index_dir
+
 csv.field_size_limit(sys.maxsize)
 
 logging.basicConfig(
@@ -76,10 +79,10 @@ def extract_wanted_reads_into_bam(input_bam_file, reads_want, output_bam_filenam
 
     read_counter = 0
 
-    for read in bamreader:
-        if read.query_name in reads_want:
-            bamwriter.write(read)
-            read_counter += 1
+    # seeks directly to the wanted reads if the bam has a read name index (see bam_read_index.py)
+    for read in iter_reads_by_name(bamreader, reads_want, get_default_index_dir(input_bam_file), input_bam_file):
+        bamwriter.write(read)
+        read_counter += 1
 
     logger.info("-wrote {} reads to bam".format(read_counter))
 
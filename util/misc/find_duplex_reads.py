@@ -4,12 +4,32 @@ import sys, os, re
 import pysam
 from ssw import AlignmentMgr
 import argparse
+import multiprocessing
+
+
+## Reports the reads that align to their own reverse complement (candidate duplex reads), as tsv:
+##
+##    accession, read length, read match range, revcomp match range, match length, fraction of read self-aligned
+##
+## Smith-Waterman alignment of a read against its reverse complement is quadratic in the read length,
+## so reads are first screened by the fraction of their k-mers found in their own reverse complement,
+## which is near zero for ordinary reads, and only those passing are aligned (and reported).
+## Batches of reads are processed in parallel with --CPU, reported in input order.
+
+
+REVCOMP_TRANSLATION = str.maketrans("ACGTNacgtn", "TGCANtgcan")
+
+READS_PER_BATCH = 200
+
+_align_mgr = None  # per worker process
 
 
 def main():
 
     min_read_seq_length = 1000
     trim_from_ends = 100
+    kmer_length = 13
+    min_shared_kmer_frac = 0.01
 
     parser = argparse.ArgumentParser(
         description="identify reads that align to their reverse complement sequence and may be duplex type",
@@ -34,6 +54,31 @@ def main():
         help="only analyze reads at least this length",
     )
 
+    parser.add_argument(
+        "--kmer_length",
+        type=int,
+        default=kmer_length,
+        required=False,
+        help="k-mer length for the reverse complement prefilter",
+    )
+
+    parser.add_argument(
+        "--min_shared_kmer_frac",
+        type=float,
+        default=min_shared_kmer_frac,
+        required=False,
+        help="only align reads having at least this fraction of their k-mers in their reverse complement",
+    )
+
+    parser.add_argument(
+        "--no_prefilter",
+        action="store_true",
+        default=False,
+        help="align (and report) every read, without the k-mer prefilter",
+    )
+
+    parser.add_argument("--CPU", type=int, default=1, required=False, help="number of processes")
+
     parser.add_argument(
         "--show_pretty_alignment",
         action="store_true",
@@ -47,74 +92,158 @@ def main():
     trim_from_ends = args.trim_ends_length
     min_read_seq_length = args.min_read_length
     show_pretty_alignment_flag = args.show_pretty_alignment
+    kmer_length = args.kmer_length
+    min_shared_kmer_frac = 0 if args.no_prefilter else args.min_shared_kmer_frac
+
+    batch_args = (trim_from_ends, kmer_length, min_shared_kmer_frac)
+
+    read_batches = iter_read_batches(fastq_filename, min_read_seq_length)
+
+    if show_pretty_alignment_flag:
+        # alignments are printed as they're computed, so stays in this process
+        init_align_mgr()
+        for batch in read_batches:
+            for accession, sequence in batch:
+                result = align_to_revcomp(accession, sequence, *batch_args)
+                if result is not None:
+                    report_line, alignment = result
+                    print(report_line)
+                    _align_mgr.print_result(alignment)
+
+    elif args.CPU > 1:
+        with multiprocessing.Pool(processes=args.CPU, initializer=init_align_mgr) as pool:
+            for report_lines in pool.imap(
+                process_read_batch, ((batch, batch_args) for batch in read_batches)
+            ):
+                write_report_lines(report_lines)
+
+    else:
+        init_align_mgr()
+        for batch in read_batches:
+            write_report_lines(process_read_batch((batch, batch_args)))
+
+    sys.exit(0)
+
+
+def init_align_mgr():
+
+    global _align_mgr
 
     # For alignment method, see: https://libnano.github.io/ssw-py/quickstart.html#alignment
     # and using alignment scoring as in: https://www.nlm.nih.gov/ncbi/workshops/2023-08_BLAST_evol/blast_score.html
 
-    align_mgr = AlignmentMgr(
+    _align_mgr = AlignmentMgr(
         match_score=2,
         mismatch_penalty=3,
     )
 
-    fastq_reader = pysam.FastqFile(fastq_filename)
 
-    for read in fastq_reader:
+def iter_read_batches(fastq_filename, min_read_seq_length):
 
-        accession = read.name
-        sequence = read.sequence
+    batch = list()
 
-        seqlen = len(sequence)
+    with pysam.FastqFile(fastq_filename) as fastq_reader:
+        for read in fastq_reader:
+            if len(read.sequence) < min_read_seq_length:
+                continue
+            batch.append((read.name, read.sequence))
+            if len(batch) >= READS_PER_BATCH:
+                yield batch
+                batch = list()
 
-        if seqlen < min_read_seq_length:
-            continue
+    if batch:
+        yield batch
 
-        # trim off the ends
-        sequence = sequence[trim_from_ends:]
-        sequence = sequence[: -1 * trim_from_ends]
 
-        revseq = reverse_complement(sequence)
+def process_read_batch(batch_info):
+    """
+    returns the report lines for the reads of the batch that self-align
+    """
 
-        align_mgr.set_read(sequence)
-        align_mgr.set_reference(revseq)
+    batch, batch_args = batch_info
 
-        alignment = align_mgr.align(gap_open=5, gap_extension=2)
-        # print(alignment)
+    report_lines = list()
+    for accession, sequence in batch:
+        result = align_to_revcomp(accession, sequence, *batch_args)
+        if result is not None:
+            report_lines.append(result[0])
 
-        revseq_start = alignment.reference_start
-        revseq_end = alignment.reference_end
+    return report_lines
 
-        # revcomp back the match coordinates
-        revseq_start, revseq_end = seqlen - revseq_end + 1, seqlen - revseq_start + 1
 
-        seq_start = alignment.read_start
-        seq_end = alignment.read_end
+def write_report_lines(report_lines):
 
-        match_len = min(seq_end - seq_start, revseq_end - revseq_start)
+    for report_line in report_lines:
+        print(report_line)
 
-        frac_read_self_aligns = match_len / seqlen
+    sys.stdout.flush()
 
-        print(
-            "\t".join(
-                [
-                    accession,
-                    str(seqlen),
-                    "{}-{}".format(seq_start, seq_end),
-                    "{}-{}".format(revseq_start, revseq_end),
-                    str(match_len),
-                    "{:.2f}".format(frac_read_self_aligns),
-                ]
-            )
-        )
 
-        if show_pretty_alignment_flag:
-            align_mgr.print_result(alignment)
+def align_to_revcomp(accession, sequence, trim_from_ends, kmer_length, min_shared_kmer_frac):
+    """
+    returns (report line, alignment), or None if the read fails the k-mer prefilter
+    """
 
-    sys.exit(0)
+    seqlen = len(sequence)
+
+    # trim off the ends
+    sequence = sequence[trim_from_ends:]
+    sequence = sequence[: -1 * trim_from_ends]
+
+    revseq = reverse_complement(sequence)
+
+    if min_shared_kmer_frac > 0 and get_shared_kmer_frac(sequence, revseq, kmer_length) < min_shared_kmer_frac:
+        return None
+
+    _align_mgr.set_read(sequence)
+    _align_mgr.set_reference(revseq)
+
+    alignment = _align_mgr.align(gap_open=5, gap_extension=2)
+    # print(alignment)
+
+    revseq_start = alignment.reference_start
+    revseq_end = alignment.reference_end
+
+    # revcomp back the match coordinates
+    revseq_start, revseq_end = seqlen - revseq_end + 1, seqlen - revseq_start + 1
+
+    seq_start = alignment.read_start
+    seq_end = alignment.read_end
+
+    match_len = min(seq_end - seq_start, revseq_end - revseq_start)
+
+    frac_read_self_aligns = match_len / seqlen
+
+    report_line = "\t".join(
+        [
+            accession,
+            str(seqlen),
+            "{}-{}".format(seq_start, seq_end),
+            "{}-{}".format(revseq_start, revseq_end),
+            str(match_len),
+            "{:.2f}".format(frac_read_self_aligns),
+        ]
+    )
+
+    return report_line, alignment
+
+
+def get_shared_kmer_frac(sequence, revseq, kmer_length):
+    """
+    returns the fraction of the distinct k-mers of the sequence also found in its reverse complement
+    """
+
+    seq_kmers = set(sequence[i : i + kmer_length] for i in range(len(sequence) - kmer_length + 1))
+    if not seq_kmers:
+        return 0
+
+    revseq_kmers = set(revseq[i : i + kmer_length] for i in range(len(revseq) - kmer_length + 1))
+
+    return len(seq_kmers & revseq_kmers) / len(seq_kmers)
 
 
 def reverse_complement(sequence):
-    complement = {"A": "T", "T": "A", "C": "G", "G": "C"}
-    return "".join(complement[base] for base in sequence[::-1])
+    return sequence.translate(REVCOMP_TRANSLATION)[::-1]
 
 
 if __name__ == "__main__":
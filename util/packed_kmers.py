@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+import sys, os, re
+import logging
+from collections import OrderedDict
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+## K-mers (k <= 32) encoded 2 bits per base into uint64 values, held as sorted unique arrays
+## so that shared k-mers between sequences are found by array intersection.
+##
+## K-mers spanning a non-ACGT base (ie. N, or the X separating concatenated transcripts) are skipped.
+## Lowercase bases are treated as uppercase.
+##
+## KmerSetCache keeps the k-mer sets of recently used sequences (ie. per gene) up to a memory cap,
+## so genes recurring across many fusion candidates are only encoded once.
+##
+## Used by screen_fusion_kmer_confounders.py.
+
+
+MAX_KMER_SIZE = 32
+
+INVALID_BASE = 4
+
+BASE_CODES = np.full(256, INVALID_BASE, dtype=np.uint8)
+for base, code in zip("ACGT", range(4)):
+    BASE_CODES[ord(base)] = code
+    BASE_CODES[ord(base.lower())] = code
+
+CODE_BASES = np.array(list("ACGT"))
+
+
+def encode_kmers(seq, kmer_size, beg_pos=0, end_pos=None):
+    """
+    returns (positions, kmers): start positions within seq and packed values of the k-mers
+    starting in [beg_pos, end_pos - kmer_size], in position order
+    """
+
+    if kmer_size < 1 or kmer_size > MAX_KMER_SIZE:
+        raise ValueError("Error, kmer size must be between 1 and {}".format(MAX_KMER_SIZE))
+
+    if end_pos is None or end_pos > len(seq):
+        end_pos = len(seq)
+    beg_pos = max(beg_pos, 0)
+
+    num_kmers = end_pos - beg_pos - kmer_size + 1
+    if num_kmers < 1:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.uint64)
+
+    codes = BASE_CODES[np.frombuffer(seq[beg_pos:end_pos].encode(), dtype=np.uint8)]
+
+    kmers = np.zeros(num_kmers, dtype=np.uint64)
+    for j in range(kmer_size):
+        kmers = (kmers << np.uint64(2)) | (codes[j : j + num_kmers] & 3).astype(np.uint64)
+
+    # drop k-mers spanning an invalid base
+    invalid_cumsum = np.concatenate(([0], np.cumsum(codes == INVALID_BASE)))
+    valid = (invalid_cumsum[kmer_size : kmer_size + num_kmers] - invalid_cumsum[:num_kmers]) == 0
+
+    positions = np.arange(beg_pos, beg_pos + num_kmers, dtype=np.int64)
+
+    return positions[valid], kmers[valid]
+
+
+def reverse_complement_kmers(kmers, kmer_size):
+    """
+    returns the packed reverse complements of the packed k-mers
+    """
+
+    # complement is 3 - code, ie. bitwise not of the 2 bits
+    complement = ~kmers & np.uint64((1 << (2 * kmer_size)) - 1)
+
+    rc_kmers = np.zeros(len(kmers), dtype=np.uint64)
+    for j in range(kmer_size):
+        rc_kmers = (rc_kmers << np.uint64(2)) | (complement & np.uint64(3))
+        complement = complement >> np.uint64(2)
+
+    return rc_kmers
+
+
+def canonical_kmers(kmers, kmer_size):
+    """
+    returns the lesser of each packed k-mer and its reverse complement
+    """
+
+    return np.minimum(kmers, reverse_complement_kmers(kmers, kmer_size))
+
+
+def decode_kmer(kmer, kmer_size):
+
+    kmer = int(kmer)
+    codes = [(kmer >> (2 * (kmer_size - 1 - j))) & 3 for j in range(kmer_size)]
+
+    return "".join(CODE_BASES[codes])
+
+
+def get_kmer_set(seqs, kmer_size, canonical=False):
+    """
+    returns the sorted unique packed k-mers across the sequences
+    """
+
+    if isinstance(seqs, str):
+        seqs = [seqs]
+
+    kmer_arrays = [encode_kmers(seq, kmer_size)[1] for seq in seqs]
+    kmers = np.concatenate(kmer_arrays) if kmer_arrays else np.array([], dtype=np.uint64)
+
+    if canonical:
+        kmers = canonical_kmers(kmers, kmer_size)
+
+    return np.unique(kmers)
+
+
+def get_shared_kmers(kmer_set_A, kmer_set_B):
+
+    return np.intersect1d(kmer_set_A, kmer_set_B, assume_unique=True)
+
+
+class KmerSetCache:
+    """
+    LRU cache of k-mer sets, evicting the least recently used once over max_bytes
+    """
+
+    def __init__(self, max_bytes):
+
+        self.max_bytes = max_bytes
+        self.num_bytes = 0
+        self.kmer_sets = OrderedDict()
+        self.num_hits = 0
+        self.num_misses = 0
+
+    def get(self, key, build_fn):
+        """
+        returns the k-mer set for key, built via build_fn() if not cached
+        """
+
+        kmer_set = self.kmer_sets.get(key)
+        if kmer_set is not None:
+            self.kmer_sets.move_to_end(key)
+            self.num_hits += 1
+            return kmer_set
+
+        self.num_misses += 1
+        kmer_set = build_fn()
+
+        self.kmer_sets[key] = kmer_set
+        self.num_bytes += kmer_set.nbytes
+
+        while self.num_bytes > self.max_bytes and len(self.kmer_sets) > 1:
+            evicted_key, evicted_kmer_set = self.kmer_sets.popitem(last=False)
+            self.num_bytes -= evicted_kmer_set.nbytes
+
+        return kmer_set
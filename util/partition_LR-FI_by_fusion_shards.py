@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+import sys, os, re
+import logging
+import argparse
+import pysam
+
+from extract_chimeric_alignments_from_bam import group_reads_by_name
+from LR_FI_bam_fusion_extractor import READ_ORDINAL_TAG
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s : %(levelname)s : %(message)s",
+    datefmt="%H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+## Partitions the phase-2 (FusionInspector-style) fusion contig inputs into shards of fusion contigs,
+## so LR-FI_fusion_align_extractor.pl can be run on each shard independently and concurrently
+## (see merge_LR-FI_fusion_shards.py for combining the shard outputs).
+##
+## Shards are contiguous ranges of the sorted fusion contig names, matching the order in which
+## the extractor processes contigs, and each shard_<i>/ directory receives the matching subsets of:
+##     LR-FI_targets.gtf, LR-FI_targets.seqsimilar_regions.gff3, LR-FI.mm2.gff3 or LR-FI.mm2.bam
+##
+## (the LR alignments are only partitioned if given, as gff3 for LR-FI_fusion_align_extractor.pl or
+##  as bam for LR_FI_bam_fusion_extractor.py)
+##
+## The LR bam (grouped by read name) is split in a single pass: all records of a read are written to each
+## shard having a fusion contig the read aligns to, so each shard reads just its own reads. The records are
+## tagged with the ordinal of the read in the unsplit bam, as the shared read IDs (see --encode_read_ids).
+
+SHARD_FI_GTF = "LR-FI_targets.gtf"
+SHARD_SEQSIM_GFF3 = "LR-FI_targets.seqsimilar_regions.gff3"
+SHARD_LR_GFF3 = "LR-FI.mm2.gff3"
+SHARD_LR_BAM = "LR-FI.mm2.bam"
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="partition fusion contig annotations and long read alignments into shards",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument("--FI_gtf", type=str, required=True, help="FI contigs gtf filename")
+    parser.add_argument("--seq_similar_gff3", type=str, required=True, help="seq-similar regions gff3 file")
+    parser.add_argument(
+        "--LR_gff3", type=str, required=False, default=None, help="LR alignments to FI contigs in gff3 format"
+    )
+    parser.add_argument(
+        "--LR_bam", type=str, required=False, default=None, help="LR alignments to FI contigs, grouped by read name"
+    )
+    parser.add_argument("--threads", type=int, default=1, help="number of bam decompression threads")
+    parser.add_argument("--num_shards", type=int, required=True, help="number of shards")
+    parser.add_argument("--shards_dir", type=str, required=True, help="output directory for the shard_<i> subdirectories")
+
+    args = parser.parse_args()
+
+    scaffolds = get_scaffold_names(args.FI_gtf)
+
+    scaffold_to_shard = assign_scaffolds_to_shards(scaffolds, args.num_shards)
+
+    logger.info(
+        "-partitioning {} fusion contigs into {} shards".format(len(scaffolds), args.num_shards)
+    )
+
+    shard_dirs = get_shard_dirs(args.shards_dir, args.num_shards)
+    for shard_dir in shard_dirs:
+        os.makedirs(shard_dir, exist_ok=True)
+
+    shard_inputs = [(args.FI_gtf, SHARD_FI_GTF), (args.seq_similar_gff3, SHARD_SEQSIM_GFF3)]
+    if args.LR_gff3:
+        shard_inputs.append((args.LR_gff3, SHARD_LR_GFF3))
+
+    for input_filename, shard_filename in shard_inputs:
+        num_unassigned = partition_by_scaffold(
+            input_filename,
+            scaffold_to_shard,
+            [os.path.join(shard_dir, shard_filename) for shard_dir in shard_dirs],
+        )
+        if num_unassigned:
+            logger.warning(
+                "-{} records in {} lack a corresponding fusion contig and were not assigned to a shard".format(
+                    num_unassigned, input_filename
+                )
+            )
+
+    if args.LR_bam:
+        num_unassigned = partition_bam_by_scaffold(
+            args.LR_bam,
+            scaffold_to_shard,
+            [os.path.join(shard_dir, SHARD_LR_BAM) for shard_dir in shard_dirs],
+            args.threads,
+        )
+        logger.info("-{} reads in {} lack alignments to the fusion contigs".format(num_unassigned, args.LR_bam))
+
+    sys.exit(0)
+
+
+def get_shard_dirs(shards_dir, num_shards):
+    return [os.path.join(shards_dir, "shard_{}".format(i)) for i in range(num_shards)]
+
+
+def get_scaffold_names(FI_gtf_filename):
+
+    scaffolds = set()
+    with open(FI_gtf_filename, "rt") as fh:
+        for line in fh:
+            if line.startswith("#") or "\t" not in line:
+                continue
+            scaffolds.add(line.split("\t", 1)[0])
+
+    return sorted(scaffolds)
+
+
+def assign_scaffolds_to_shards(scaffolds, num_shards):
+    """
+    splits the sorted scaffold names into num_shards contiguous ranges of (near) equal size
+    """
+
+    num_shards = max(1, num_shards)
+    scaffold_to_shard = dict()
+    for i, scaffold in enumerate(scaffolds):
+        scaffold_to_shard[scaffold] = i * num_shards // len(scaffolds)
+
+    return scaffold_to_shard
+
+
+def partition_by_scaffold(input_filename, scaffold_to_shard, shard_filenames):
+    """
+    writes each record to the shard of its scaffold (first column), retaining the input order.
+    returns the number of records not assigned to any shard.
+    """
+
+    num_unassigned = 0
+
+    shard_ofhs = [open(filename, "wt") for filename in shard_filenames]
+    try:
+        with open(input_filename, "rt") as fh:
+            for line in fh:
+                if line.startswith("#") or "\t" not in line:
+                    continue
+                shard = scaffold_to_shard.get(line.split("\t", 1)[0])
+                if shard is None:
+                    num_unassigned += 1
+                    continue
+                shard_ofhs[shard].write(line)
+    finally:
+        for ofh in shard_ofhs:
+            ofh.close()
+
+    return num_unassigned
+
+
+def partition_bam_by_scaffold(input_bam_filename, scaffold_to_shard, shard_filenames, threads):
+    """
+    writes the records of each read to the shards of the scaffolds it aligns to, retaining the input order.
+    returns the number of reads not assigned to any shard.
+    """
+
+    num_unassigned = 0
+
+    with pysam.AlignmentFile(input_bam_filename, "rb", check_sq=False, threads=threads) as bamreader:
+
+        shard_writers = [pysam.AlignmentFile(filename, "wb", template=bamreader) for filename in shard_filenames]
+        try:
+            for read_ordinal, reads in enumerate(group_reads_by_name(bamreader)):
+                shards = set(
+                    scaffold_to_shard[read.reference_name]
+                    for read in reads
+                    if not read.is_unmapped and read.reference_name in scaffold_to_shard
+                )
+                if not shards:
+                    num_unassigned += 1
+                    continue
+                for read in reads:
+                    read.set_tag(READ_ORDINAL_TAG, read_ordinal, value_type="i")
+                for shard in shards:
+                    for read in reads:
+                        shard_writers[shard].write(read)
+        finally:
+            for writer in shard_writers:
+                writer.close()
+
+    return num_unassigned
+
+
+if __name__ == "__main__":
+    main()
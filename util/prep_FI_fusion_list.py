@@ -5,7 +5,7 @@ from collections import defaultdict
 
 
 
-usage = "\n\n\tusage: {} chims.described > FI.list\n\n".format(sys.argv[0])
+usage = "\n\n\tusage: {} chims.described[.columnar] > FI.list\n\n".format(sys.argv[0])
 
 if len(sys.argv) < 2:
     exit(usage)
@@ -14,12 +14,23 @@ chims_described_file = sys.argv[1]
 
 fusion_counter = defaultdict(int)
 
-with open(chims_described_file) as fh:
-    for line in fh:
-        line = line.rstrip()
-        vals = line.split(";")
-        fusion_name = vals.pop()
-        fusion_counter[fusion_name] += 1
+if os.path.isdir(chims_described_file):
+    # columnar chims described (see chims_columnar.py)
+    import numpy as np
+    from chims_columnar import ChimsColumnar
+
+    chims = ChimsColumnar(chims_described_file)
+    fusion_counts = np.bincount(chims.fusion_idx, minlength=len(chims.fusion_names))
+    for fusion_name, count in zip(chims.fusion_names, fusion_counts):
+        fusion_counter[str(fusion_name)] = int(count)
+
+else:
+    with open(chims_described_file) as fh:
+        for line in fh:
+            line = line.rstrip()
+            vals = line.split(";")
+            fusion_name = vals.pop()
+            fusion_counter[fusion_name] += 1
 
 fusions = fusion_counter.keys()
 fusions = sorted(fusions, key=lambda x: fusion_counter[x], reverse=True)
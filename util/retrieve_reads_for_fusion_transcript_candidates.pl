@@ -21,6 +21,9 @@ my $usage = <<__EOUSAGE__;
 #########################################################################################################
 #
 # --chims_described <string>   chims described file
+#
+# --chims_columnar <string>    columnar chims described directory (see chims_columnar.py), used instead of
+#                              parsing --chims_described when provided
 
 # --reads <string>             fastA or fastQ file containing reads
 #
@@ -30,6 +33,11 @@ my $usage = <<__EOUSAGE__;
 #
 # --skip_read_extraction      dont extract the fusion reads, just generate the prelim report.
 #
+# --read_store <string>       indexed read store (see build_read_store.py) to fetch reads from
+#                             instead of streaming through --reads
+#
+# --CPU <int>                 number of read store retrieval processes (default: 1)
+#
 ###########################################################################################################
 
 
@@ -39,26 +47,33 @@ __EOUSAGE__
 
 
 my $chims_described_file;
+my $chims_columnar;
 my $reads_file;
 my $fusions_input_file;
 my $help_flag;
 my $output_prefix;
 my $SKIP_READ_EXTRACTION = 0;
+my $read_store;
+my $CPU = 1;
 
 &GetOptions ( 'help|h' => \$help_flag,
               'chims_described=s' => \$chims_described_file,
+              'chims_columnar=s' => \$chims_columnar,
               'reads=s' => \$reads_file,
               'fusions=s' => \$fusions_input_file,
               'output_prefix=s' => \$output_prefix,
               'skip_read_extraction' => \$SKIP_READ_EXTRACTION,
+              'read_store=s' => \$read_store,
+              'CPU=i' => \$CPU,
     );
 
 if ($help_flag) {
     die $usage;
 }
 
-unless($chims_described_file) {
-    print STDERR "\n\nERROR - must specify --chims_described <string> \n";
+unless($chims_described_file || $chims_columnar) {
+    print STDERR "\n\nERROR - must specify --chims_described <string> or --chims_columnar <string>\n";
+    die $usage;
 }
 
 unless ($reads_file) {
@@ -90,7 +105,9 @@ main: {
 
     my %fusion_targets = &parse_fusion_targets($fusions_input_file);
     
-    my @fusion_candidates = &parse_chims($chims_described_file, \%fusion_targets);
+    my @fusion_candidates = ($chims_columnar)
+        ? &parse_columnar_fusion_reads($chims_columnar, $fusions_input_file, $output_prefix)
+        : &parse_chims($chims_described_file, \%fusion_targets);
 
     @fusion_candidates = reverse sort {
         $a->{num_reads} <=> $b->{num_reads}
@@ -121,6 +138,12 @@ main: {
         exit(0);
     }
 
+    if ($read_store) {
+        &fetch_reads_from_store($read_store, \%reads_want, "$output_prefix.transcripts.fa");
+        print STDERR "-done. See files: $output_prefix.transcripts.fa and $output_prefix.FI_listing\n";
+        exit(0);
+    }
+    
     open(my $ofh_fasta, ">$output_prefix.transcripts.fa") or die $!;
 
     my $reads_file_type = &get_reads_file_type($reads_file);
@@ -212,6 +235,43 @@ sub parse_chims {
 
 
 
+####
+sub parse_columnar_fusion_reads {
+    my ($chims_columnar, $fusions_input_file, $output_prefix) = @_;
+
+    my $fusion_reads_file = "$output_prefix.columnar_fusion_reads";
+    &process_cmd("$FindBin::Bin/chims_columnar.py --chims_columnar $chims_columnar --fusions $fusions_input_file --fusion_reads_output $fusion_reads_file");
+    
+    my %fusion_pairs;
+
+    open(my $fh, $fusion_reads_file) or die "Error, cannot open file $fusion_reads_file";
+    my $header = <$fh>;
+    while (<$fh>) {
+        chomp;
+        my ($fusion_name, $trans_acc) = split(/\t/);
+
+        my $fusion_info_struct = $fusion_pairs{$fusion_name};
+        
+        if (! defined $fusion_info_struct) {
+            $fusion_info_struct = $fusion_pairs{$fusion_name} = { fusion_name => $fusion_name,
+                                                                  read_names => [],
+                                                                  num_reads => 0,
+            };
+        }
+        
+        push (@{$fusion_info_struct->{read_names}}, $trans_acc);
+        $fusion_info_struct->{num_reads}++;
+    }
+    close $fh;
+
+    unlink($fusion_reads_file);
+    
+    my @fusion_candidates = values %fusion_pairs;
+
+    return(@fusion_candidates);
+}
+
+
 ####
 sub write_candidates_summary {
     my ($prelim_candidates_summary_outfile, $fusion_candidates_aref) = @_;
@@ -246,6 +306,26 @@ sub write_candidates_summary {
 }
 
 
+####
+sub fetch_reads_from_store {
+    my ($read_store, $reads_want_href, $output_fasta) = @_;
+
+    my $read_names_file = "$output_fasta.read_names";
+    open(my $ofh, ">$read_names_file") or die "Error, cannot write to $read_names_file";
+    foreach my $read (keys %$reads_want_href) {
+        print $ofh "$read\n";
+    }
+    close $ofh;
+
+    # errors out if any reads are missing from the store
+    &process_cmd("$FindBin::Bin/fetch_reads_from_store.py --store $read_store --read_names $read_names_file --output $output_fasta --threads $CPU");
+
+    unlink($read_names_file);
+    
+    return;
+}
+
+
 ####
 sub get_reads_file_type {
     my ($reads_file) = @_;
@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+
+import sys, os, re
+import logging
+import argparse
+import csv
+import multiprocessing
+import numpy as np
+import pysam
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bam_read_index import iter_reads_by_name, get_default_index_dir
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s : %(levelname)s : %(message)s",
+    datefmt="%H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+csv.field_size_limit(sys.maxsize)
+
+
+## Sparse cell x fusion count matrix from a ctat-LR-fusion fusion table, with the evidence reads
+## collapsed by UMI: each (cell barcode, UMI) counts once per fusion.
+##
+## The cell barcode and UMI of each evidence read are taken from (in order of preference):
+##    --cell_tags <file>    read_name, cell_barcode, umi table (ie. build_read_store.py --cell_tags_output)
+##    --bam <file>          bam (ie. MAS-seq) with the cell barcode and UMI tags of the reads
+##    LR_cell_barcodes and LR_UMIs columns of the fusion table (ctat-LR-fusion --ubam)
+##    the read names themselves, as CB^UMI^read_name (ie. from 10x_ubam_to_fastq.py or sc-Kinnex_ubam_to_fastq.py)
+##
+## Writes, for --output_prefix prefix:
+##    prefix.npz            CSR matrix, rows: cells, columns: fusions (scipy.sparse.load_npz compatible)
+##    prefix.mtx            same, in Matrix Market coordinate format
+##    prefix.barcodes.tsv   cell barcode of each row
+##    prefix.features.tsv   fusion of each column
+##
+## Matrices of several samples are merged via --merge, with the barcodes prefixed by each
+## sample name (--sample_name when building) so cells of different samples stay distinct.
+##
+## ie.
+##    fusion_cell_count_matrix.py --fusions ctat-LR-fusion.fusion_predictions.tsv --sample_name S1 --output_prefix S1.fusion_counts
+##    fusion_cell_count_matrix.py --merge S1.fusion_counts S2.fusion_counts --output_prefix cohort.fusion_counts
+
+
+CELL_BARCODES_COLUMN = "LR_cell_barcodes"
+UMIS_COLUMN = "LR_UMIs"
+EMPTY_VALUES = ("", "NA", ".")
+
+FUSIONS_PER_TASK = 256
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="build (or merge) sparse cell x fusion UMI count matrices",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument("--fusions", type=str, required=False, default=None, help="ctat-LR-fusion fusion predictions")
+    parser.add_argument(
+        "--cell_tags",
+        type=str,
+        required=False,
+        default=None,
+        help="read_name, cell_barcode, umi table for the evidence reads",
+    )
+    parser.add_argument(
+        "--bam", type=str, required=False, default=None, help="bam with the cell barcode and UMI tags of the reads"
+    )
+    parser.add_argument("--cell_barcode_tag", type=str, default="CB", help="bam tag holding the cell barcode")
+    parser.add_argument("--umi_tag", type=str, default="UB", help="bam tag holding the UMI (ie. XM for sc-Kinnex)")
+    parser.add_argument(
+        "--by_breakpoint",
+        action="store_true",
+        default=False,
+        help="one matrix column per fusion breakpoint (FusionName|LeftBreakpoint|RightBreakpoint) instead of per fusion",
+    )
+    parser.add_argument(
+        "--sample_name",
+        type=str,
+        required=False,
+        default=None,
+        help="prefix the cell barcodes with the sample name (as sample_name:barcode)",
+    )
+    parser.add_argument(
+        "--merge",
+        type=str,
+        nargs="+",
+        required=False,
+        default=None,
+        help="merge these matrices (output prefixes of earlier runs) instead of building from --fusions",
+    )
+    parser.add_argument("--output_prefix", type=str, required=True, help="output prefix")
+    parser.add_argument("--CPU", type=int, default=1, help="number of processes")
+
+    args = parser.parse_args()
+
+    if args.merge:
+        matrices = [read_count_matrix(prefix) for prefix in args.merge]
+        barcodes, features, matrix = merge_count_matrices(matrices)
+
+    else:
+        if args.fusions is None:
+            raise RuntimeError("Error, must specify --fusions or --merge")
+
+        feature_reads = parse_fusion_reads(args.fusions, args.by_breakpoint)
+
+        read_cell_tags = None
+        if args.cell_tags:
+            read_cell_tags = parse_cell_tags(args.cell_tags, get_fusion_read_names(feature_reads))
+        elif args.bam:
+            read_cell_tags = extract_bam_cell_tags(
+                args.bam, get_fusion_read_names(feature_reads), args.cell_barcode_tag, args.umi_tag
+            )
+
+        barcodes, features, matrix = build_count_matrix(feature_reads, read_cell_tags, args.CPU)
+
+        if args.sample_name:
+            barcodes = ["{}:{}".format(args.sample_name, barcode) for barcode in barcodes]
+
+    write_count_matrix(args.output_prefix, barcodes, features, matrix)
+
+    logger.info(
+        "-wrote {} cells x {} fusions matrix ({} nonzero, {} UMIs) to {}.*".format(
+            len(barcodes), len(features), len(matrix["data"]), int(matrix["data"].sum()), args.output_prefix
+        )
+    )
+
+    sys.exit(0)
+
+
+def parse_fusion_reads(fusions_filename, by_breakpoint):
+    """
+    returns dict of feature (fusion name, or fusion breakpoint) -> list of evidence reads,
+    each read as (read_name, cell_barcode, umi) with the tags None if not in the fusion table
+    """
+
+    feature_reads = dict()
+
+    with open(fusions_filename, "rt") as fh:
+        reader = csv.DictReader(fh, delimiter="\t")
+        has_tag_columns = CELL_BARCODES_COLUMN in reader.fieldnames and UMIS_COLUMN in reader.fieldnames
+
+        for row in reader:
+            LR_accessions = row["LR_accessions"]
+            if LR_accessions in EMPTY_VALUES:
+                continue
+
+            feature = row["#FusionName"]
+            if by_breakpoint:
+                feature = "|".join([feature, row["LeftBreakpoint"], row["RightBreakpoint"]])
+
+            read_names = LR_accessions.split(",")
+            if has_tag_columns:
+                reads = zip(read_names, row[CELL_BARCODES_COLUMN].split(","), row[UMIS_COLUMN].split(","))
+            else:
+                reads = ((read_name, None, None) for read_name in read_names)
+
+            feature_reads.setdefault(feature, list()).extend(reads)
+
+    return feature_reads
+
+
+def get_fusion_read_names(feature_reads):
+
+    return set(read_name for reads in feature_reads.values() for read_name, cell_barcode, umi in reads)
+
+
+def parse_cell_tags(cell_tags_filename, reads_want):
+    """
+    returns dict of read name -> (cell_barcode, umi)
+    """
+
+    read_cell_tags = dict()
+
+    with open(cell_tags_filename, "rt") as fh:
+        for line in fh:
+            if line.startswith("#"):
+                continue
+            read_name, cell_barcode, umi = line.rstrip("\n").split("\t")
+            if read_name in reads_want:
+                read_cell_tags[read_name] = (cell_barcode, umi)
+
+    return read_cell_tags
+
+
+def extract_bam_cell_tags(bam_filename, reads_want, cell_barcode_tag, umi_tag):
+    """
+    returns dict of read name -> (cell_barcode, umi)
+    """
+
+    read_cell_tags = dict()
+
+    # seeks directly to the fusion reads if the bam has a read name index (see bam_read_index.py)
+    with pysam.AlignmentFile(bam_filename, "rb", check_sq=False) as samreader:
+        for read in iter_reads_by_name(samreader, reads_want, get_default_index_dir(bam_filename), bam_filename):
+            if read.query_name in read_cell_tags:
+                continue
+            cell_barcode = read.get_tag(cell_barcode_tag) if read.has_tag(cell_barcode_tag) else "NA"
+            umi = read.get_tag(umi_tag) if read.has_tag(umi_tag) else "NA"
+            read_cell_tags[read.query_name] = (str(cell_barcode), str(umi))
+
+    return read_cell_tags
+
+
+def get_read_cell_tags(read_name, cell_barcode, umi, read_cell_tags):
+
+    if read_cell_tags is not None:
+        return read_cell_tags.get(read_name, ("NA", "NA"))
+
+    if cell_barcode is not None:
+        return cell_barcode, umi
+
+    # encoded in the read name as CB^UMI^read_name
+    name_parts = read_name.split("^")
+    if len(name_parts) >= 3:
+        return name_parts[0], name_parts[1]
+
+    return "NA", "NA"
+
+
+def count_fusion_cell_umis(feature_batch):
+    """
+    returns list of (feature_idx, {cell_barcode: num_UMIs}) for the batch of (feature_idx, [(cell_barcode, umi_key), ...])
+    """
+
+    results = list()
+    for feature_idx, cell_umis in feature_batch:
+        cell_counts = dict()
+        for cell_barcode, umi_key in set(cell_umis):
+            cell_counts[cell_barcode] = cell_counts.get(cell_barcode, 0) + 1
+        results.append((feature_idx, cell_counts))
+
+    return results
+
+
+def build_count_matrix(feature_reads, read_cell_tags, num_processes):
+    """
+    returns (barcodes, features, matrix) with matrix a dict of the CSR arrays (rows: barcodes, columns: features)
+    """
+
+    features = sorted(feature_reads)
+
+    feature_cell_umis = list()
+    num_reads = 0
+    num_unassigned = 0
+    for feature_idx, feature in enumerate(features):
+        cell_umis = list()
+        for read_name, cell_barcode, umi in feature_reads[feature]:
+            num_reads += 1
+            cell_barcode, umi = get_read_cell_tags(read_name, cell_barcode, umi, read_cell_tags)
+            if cell_barcode in EMPTY_VALUES:
+                num_unassigned += 1
+                continue
+            # reads lacking a UMI can't be collapsed, so each counts on its own
+            umi_key = umi if umi not in EMPTY_VALUES else "read:" + read_name
+            cell_umis.append((cell_barcode, umi_key))
+        feature_cell_umis.append((feature_idx, cell_umis))
+
+    if num_unassigned:
+        logger.warning("-{} of {} fusion evidence reads lack a cell barcode, not counted".format(num_unassigned, num_reads))
+
+    batches = [
+        feature_cell_umis[i : i + FUSIONS_PER_TASK] for i in range(0, len(feature_cell_umis), FUSIONS_PER_TASK)
+    ]
+
+    if num_processes > 1 and len(batches) > 1:
+        with multiprocessing.Pool(processes=min(num_processes, len(batches))) as pool:
+            batch_results = pool.map(count_fusion_cell_umis, batches)
+    else:
+        batch_results = [count_fusion_cell_umis(batch) for batch in batches]
+
+    # coordinate triples -> CSR
+    barcode_idx = dict()
+    rows, cols, vals = list(), list(), list()
+    for results in batch_results:
+        for feature_idx, cell_counts in results:
+            for cell_barcode, count in cell_counts.items():
+                rows.append(barcode_idx.setdefault(cell_barcode, len(barcode_idx)))
+                cols.append(feature_idx)
+                vals.append(count)
+
+    # rows ordered by barcode
+    barcodes = sorted(barcode_idx)
+    row_order = np.empty(len(barcodes), dtype=np.int64)
+    for i, barcode in enumerate(barcodes):
+        row_order[barcode_idx[barcode]] = i
+
+    matrix = coo_to_csr(
+        row_order[np.array(rows, dtype=np.int64)] if rows else np.array([], dtype=np.int64),
+        np.array(cols, dtype=np.int64),
+        np.array(vals, dtype=np.int64),
+        (len(barcodes), len(features)),
+    )
+
+    return barcodes, features, matrix
+
+
+def coo_to_csr(rows, cols, vals, shape):
+    """
+    returns dict of CSR arrays (as per scipy.sparse.save_npz), summing any duplicate coordinates
+    """
+
+    num_rows, num_cols = shape
+
+    order = np.lexsort((cols, rows))
+    rows, cols, vals = rows[order], cols[order], vals[order]
+
+    if len(rows) > 0:
+        # sum duplicates
+        is_new = np.ones(len(rows), dtype=bool)
+        is_new[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+        group_starts = np.flatnonzero(is_new)
+        vals = np.add.reduceat(vals, group_starts)
+        rows, cols = rows[group_starts], cols[group_starts]
+
+    indptr = np.zeros(num_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=num_rows), out=indptr[1:])
+
+    return {
+        "data": vals.astype(np.int64),
+        "indices": cols.astype(np.int32),
+        "indptr": indptr.astype(np.int32),
+        "shape": np.array(shape, dtype=np.int64),
+    }
+
+
+def write_count_matrix(output_prefix, barcodes, features, matrix):
+
+    # same layout as scipy.sparse.save_npz, so loadable via scipy.sparse.load_npz
+    np.savez_compressed(output_prefix + ".npz", format=np.array("csr"), **matrix)
+
+    with open(output_prefix + ".barcodes.tsv", "wt") as ofh:
+        for barcode in barcodes:
+            print(barcode, file=ofh)
+
+    with open(output_prefix + ".features.tsv", "wt") as ofh:
+        for feature in features:
+            print(feature, file=ofh)
+
+    num_rows, num_cols = matrix["shape"]
+    indptr, indices, data = matrix["indptr"], matrix["indices"], matrix["data"]
+    with open(output_prefix + ".mtx", "wt") as ofh:
+        print("%%MatrixMarket matrix coordinate integer general", file=ofh)
+        print("% rows: cells (barcodes.tsv), columns: fusions (features.tsv)", file=ofh)
+        print("{} {} {}".format(num_rows, num_cols, len(data)), file=ofh)
+        for row in range(num_rows):
+            for i in range(indptr[row], indptr[row + 1]):
+                print("{} {} {}".format(row + 1, indices[i] + 1, data[i]), file=ofh)
+
+    return
+
+
+def read_count_matrix(prefix):
+    """
+    returns (barcodes, features, matrix) as written by write_count_matrix()
+    """
+
+    with np.load(prefix + ".npz") as npz:
+        if str(npz["format"]) != "csr":
+            raise RuntimeError("Error, {}.npz is not a CSR matrix".format(prefix))
+        matrix = {name: npz[name] for name in ("data", "indices", "indptr", "shape")}
+
+    with open(prefix + ".barcodes.tsv", "rt") as fh:
+        barcodes = [line.rstrip("\n") for line in fh]
+
+    with open(prefix + ".features.tsv", "rt") as fh:
+        features = [line.rstrip("\n") for line in fh]
+
+    if tuple(matrix["shape"]) != (len(barcodes), len(features)):
+        raise RuntimeError(
+            "Error, {}.npz shape {} doesn't match its barcodes and features".format(prefix, tuple(matrix["shape"]))
+        )
+
+    return barcodes, features, matrix
+
+
+def merge_count_matrices(matrices):
+    """
+    returns (barcodes, features, matrix) over the union of the barcodes and features,
+    summing the counts of any barcode present in multiple matrices
+    """
+
+    barcodes = sorted(set(barcode for matrix_barcodes, features, matrix in matrices for barcode in matrix_barcodes))
+    features = sorted(set(feature for barcodes_, matrix_features, matrix in matrices for feature in matrix_features))
+
+    barcode_idx = {barcode: i for i, barcode in enumerate(barcodes)}
+    feature_idx = {feature: i for i, feature in enumerate(features)}
+
+    all_rows, all_cols, all_vals = list(), list(), list()
+    for matrix_barcodes, matrix_features, matrix in matrices:
+        row_map = np.array([barcode_idx[barcode] for barcode in matrix_barcodes], dtype=np.int64)
+        col_map = np.array([feature_idx[feature] for feature in matrix_features], dtype=np.int64)
+
+        row_counts = np.diff(matrix["indptr"])
+        local_rows = np.repeat(np.arange(len(row_counts)), row_counts)
+
+        all_rows.append(row_map[local_rows] if len(local_rows) else local_rows)
+        all_cols.append(col_map[matrix["indices"]] if len(matrix["indices"]) else matrix["indices"].astype(np.int64))
+        all_vals.append(matrix["data"])
+
+    matrix = coo_to_csr(
+        np.concatenate(all_rows).astype(np.int64),
+        np.concatenate(all_cols).astype(np.int64),
+        np.concatenate(all_vals).astype(np.int64),
+        (len(barcodes), len(features)),
+    )
+
+    return barcodes, features, matrix
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,9 @@ import pysam
 import csv
 import logging
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bam_read_index import iter_reads_by_name, get_default_index_dir
+
 logging.basicConfig(stream=sys.stderr, level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -38,8 +41,9 @@ def extract_cell_barcodes_for_fusion_reads(read_to_fusion, bam_filename):
 
     read_name_to_cell_barcode = dict()
 
+    # seeks directly to the fusion reads if the bam has a read name index (see bam_read_index.py)
     samreader = pysam.AlignmentFile(bam_filename, "rb", check_sq=False)
-    for read in samreader:
+    for read in iter_reads_by_name(samreader, set(read_to_fusion), get_default_index_dir(bam_filename), bam_filename):
         read_name = read.query_name
         if read_name in read_to_fusion:
             fusion_name = read_to_fusion[read_name]
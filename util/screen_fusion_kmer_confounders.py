@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+
+import sys, os, re
+import logging
+import argparse
+import time
+import numpy as np
+import pysam
+
+from packed_kmers import (
+    encode_kmers,
+    canonical_kmers,
+    reverse_complement_kmers,
+    decode_kmer,
+    get_kmer_set,
+    get_shared_kmers,
+    KmerSetCache,
+)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s : %(levelname)s : %(message)s",
+    datefmt="%H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+## Screens candidate fusion transcripts (chims_described entries) for k-mers shared between the
+## two partner sequences occurring at the fusion transcript, which could confound the fusion call.
+## Uses packed k-mer arrays (see packed_kmers.py) in place of the per-candidate k-mer hashes of:
+##
+##   --ref_cdna   screen_fusion_trans_genes_for_kmer_confounders.pl: partner sequences are all
+##                transcripts of each gene, fusion transcript k-mers within --anchor of the breakpoint
+##
+##   --genome_fa  screen_fusion_genome_breakpoint_for_confounding_kmers.pl: partner sequences are
+##                the --window_size genome regions centered on each breakpoint, k-mers in either
+##                orientation, across the whole fusion transcript
+##
+## The k-mer set of each gene (or genome region) is cached across candidates (--kmer_cache_MB).
+##
+## As per the perl screens, confounded entries are written to <chims_described>.kmer_confound_info
+## commented out, followed by the shared k-mers and their fusion transcript positions, and the
+## unconfounded entries are written there as is and also to stdout.
+##
+## K-mers spanning non-ACGT bases are not considered, and windows extending past the start of the
+## fusion transcript are clipped to it.
+##
+## Like the perl screens, this is a standalone utility run by hand: no ctat-LR-fusion step calls it.
+
+
+PROGRESS_INTERVAL = 15  # seconds
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="screen fusion transcript candidates for k-mers shared by the fusion partners",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument("--chims_described", type=str, required=True, help="chims_described candidates")
+    parser.add_argument("--fusion_trans_fasta", type=str, required=True, help="fusion transcript sequences")
+    parser.add_argument("--ref_cdna", type=str, required=False, default=None, help="reference cdna fasta")
+    parser.add_argument("--genome_fa", type=str, required=False, default=None, help="reference genome fasta")
+    parser.add_argument("--kmer_size", type=int, required=True, help="k-mer size (at most 32)")
+    parser.add_argument(
+        "--anchor",
+        type=int,
+        required=False,
+        default=None,
+        help="with --ref_cdna, fusion transcript k-mers within this distance of the breakpoint are screened",
+    )
+    parser.add_argument(
+        "--window_size",
+        type=int,
+        required=False,
+        default=None,
+        help="with --genome_fa, length of the genome region centered on each breakpoint",
+    )
+    parser.add_argument("--kmer_cache_MB", type=int, default=1024, help="memory cap for the cached k-mer sets")
+
+    args = parser.parse_args()
+
+    if (args.ref_cdna is None) == (args.genome_fa is None):
+        raise RuntimeError("Error, specify one of --ref_cdna or --genome_fa")
+    if args.ref_cdna and args.anchor is None:
+        raise RuntimeError("Error, --ref_cdna requires --anchor")
+    if args.genome_fa and args.window_size is None:
+        raise RuntimeError("Error, --genome_fa requires --window_size")
+
+    kmer_cache = KmerSetCache(args.kmer_cache_MB * 1024 * 1024)
+
+    if args.ref_cdna:
+        screener = TransGeneKmerScreener(args.ref_cdna, args.kmer_size, args.anchor, kmer_cache)
+    else:
+        screener = GenomeBreakpointKmerScreener(args.genome_fa, args.kmer_size, args.window_size, kmer_cache)
+
+    fusion_trans = parse_fasta_seqs(args.fusion_trans_fasta)
+
+    num_candidates = 0
+    num_confounded = 0
+    last_progress_time = time.time()
+
+    with open(args.chims_described, "rt") as fh, open(args.chims_described + ".kmer_confound_info", "wt") as ofh:
+        for line in fh:
+            if line.startswith("#"):
+                continue
+            line = line.rstrip("\n")
+            vals = line.split("\t")
+
+            trans_acc = vals[0]
+            fusion_pts = vals[3].split(";")
+
+            shared_breakpoint_kmers = screener.get_shared_breakpoint_kmers(fusion_trans[trans_acc], fusion_pts)
+
+            num_candidates += 1
+            if shared_breakpoint_kmers:
+                num_confounded += 1
+                kmer_text = "".join(
+                    "\t{}({})".format(kmer, ",".join(str(pos) for pos in positions))
+                    for kmer, positions in shared_breakpoint_kmers
+                )
+                ofh.write("#" + line + kmer_text + "\n")
+            else:
+                ofh.write(line + "\n")
+                print(line)  # unfiltered goes to stdout.
+
+            current_time = time.time()
+            if current_time - last_progress_time >= PROGRESS_INTERVAL:
+                logger.info(
+                    "  ... screened {} candidates, k-mer cache hits: {}, misses: {}".format(
+                        num_candidates, kmer_cache.num_hits, kmer_cache.num_misses
+                    )
+                )
+                last_progress_time = current_time
+
+    logger.info(
+        "-{} of {} candidates have confounding k-mers (k-mer cache hits: {}, misses: {})".format(
+            num_confounded, num_candidates, kmer_cache.num_hits, kmer_cache.num_misses
+        )
+    )
+
+    sys.exit(0)
+
+
+def parse_fasta_seqs(fasta_filename):
+
+    seqs = dict()
+    with pysam.FastxFile(fasta_filename) as fh:
+        for entry in fh:
+            seqs[entry.name] = entry.sequence
+
+    return seqs
+
+
+def group_kmer_positions(positions, kmers):
+    """
+    returns list of (kmer, [positions]) in order of first position
+    """
+
+    kmer_positions = dict()
+    for pos, kmer in zip(positions.tolist(), kmers.tolist()):
+        kmer_positions.setdefault(kmer, list()).append(pos)
+
+    return list(kmer_positions.items())
+
+
+class TransGeneKmerScreener:
+
+    def __init__(self, ref_cdna_fasta, kmer_size, anchor, kmer_cache):
+
+        self.kmer_size = kmer_size
+        self.anchor = anchor
+        self.kmer_cache = kmer_cache
+        self.gene_to_trans_list = self.parse_trans_to_gene_list(ref_cdna_fasta)
+        self.fasta_retriever = pysam.FastaFile(ref_cdna_fasta)
+
+    @staticmethod
+    def parse_trans_to_gene_list(ref_cdna_fasta):
+
+        gene_to_trans = dict()
+
+        with open(ref_cdna_fasta, "rt") as fh:
+            for line in fh:
+                if line.startswith(">"):
+                    header_vals = line[1:].split()
+                    trans_id, gene_id = header_vals[0], header_vals[1]
+                    gene_to_trans.setdefault(gene_id, list()).append(trans_id)
+                    if len(header_vals) > 2 and header_vals[2] != gene_id:
+                        gene_to_trans.setdefault(header_vals[2], list()).append(trans_id)
+
+        return gene_to_trans
+
+    def get_gene_kmer_set(self, gene):
+
+        def build_gene_kmer_set():
+            if gene not in self.gene_to_trans_list:
+                raise RuntimeError("Error, no list of transcript ids for gene: {}".format(gene))
+            trans_seqs = [self.fasta_retriever.fetch(trans_id) for trans_id in self.gene_to_trans_list[gene]]
+            return get_kmer_set(trans_seqs, self.kmer_size)
+
+        return self.kmer_cache.get(gene, build_gene_kmer_set)
+
+    def get_shared_breakpoint_kmers(self, fusion_trans_seq, fusion_pts):
+
+        geneA, trans_brk_left = fusion_pts[0], int(fusion_pts[2])
+        geneB, trans_brk_right = fusion_pts[4], int(fusion_pts[6])
+
+        gene_shared_kmers = get_shared_kmers(self.get_gene_kmer_set(geneA), self.get_gene_kmer_set(geneB))
+        if len(gene_shared_kmers) == 0:
+            return list()
+
+        ## see if the shared kmers occur near the breakpoint of the candidate fusion transcript
+        positions, kmers = encode_kmers(
+            fusion_trans_seq, self.kmer_size, trans_brk_left - self.anchor, trans_brk_right + self.anchor
+        )
+        is_shared = np.isin(kmers, gene_shared_kmers, assume_unique=False)
+
+        return [
+            (decode_kmer(kmer, self.kmer_size), kmer_positions)
+            for kmer, kmer_positions in group_kmer_positions(positions[is_shared], kmers[is_shared])
+        ]
+
+
+class GenomeBreakpointKmerScreener:
+
+    def __init__(self, genome_fa, kmer_size, window_size, kmer_cache):
+
+        self.kmer_size = kmer_size
+        self.window_size = window_size
+        self.kmer_cache = kmer_cache
+        self.genome = pysam.FastaFile(genome_fa)
+
+    def get_region_kmer_set(self, chr_brk_info):
+
+        chrom, brkpt = chr_brk_info.split(":")[0:2]
+        brkpt = int(brkpt)
+        left_coord = int(brkpt - self.window_size / 2)
+        right_coord = int(brkpt + self.window_size / 2)
+
+        def build_region_kmer_set():
+            # 1-based inclusive region, as per samtools faidx
+            seq = self.genome.fetch(chrom, max(left_coord - 1, 0), right_coord)
+            return get_kmer_set(seq, self.kmer_size, canonical=True)
+
+        return self.kmer_cache.get((chrom, left_coord, right_coord), build_region_kmer_set)
+
+    def get_shared_breakpoint_kmers(self, fusion_trans_seq, fusion_pts):
+
+        chr_brk_info_left = fusion_pts[3]
+        chr_brk_info_right = fusion_pts[7]
+
+        region_shared_kmers = get_shared_kmers(
+            self.get_region_kmer_set(chr_brk_info_left), self.get_region_kmer_set(chr_brk_info_right)
+        )
+        if len(region_shared_kmers) == 0:
+            return list()
+
+        positions, kmers = encode_kmers(fusion_trans_seq, self.kmer_size)
+        is_shared = np.isin(canonical_kmers(kmers, self.kmer_size), region_shared_kmers)
+        positions, kmers = positions[is_shared], kmers[is_shared]
+
+        # each shared k-mer is reported in both orientations, with the positions of either
+        rc_kmers = reverse_complement_kmers(kmers, self.kmer_size)
+        kmer_positions = dict()
+        for kmer, rc_kmer, pos in zip(kmers.tolist(), rc_kmers.tolist(), positions.tolist()):
+            for oriented_kmer in sorted({kmer, rc_kmer}):
+                kmer_positions.setdefault(oriented_kmer, list()).append(pos)
+
+        return [
+            (decode_kmer(kmer, self.kmer_size), oriented_kmer_positions)
+            for kmer, oriented_kmer_positions in kmer_positions.items()
+        ]
+
+
+if __name__ == "__main__":
+    main()
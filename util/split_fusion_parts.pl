@@ -77,7 +77,8 @@ main: {
     ## run MM2, capture all top hits within reason.
     my $mm2_output_prefix = "$chim_frag_file.mm2";
     my $cmd = "minimap2 -ax splice --junc-bed $MM2_splice_file -O6,24 -B4 -L -t $CPU -cs -ub -G $max_intron_length $MM2_idx $chim_frag_file > $mm2_output_prefix.sam";
-    $pipeliner->add_commands(new Command($cmd, "mm2_chim_frags.ok"));
+    $pipeliner->add_commands(new Command($cmd, "mm2_chim_frags.ok")
+                             ->set_num_threads($CPU) );
     
     $cmd = "$UTILDIR/SAM_to_gff3.minimap2.pl  $mm2_output_prefix.sam >  $mm2_output_prefix.gff3";
     $pipeliner->add_commands(new Command($cmd, "mm2_chim_frags_gff3.ok"));
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+
+import sys, os, re
+import glob
+import logging
+import argparse
+import itertools
+import numpy as np
+import pandas as pd
+
+from filter_LR_fusions import read_fusion_preds, get_evidence_abundance_support
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s : %(levelname)s : %(message)s",
+    datefmt="%H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+## Re-filters the cached phase-2 results of completed ctat-LR-fusion runs under a grid of threshold
+## settings, without re-running anything: each sample's pre-filter fusion table (the input to
+## filter_LR_fusions.py) and phase-1 candidate read counts are loaded once, and all settings are
+## evaluated together as (fusions x settings) boolean matrices, for all samples at once.
+##
+## Per setting, as per ctat-LR-fusion:
+##    phase 1:   phase-1 read count >= min_num_LR and phase-1 FFPM >= min_FFPM * frac_FFPM_phase1
+##               (as per identify_prelim_fusion_transcript_candidates.pl)
+##    abundance: the evidence abundance criteria of filter_LR_fusions_by_evidence_abundance.py
+##               (min_LR_novel_junction_support is raised to min_num_LR, as ctat-LR-fusion does)
+##    dom iso:   the dominant isoform fraction of filter_low_pct_dom_iso.py, among the breakpoints passing
+##
+## Settings less stringent in phase 1 than the original runs can't recover candidates those runs never
+## pursued in phase 2, so sweep from the run's settings upward.
+##
+## Writes:
+##    <output_prefix>.settings.tsv            settings and the number of fusions passing per sample
+##    <output_prefix>.fusion_pass_matrix.tsv  sample, fusion, and 0/1 per setting, for fusions passing any setting
+
+
+INTERMEDIATES_DIR = "fusion_intermediates_dir"
+PRE_FILTER_TABLE_SUFFIX = ".post_blast_and_promiscuity_filter"
+PRELIM_REPORT = "ctat-LR-fusion.fusion_predictions.preliminary.tsv"
+PHASE1_CANDIDATES_TABLE = "chimeric_read_candidates.preliminary_candidates_info_from_chims_described"
+READ_COUNT_SUFFIX = ".LR_read_count"
+
+SWEEP_PARAMS = [
+    ("min_FFPM", float),
+    ("frac_FFPM_phase1", float),
+    ("min_num_LR", int),
+    ("min_LR_novel_junction_support", int),
+]
+
+SETTINGS_CHUNK_SIZE = 256  # settings evaluated per pass, bounds the matrix memory
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="evaluate a grid of fusion filtering thresholds over completed ctat-LR-fusion runs",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument(
+        "--sample_dirs", type=str, nargs="+", required=True, help="ctat-LR-fusion output directories, one per sample"
+    )
+    parser.add_argument("--output_prefix", type=str, required=True, help="prefix for the output files")
+
+    # swept, as comma-delimited lists of values
+    parser.add_argument("--min_FFPM", type=str, default="0.1", help="min FFPM values")
+    parser.add_argument("--frac_FFPM_phase1", type=str, default="0.6", help="fractions of min_FFPM for phase 1")
+    parser.add_argument("--min_num_LR", type=str, default="1", help="min num long reads values")
+    parser.add_argument(
+        "--min_LR_novel_junction_support", type=str, default="2", help="min num long reads at non-canonical splice values"
+    )
+
+    # fixed
+    parser.add_argument("--min_J", type=int, default=1, help="min number of Illumina junction reads with canonical splice breakpoints")
+    parser.add_argument("--min_sumJS", type=int, default=1, help="min number of Illumina reads supporting junction and spanning frags summed")
+    parser.add_argument("--min_novel_junction_support", type=int, default=1, help="min number of junction reads with non-canonical splice support")
+    parser.add_argument("--min_frac_dom_iso", type=float, default=0.05, help="min fraction expression of dominant fusion isoform (0 disables this filter)")
+
+    args = parser.parse_args()
+
+    settings = build_settings_grid(
+        {param: parse_value_list(getattr(args, param), value_type) for param, value_type in SWEEP_PARAMS}
+    )
+    logger.info("-sweeping {} threshold settings".format(settings.shape[0]))
+
+    data = pd.concat([load_sample(sample_dir) for sample_dir in args.sample_dirs], ignore_index=True)
+    sample_names = list(dict.fromkeys(data["sample"]))
+    if len(sample_names) != len(args.sample_dirs):
+        raise RuntimeError("Error, sample directory names must be unique: {}".format(args.sample_dirs))
+    logger.info("-loaded {} fusion breakpoints across {} samples".format(data.shape[0], len(sample_names)))
+
+    grouping = data.groupby(["sample", "#FusionName"], sort=True)
+    group_codes = grouping.ngroup().to_numpy()
+    fusion_keys = grouping.size().index
+
+    fusion_passing = np.zeros((len(fusion_keys), settings.shape[0]), dtype=bool)
+    for chunk_start in range(0, settings.shape[0], SETTINGS_CHUNK_SIZE):
+        chunk_settings = settings.iloc[chunk_start : chunk_start + SETTINGS_CHUNK_SIZE]
+        passing = get_breakpoints_passing(data, chunk_settings, args, group_codes)
+        fusion_passing[:, chunk_start : chunk_start + chunk_settings.shape[0]] = reduce_by_group(
+            passing, group_codes, np.logical_or
+        )
+
+    write_settings_summary(settings, fusion_keys, fusion_passing, sample_names, args.output_prefix + ".settings.tsv")
+    write_fusion_pass_matrix(settings, fusion_keys, fusion_passing, args.output_prefix + ".fusion_pass_matrix.tsv")
+
+    logger.info("-done")
+
+    sys.exit(0)
+
+
+def parse_value_list(values_text, value_type):
+
+    return sorted({value_type(value) for value in values_text.split(",") if value.strip()})
+
+
+def build_settings_grid(param_values):
+
+    params = [param for param, value_type in SWEEP_PARAMS]
+    settings = pd.DataFrame(
+        list(itertools.product(*[param_values[param] for param in params])), columns=params
+    )
+
+    # as per ctat-LR-fusion, silly to allow a smaller threshold for novel breakpoints
+    settings["min_LR_novel_junction_support"] = np.maximum(
+        settings["min_LR_novel_junction_support"], settings["min_num_LR"]
+    )
+    settings = settings.drop_duplicates(ignore_index=True)
+
+    settings.insert(0, "setting_id", ["S{}".format(i + 1) for i in range(settings.shape[0])])
+
+    return settings
+
+
+def load_sample(sample_dir):
+    """
+    returns the sample's pre-filter fusion table, with its phase-1 read counts and total read count
+    """
+
+    sample_name = os.path.basename(os.path.normpath(sample_dir))
+    intermediates_dir = os.path.join(sample_dir, INTERMEDIATES_DIR)
+
+    # the input to the final filtering, or lacking it, the preliminary report
+    pre_filter_tables = glob.glob(os.path.join(intermediates_dir, "*" + PRE_FILTER_TABLE_SUFFIX))
+    if pre_filter_tables:
+        fusions_table = max(pre_filter_tables, key=os.path.getmtime)
+    else:
+        fusions_table = os.path.join(sample_dir, PRELIM_REPORT)
+        if not os.path.exists(fusions_table):
+            raise RuntimeError("Error, no phase-2 fusion table found for sample {}".format(sample_dir))
+        logger.warning(
+            "-{}: using {}, which precedes the blast and promiscuity filtering".format(sample_name, fusions_table)
+        )
+
+    logger.info("-{}: loading {}".format(sample_name, fusions_table))
+    data = read_fusion_preds(fusions_table)
+    data.insert(0, "sample", sample_name)
+
+    data["num_total_reads"] = get_num_total_reads(sample_dir, sample_name, data)
+
+    phase1_candidates_table = os.path.join(intermediates_dir, PHASE1_CANDIDATES_TABLE)
+    if os.path.exists(phase1_candidates_table):
+        phase1_num_reads = pd.read_csv(phase1_candidates_table, sep="\t", usecols=["#FusionName", "num_reads"])
+        phase1_num_reads = phase1_num_reads.set_index("#FusionName")["num_reads"]
+        data["phase1_num_reads"] = data["#FusionName"].map(phase1_num_reads)
+        num_missing = data["phase1_num_reads"].isna().sum()
+        if num_missing:
+            logger.warning(
+                "-{}: {} fusion breakpoints lack phase-1 candidates, phase-1 thresholds not applied to them".format(
+                    sample_name, num_missing
+                )
+            )
+    else:
+        logger.warning("-{}: no {}, phase-1 thresholds not applied".format(sample_name, phase1_candidates_table))
+        data["phase1_num_reads"] = np.nan
+
+    data["phase1_num_reads"] = data["phase1_num_reads"].fillna(np.inf)
+
+    return data
+
+
+def get_num_total_reads(sample_dir, sample_name, data):
+
+    read_count_files = glob.glob(os.path.join(sample_dir, "*" + READ_COUNT_SUFFIX))
+    if read_count_files:
+        with open(read_count_files[0], "rt") as fh:
+            return int(fh.readline().strip())
+
+    # ie. run with --num_total_reads: recover it from LR_FFPM = num_LR / num_total_reads * 1e6
+    has_FFPM = (data["num_LR"] > 0) & (data["LR_FFPM"] > 0)
+    if not has_FFPM.any():
+        raise RuntimeError("Error, cannot determine the total read count for sample {}".format(sample_dir))
+
+    num_total_reads = int(round((data["num_LR"][has_FFPM] / data["LR_FFPM"][has_FFPM] * 1e6).median()))
+    logger.warning("-{}: no read count file, estimated {} total reads from LR_FFPM".format(sample_name, num_total_reads))
+
+    return num_total_reads
+
+
+def get_breakpoints_passing(data, settings, args, group_codes):
+    """
+    returns boolean matrix (fusion breakpoints x settings) of the breakpoints passing each setting
+    """
+
+    def as_column(values):
+        return np.asarray(values)[:, np.newaxis]
+
+    min_FFPM = settings["min_FFPM"].to_numpy()
+    min_num_LR = settings["min_num_LR"].to_numpy()
+
+    # phase 1
+    phase1_num_reads = as_column(data["phase1_num_reads"])
+    phase1_FFPM = phase1_num_reads / as_column(data["num_total_reads"]) * 1e6
+    passing = (phase1_FFPM >= min_FFPM * settings["frac_FFPM_phase1"].to_numpy()) & (phase1_num_reads >= min_num_LR)
+
+    # evidence abundance
+    # read counts are NA (NaN here) for fusions lacking long read or FusionInspector support in merged
+    # tables (see merge_mm2fusion_FI.py), or for samples run without short reads, and compare as False
+    columns = {
+        column: as_column(data[column].to_numpy(dtype=float, na_value=np.nan))
+        for column in ["num_LR", "LR_FFPM", "JunctionReadCount", "SpanningFragCount", "FFPM"]
+        if column in data.columns
+    }
+    columns["SpliceType"] = as_column(data["SpliceType"])
+    passing &= get_evidence_abundance_support(
+        columns,
+        min_num_LR=min_num_LR,
+        min_LR_novel_junction_support=settings["min_LR_novel_junction_support"].to_numpy(),
+        min_J=args.min_J,
+        min_sumJS=args.min_sumJS,
+        min_novel_junction_support=args.min_novel_junction_support,
+        min_FFPM=min_FFPM,
+    )
+
+    # dominant isoform fraction, among the breakpoints of each fusion passing the above
+    if args.min_frac_dom_iso > 0:
+        LR_FFPM = columns["LR_FFPM"]
+        passing_LR_FFPM = np.where(passing, LR_FFPM, -np.inf)
+        # fmax skips the NaN of breakpoints lacking long reads, as the pandas groupby max does
+        max_LR_FFPM = reduce_by_group(passing_LR_FFPM, group_codes, np.fmax)[group_codes]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            above_frac_dom_iso = LR_FFPM / max_LR_FFPM >= args.min_frac_dom_iso
+        if "FFPM" in columns:
+            # retain any with Illumina read support
+            above_frac_dom_iso |= columns["FFPM"] > 0
+        passing &= above_frac_dom_iso
+
+    return passing
+
+
+def reduce_by_group(values, group_codes, ufunc):
+    """
+    returns the rows of values reduced per group, in group code order
+    """
+
+    if len(group_codes) == 0:
+        return values[:0]
+
+    order = np.argsort(group_codes, kind="stable")
+    sorted_codes = group_codes[order]
+    group_starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+
+    return ufunc.reduceat(values[order], group_starts, axis=0)
+
+
+def write_settings_summary(settings, fusion_keys, fusion_passing, sample_names, output_filename):
+
+    summary = settings.copy()
+
+    fusion_samples = fusion_keys.get_level_values("sample")
+    for sample_name in sample_names:
+        summary[sample_name] = fusion_passing[fusion_samples == sample_name].sum(axis=0)
+    summary["total"] = fusion_passing.sum(axis=0)
+
+    summary.to_csv(output_filename, sep="\t", index=False)
+    logger.info("-wrote {}".format(output_filename))
+
+
+def write_fusion_pass_matrix(settings, fusion_keys, fusion_passing, output_filename):
+
+    passes_any = fusion_passing.any(axis=1)
+
+    matrix = pd.DataFrame(
+        fusion_passing[passes_any].astype(np.uint8), columns=settings["setting_id"].tolist()
+    )
+    matrix.insert(0, "sample", fusion_keys.get_level_values("sample")[passes_any])
+    matrix.insert(1, "#FusionName", fusion_keys.get_level_values("#FusionName")[passes_any])
+
+    matrix.to_csv(output_filename, sep="\t", index=False)
+    logger.info("-wrote {}: {} fusions passing any setting".format(output_filename, matrix.shape[0]))
+
+
+if __name__ == "__main__":
+    main()